@@ -0,0 +1,113 @@
+"""
+Benchmark: per-image overhead of the multi-core BatchPipelineRunner.
+
+Compares the legacy behaviour, where every row rebuilds the whole PipelineRunner
+(and thus reloads every model), with the persistent worker pool, where every
+worker process builds its PipelineRunner once and pulls rows in chunks.
+
+Run the script as:
+`python batch_pipeline_runner.py --cores 4 --repeats 8`
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from glob import glob
+
+import pandas as pd
+import yaml
+
+from histocartography import BatchPipelineRunner
+from histocartography.utils import download_example_data
+
+
+CONFIG = {
+    "inputs": ["image_path"],
+    "outputs": ["features"],
+    "stages": [
+        {
+            "preprocessing": {
+                "class": "ImageLoader",
+                "inputs": ["image_path"],
+                "outputs": ["image"],
+            }
+        },
+        {
+            "preprocessing": {
+                "class": "GridDeepFeatureExtractor",
+                "inputs": ["image"],
+                "outputs": ["features"],
+                "params": {
+                    "architecture": "mobilenet_v2",
+                    "patch_size": 224,
+                    "downsample_factor": 4,
+                },
+            }
+        },
+    ],
+}
+
+
+def _legacy_task(args):
+    """Emulates the previous worker task: one PipelineRunner per row."""
+    runner, (name, row) = args
+    pipeline = runner._build_pipeline_runner()
+    pipeline.run(output_name=name, **row)
+
+
+def run_legacy(runner, metadata, cores):
+    runner.precompute()
+    with multiprocessing.Pool(cores) as worker_pool:
+        for _ in worker_pool.imap_unordered(
+            _legacy_task, [(runner, row) for row in metadata.iterrows()]
+        ):
+            pass
+
+
+def run_persistent(runner, metadata, cores):
+    runner.run(metadata=metadata, cores=cores)
+
+
+def benchmark(config, image_paths, cores, repeats):
+    names = []
+    paths = []
+    for i in range(repeats):
+        for path in image_paths:
+            names.append(f"{os.path.basename(path)}_{i}")
+            paths.append(path)
+    metadata = pd.DataFrame({"image_path": paths}, index=names)
+
+    for mode, run_fn in [("legacy", run_legacy), ("persistent", run_persistent)]:
+        output_path = tempfile.mkdtemp()
+        runner = BatchPipelineRunner(pipeline_config=config, save_path=output_path)
+        start = time.perf_counter()
+        run_fn(runner, metadata, cores)
+        elapsed = time.perf_counter() - start
+        shutil.rmtree(output_path)
+        print(
+            f"{mode:>10}: {elapsed:8.2f}s total, "
+            f"{elapsed / len(metadata) * 1000:8.1f}ms per image "
+            f"({len(metadata)} images, {cores} cores)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", type=str, default=None,
+                        help="Pipeline config (yml). Defaults to a deep feature extraction pipeline.")
+    parser.add_argument("--cores", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=8,
+                        help="Number of times each example image is processed.")
+    args = parser.parse_args()
+
+    config = CONFIG
+    if args.config is not None:
+        with open(args.config, "r") as file:
+            config = yaml.safe_load(file)
+
+    download_example_data("output")
+    image_paths = sorted(glob(os.path.join("output", "images", "*.png")))
+    benchmark(config, image_paths, cores=args.cores, repeats=args.repeats)
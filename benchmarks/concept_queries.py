@@ -0,0 +1,79 @@
+"""
+Benchmark: nuclei concept queries.
+
+Measures the time NucleiConceptExtractor takes for different lists of concepts, which only
+run the computations the concepts need (the moments for area and eccentricity, the borders for
+the perimeter, the convex hulls for the solidity, the GLCMs for the texture, the nearest
+neighbours for the crowdedness), compared to all 24 concepts. The instance map holds the SLIC
+superpixels of a tiling of an input image.
+
+Run the script as:
+`python concept_queries.py --image ../test/data/images/283_dcis_4.png --tiles 2 --instance-size 150`
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+from skimage.segmentation import slic
+
+from histocartography.preprocessing import NucleiConceptExtractor
+
+QUERIES = [
+    None,
+    "area,eccentricity",
+    "major_axis_length,minor_axis_length,orientation",
+    "perimeter,roundness",
+    "solidity,convex_area",
+    "glcm_contrast,glcm_homogeneity",
+    "glcm_energy,glcm_dispersion",
+    "mean_crowdedness,std_crowdedness",
+]
+
+
+def benchmark(image, instance_map, repeats):
+    results = []
+    for concept_names in QUERIES:
+        extractor = NucleiConceptExtractor(concept_names=concept_names)
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            concepts = extractor.process(image, instance_map)
+            times.append(time.perf_counter() - start)
+        results.append(
+            {
+                "concepts": "all" if concept_names is None else concept_names,
+                "instances": concepts.shape[0],
+                "time [s]": np.median(times),
+            }
+        )
+    results = pd.DataFrame(results)
+    results["speedup"] = results["time [s]"][0] / results["time [s]"]
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image", type=str, required=True)
+    parser.add_argument("--tiles", type=int, default=2)
+    parser.add_argument("--instance-size", type=int, default=150)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    image = np.tile(
+        np.array(Image.open(args.image).convert("RGB")), (args.tiles, args.tiles, 1)
+    )
+    instance_map = slic(
+        image,
+        n_segments=image.shape[0] * image.shape[1] // args.instance_size,
+        compactness=20,
+        start_label=1,
+    )
+    with pd.option_context("display.float_format", "{:.3f}".format):
+        print(
+            benchmark(
+                image=image, instance_map=instance_map, repeats=args.repeats
+            ).to_string(index=False)
+        )
@@ -0,0 +1,142 @@
+"""
+Benchmark: handcrafted features of the instances of an instance map.
+
+Compares the features computed region by region (regionprops, findContours + convexHull and
+greycomatrix + greycoprops per region, like HandcraftedFeatureExtractor used to) to the ones
+of all the instances at once (histocartography.preprocessing.instance_features), serially
+and split into spatial chunks on a thread or process pool with 2, 4, ... workers. The
+instance map holds the SLIC superpixels of a tiling of an input image. The crowdedness features
+are the same in both and not measured.
+
+Run the script as:
+`python handcrafted_features.py --image ../test/data/images/283_dcis_4.png --tiles 2 --instance-size 150 --n-jobs 1 2 4`
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+import pandas as pd
+from PIL import Image
+from skimage.feature import greycomatrix, greycoprops
+from skimage.measure import regionprops
+from skimage.segmentation import slic
+
+from histocartography.preprocessing.instance_features import instance_features
+
+SHAPE_PROPERTIES = [
+    "area",
+    "convex_area",
+    "eccentricity",
+    "equivalent_diameter",
+    "euler_number",
+    "extent",
+    "filled_area",
+    "major_axis_length",
+    "minor_axis_length",
+    "orientation",
+    "perimeter",
+    "solidity",
+]
+GLCM_PROPERTIES = ["contrast", "dissimilarity", "homogeneity", "energy", "ASM"]
+
+
+def per_region(gray, instance_map):
+    features = []
+    for region in regionprops(instance_map):
+        min_row, min_col, max_row, max_col = region.bbox
+        mask = region.image
+        contours, _ = cv2.findContours(
+            np.uint8(mask), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE
+        )
+        hull_perimeter = cv2.arcLength(cv2.convexHull(contours[0]), True)
+        area, perimeter = region.area, np.float64(region.perimeter)
+        glcm = greycomatrix(gray[min_row:max_row, min_col:max_col] * mask, [1], [0])
+        glcm = glcm[1:, 1:]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            features.append(
+                [region[name] for name in SHAPE_PROPERTIES]
+                + [
+                    hull_perimeter / perimeter,
+                    4 * np.pi * area / np.float64(hull_perimeter) ** 2,
+                    np.float64(region.minor_axis_length) / region.major_axis_length,
+                    4 * np.pi * area / perimeter ** 2,
+                ]
+                + [greycoprops(glcm, name)[0, 0] for name in GLCM_PROPERTIES]
+                + [np.std(glcm)]
+            )
+    return np.array(features, dtype=np.float64)
+
+
+def all_at_once(n_jobs, executor):
+    def extract(gray, instance_map):
+        return instance_features(gray, instance_map, n_jobs=n_jobs, executor=executor)
+
+    return extract
+
+
+def benchmark(image, instance_map, n_jobs, repeats):
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    methods = [("per region", per_region)]
+    for jobs in n_jobs:
+        if jobs == 1:
+            methods.append(("all at once", all_at_once(1, "thread")))
+        else:
+            for executor, workers in [("thread", "threads"), ("process", "processes")]:
+                methods.append((f"{jobs} {workers}", all_at_once(jobs, executor)))
+    results = []
+    reference = None
+    for name, extract in methods:
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            features = extract(gray, instance_map)
+            times.append(time.perf_counter() - start)
+        if reference is None:
+            reference = features
+        # orientations of -pi/2 and pi/2 are the same
+        orientation = SHAPE_PROPERTIES.index("orientation")
+        difference = np.abs(features - reference) / np.maximum(np.abs(reference), 1)
+        difference[:, orientation] = np.abs(
+            np.cos(2 * features[:, orientation]) - np.cos(2 * reference[:, orientation])
+        )
+        results.append(
+            {
+                "features": name,
+                "instances": features.shape[0],
+                "time [s]": np.median(times),
+                "instances / s": features.shape[0] / np.median(times),
+                "max rel. difference": np.nanmax(difference),
+            }
+        )
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image", type=str, required=True)
+    parser.add_argument("--tiles", type=int, default=2)
+    parser.add_argument("--instance-size", type=int, default=150)
+    parser.add_argument("--n-jobs", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    image = np.tile(
+        np.array(Image.open(args.image).convert("RGB")), (args.tiles, args.tiles, 1)
+    )
+    instance_map = slic(
+        image,
+        n_segments=image.shape[0] * image.shape[1] // args.instance_size,
+        compactness=20,
+        start_label=1,
+    )
+    with pd.option_context("display.float_format", "{:.4g}".format):
+        print(
+            benchmark(
+                image=image,
+                instance_map=instance_map,
+                n_jobs=args.n_jobs,
+                repeats=args.repeats,
+            ).to_string(index=False)
+        )
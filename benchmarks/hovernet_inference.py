@@ -0,0 +1,79 @@
+"""
+Benchmark: inference modes of the HoverNet nuclei extraction on the CPU.
+
+Extracts the nuclei of an image with NucleiExtractor in every inference mode (float32,
+bfloat16 autocast, channels-last and int8 quantized conv blocks) and compares the instance
+maps of the other modes to the float32 one with the Dice score of the nuclei pixels.
+The int8 model is calibrated on the image itself before the timing.
+
+Run the script as:
+`python hovernet_inference.py --image ../test/data/images/283_dcis_4.png --repeats 3`
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+from PIL import Image
+
+from histocartography.ml.inference import INFERENCE_MODES
+from histocartography.preprocessing import NucleiExtractor
+
+
+def dice(prediction, reference):
+    prediction, reference = prediction > 0, reference > 0
+    return 2 * np.sum(prediction & reference) / (np.sum(prediction) + np.sum(reference))
+
+
+def benchmark(image, pretrained_data, batch_size, repeats):
+    results = []
+    reference = None
+    for inference_mode in INFERENCE_MODES:
+        extractor = NucleiExtractor(
+            pretrained_data=pretrained_data,
+            batch_size=batch_size,
+            inference_mode=inference_mode,
+        )
+        if inference_mode == "int8":
+            extractor.calibrate([image])
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            instance_map, instance_centroids = extractor.process(image)
+            times.append(time.perf_counter() - start)
+        if reference is None:
+            reference, reference_time = instance_map, np.median(times)
+        results.append(
+            {
+                "mode": inference_mode,
+                "time [s]": np.median(times),
+                "speedup": reference_time / np.median(times),
+                "nuclei": len(instance_centroids),
+                "dice": dice(instance_map, reference),
+            }
+        )
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image", type=str, required=True)
+    parser.add_argument("--pretrained-data", type=str, default="pannuke")
+    parser.add_argument("--batch-size", type=int, default=2)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    with pd.option_context("display.float_format", "{:.3f}".format):
+        print(
+            benchmark(
+                image=np.array(Image.open(args.image).convert("RGB")),
+                pretrained_data=args.pretrained_data,
+                batch_size=args.batch_size,
+                repeats=args.repeats,
+            ).to_string(index=False)
+        )
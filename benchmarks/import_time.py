@@ -0,0 +1,82 @@
+"""
+Benchmark: import time of histocartography and of its subpackages and steps.
+
+Every import statement runs in a fresh interpreter, such that nothing is cached,
+and the heavy dependencies that it pulled in are reported.
+
+Run the script as:
+`python import_time.py --repeats 5`
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+
+
+STATEMENTS = [
+    "import histocartography",
+    "import histocartography.preprocessing",
+    "from histocartography.preprocessing import ImageLoader",
+    "from histocartography.preprocessing import GaussianTissueMask",
+    "from histocartography.preprocessing import SLICSuperpixelExtractor",
+    "from histocartography.preprocessing import NucleiExtractor",
+    "from histocartography.preprocessing import DeepFeatureExtractor",
+    "import histocartography.ml",
+    "from histocartography.ml import CellGraphModel",
+    "import histocartography.interpretability",
+    "import histocartography.visualization",
+]
+
+HEAVY_MODULES = ["torch", "torchvision", "dgl", "cv2", "skimage", "sklearn"]
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+duration = time.perf_counter() - start
+print(json.dumps({{
+    "time": duration,
+    "heavy": [m for m in {heavy_modules!r} if m in sys.modules],
+}}))
+"""
+
+
+def time_import(statement):
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(statement=statement, heavy_modules=HEAVY_MODULES)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def benchmark(repeats):
+    results = []
+    for statement in STATEMENTS:
+        # the first import warms up the file system cache
+        time_import(statement)
+        measurements = [time_import(statement) for _ in range(repeats)]
+        times = [measurement["time"] for measurement in measurements]
+        results.append(
+            {
+                "statement": statement,
+                "median [s]": np.median(times),
+                "min [s]": np.min(times),
+                "heavy modules": ", ".join(measurements[-1]["heavy"]),
+            }
+        )
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    with pd.option_context("display.float_format", "{:.3f}".format, "display.max_colwidth", 80):
+        print(benchmark(repeats=args.repeats).to_string(index=False))
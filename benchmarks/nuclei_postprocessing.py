@@ -0,0 +1,110 @@
+"""
+Benchmark: serial vs. tiled post-processing of the HoverNet predictions.
+
+Builds a synthetic prediction map (probability, X- and Y-maps of round nuclei, like the
+output of HoverNet) and post-processes it with process_instance and with
+process_instance_tiled for several numbers of worker processes. The tiled instance maps
+are compared to the serial one with the adapted Rand error (0 means identical).
+
+Run the script as:
+`python nuclei_postprocessing.py --size 4096 --nuclei 20000 --workers 1 2 4 8`
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from skimage.metrics import adapted_rand_error
+
+from histocartography.preprocessing.nuclei_extraction import (
+    process_instance,
+    process_instance_tiled,
+)
+
+
+def synthetic_pred_map(size, nr_nuclei, radius=8, seed=0):
+    rng = np.random.default_rng(seed)
+    pred_map = np.zeros((size, size, 3), dtype=np.float32)
+    owner_distance = np.full((size, size), np.inf, dtype=np.float32)
+    for center_y, center_x in rng.uniform(0, size, (nr_nuclei, 2)):
+        nucleus_radius = rng.uniform(0.7, 1.3) * radius
+        top, left = int(max(center_y - nucleus_radius, 0)), int(max(center_x - nucleus_radius, 0))
+        bottom = int(min(center_y + nucleus_radius + 1, size))
+        right = int(min(center_x + nucleus_radius + 1, size))
+        rows, cols = np.mgrid[top:bottom, left:right]
+        dy, dx = rows - center_y, cols - center_x
+        distance = np.sqrt(dx ** 2 + dy ** 2)
+        # touching nuclei are split where they are closest to their centers
+        inside = (distance <= nucleus_radius) & (distance < owner_distance[top:bottom, left:right])
+        owner_distance[top:bottom, left:right][inside] = distance[inside]
+        window = pred_map[top:bottom, left:right]
+        window[inside] = np.stack(
+            [np.ones_like(dx), dx / nucleus_radius, dy / nucleus_radius], axis=-1
+        )[inside]
+    return pred_map
+
+
+def time_call(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = function()
+        times.append(time.perf_counter() - start)
+    return output, np.median(times)
+
+
+def benchmark(size, nr_nuclei, tile_size, workers, repeats):
+    pred_map = synthetic_pred_map(size, nr_nuclei)
+    serial, serial_time = time_call(lambda: process_instance(pred_map), repeats)
+    results = [
+        {
+            "mode": "serial",
+            "workers": 1,
+            "time [s]": serial_time,
+            "speedup": 1.0,
+            "nuclei": len(np.unique(serial)) - 1,
+            "rand error": 0.0,
+        }
+    ]
+    for nr_workers in workers:
+        tiled, tiled_time = time_call(
+            lambda: process_instance_tiled(
+                pred_map, tile_size=tile_size, num_workers=nr_workers
+            ),
+            repeats,
+        )
+        results.append(
+            {
+                "mode": f"tiled ({tile_size})",
+                "workers": nr_workers,
+                "time [s]": tiled_time,
+                "speedup": serial_time / tiled_time,
+                "nuclei": len(np.unique(tiled)) - 1,
+                "rand error": adapted_rand_error(
+                    serial.astype(np.int64), tiled.astype(np.int64)
+                )[0],
+            }
+        )
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=4096)
+    parser.add_argument("--nuclei", type=int, default=20000)
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    with pd.option_context("display.float_format", "{:.3f}".format):
+        print(
+            benchmark(
+                size=args.size,
+                nr_nuclei=args.nuclei,
+                tile_size=args.tile_size,
+                workers=args.workers,
+                repeats=args.repeats,
+            ).to_string(index=False)
+        )
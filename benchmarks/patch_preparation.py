@@ -0,0 +1,93 @@
+"""
+Benchmark: preparation of the HoverNet patches of an image.
+
+Compares the per-patch preparation (a list of windows, each converted to a PIL image and
+back to a tensor with transforms.ToTensor) to the batched one of ImageToPatchDataset (strided
+views of the padded image, converted by batch with patches_to_tensor). The image is a tiling
+of an input image, or random noise.
+
+Run the script as:
+`python patch_preparation.py --image ../test/data/images/283_dcis_4.png --tiles 4 --batch-size 16`
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from histocartography.preprocessing.batching import iter_patch_batches
+from histocartography.preprocessing.nuclei_extraction import (
+    ImageToPatchDataset,
+    patches_to_tensor,
+)
+from histocartography.utils.image import extract_patches_from_image
+
+
+def per_patch(image, batch_size):
+    patches, _ = extract_patches_from_image(image, image.shape[0], image.shape[1])
+    to_tensor = transforms.ToTensor()
+    nr_patches = 0
+    for start in range(0, len(patches), batch_size):
+        batch = torch.stack(
+            [to_tensor(Image.fromarray(patch)) for patch in patches[start: start + batch_size]]
+        )
+        nr_patches += batch.shape[0]
+    return nr_patches
+
+
+def batched(image, batch_size):
+    dataset = ImageToPatchDataset(image)
+    nr_patches = 0
+    for _, _, batch in iter_patch_batches(
+        [dataset], batch_size, batch_transform=patches_to_tensor
+    ):
+        nr_patches += batch.shape[0]
+    return nr_patches
+
+
+def benchmark(image, batch_size, repeats):
+    results = []
+    for name, prepare in [("per patch (PIL)", per_patch), ("batched views", batched)]:
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            nr_patches = prepare(image, batch_size)
+            times.append(time.perf_counter() - start)
+        results.append(
+            {
+                "preparation": name,
+                "patches": nr_patches,
+                "time [s]": np.median(times),
+                "patches / s": nr_patches / np.median(times),
+            }
+        )
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image", type=str, default=None)
+    parser.add_argument("--size", type=int, default=4096)
+    parser.add_argument("--tiles", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.image is None:
+        image = np.random.default_rng(0).integers(
+            0, 256, (args.size, args.size, 3), dtype=np.uint8
+        )
+    else:
+        image = np.tile(
+            np.array(Image.open(args.image).convert("RGB")), (args.tiles, args.tiles, 1)
+        )
+    with pd.option_context("display.float_format", "{:.3f}".format):
+        print(
+            benchmark(
+                image=image, batch_size=args.batch_size, repeats=args.repeats
+            ).to_string(index=False)
+        )
@@ -0,0 +1,121 @@
+"""
+Benchmark: write/read throughput and file size of the storage codecs of PipelineStep.
+
+Extracts real instance maps (SLIC superpixels) and handcrafted features from the
+example images, or uses the datasets of existing h5 outputs, and stores them with
+every storage codec.
+
+Run the script as:
+`python storage_codecs.py --repeats 3`
+or, on outputs of a pipeline:
+`python storage_codecs.py --h5 output/nuclei_maps/*.h5`
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from glob import glob
+
+import h5py
+import numpy as np
+import pandas as pd
+import torch
+
+from histocartography.preprocessing import (
+    HandcraftedFeatureExtractor,
+    ImageLoader,
+    SLICSuperpixelExtractor,
+)
+from histocartography.storage import StorageCodec
+from histocartography.utils import download_example_data
+
+
+CODECS = [
+    {"codec": "none"},
+    {"codec": "lzf"},
+    {"codec": "shuffle"},
+    {"codec": "gzip", "level": 1},
+    {"codec": "gzip", "level": 4},
+    {"codec": "gzip", "level": 9},
+]
+
+
+def load_arrays_from_images(image_paths):
+    loader = ImageLoader()
+    superpixel_extractor = SLICSuperpixelExtractor(nr_superpixels=2000)
+    feature_extractor = HandcraftedFeatureExtractor()
+    arrays = {"instance_map": [], "features": []}
+    for image_path in image_paths:
+        image = loader.process(image_path)
+        instance_map = superpixel_extractor.process(image)
+        features = feature_extractor.process(image, instance_map)
+        arrays["instance_map"].append(instance_map)
+        arrays["features"].append(
+            features.numpy() if isinstance(features, torch.Tensor) else features
+        )
+    return arrays
+
+
+def load_arrays_from_h5(h5_paths):
+    arrays = {}
+    for h5_path in h5_paths:
+        with h5py.File(h5_path, "r") as input_file:
+            for key in input_file.keys():
+                arrays.setdefault(key, []).append(input_file[key][()])
+    return arrays
+
+
+def benchmark(arrays, repeats):
+    out_dir = tempfile.mkdtemp()
+    results = []
+    for kind, datas in arrays.items():
+        nr_bytes = sum(data.nbytes for data in datas)
+        for codec_config in CODECS:
+            codec = StorageCodec(**codec_config)
+            write_time = read_time = 0.0
+            file_size = 0
+            for _ in range(repeats):
+                for i, data in enumerate(datas):
+                    path = os.path.join(out_dir, f"{kind}_{i}.h5")
+                    start = time.perf_counter()
+                    with h5py.File(path, "w") as output_file:
+                        output_file.create_dataset(
+                            "data", data=data, **codec.dataset_kwargs(data)
+                        )
+                    write_time += time.perf_counter() - start
+                    start = time.perf_counter()
+                    with h5py.File(path, "r") as input_file:
+                        loaded = input_file["data"][()]
+                    read_time += time.perf_counter() - start
+                    assert np.array_equal(loaded, data)
+                    file_size += os.path.getsize(path)
+            results.append(
+                {
+                    "data": f"{kind} ({datas[0].dtype})",
+                    "codec": repr(codec),
+                    "write MB/s": nr_bytes * repeats / write_time / 1e6,
+                    "read MB/s": nr_bytes * repeats / read_time / 1e6,
+                    "ratio": nr_bytes * repeats / file_size,
+                }
+            )
+    shutil.rmtree(out_dir)
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--h5", type=str, nargs="*", default=None,
+                        help="Existing h5 outputs to benchmark instead of the example images.")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.h5:
+        arrays = load_arrays_from_h5(args.h5)
+    else:
+        download_example_data("output")
+        image_paths = sorted(glob(os.path.join("output", "images", "*.png")))
+        arrays = load_arrays_from_images(image_paths)
+    with pd.option_context("display.float_format", "{:.1f}".format):
+        print(benchmark(arrays, repeats=args.repeats).to_string(index=False))
@@ -1,6 +1,7 @@
-from .pipeline import PipelineRunner, BatchPipelineRunner
+from .pipeline import PipelineRunner, BatchPipelineRunner, SweepPipelineRunner
 
 __all__ = [
     'PipelineRunner',
-    'BatchPipelineRunner'
+    'BatchPipelineRunner',
+    'SweepPipelineRunner'
 ]
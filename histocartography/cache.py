@@ -0,0 +1,237 @@
+"""Content-addressed cache for pipeline step outputs"""
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Any, Optional, Tuple, Union
+
+import numpy as np
+
+CACHE_VERSION = 1
+
+
+def is_plain_data(obj: Any) -> bool:
+    """Whether an object is plain data, i.e. builtin scalars, strings, paths, arrays
+       and nested lists, tuples and dicts of them
+
+    Args:
+        obj (Any): Object to check
+
+    Returns:
+        bool: Whether the object is plain data
+    """
+    if obj is None or isinstance(
+        obj, (bool, int, float, complex, str, bytes, Path, np.ndarray, np.generic)
+    ):
+        return True
+    if isinstance(obj, (list, tuple)):
+        return all(is_plain_data(item) for item in obj)
+    if isinstance(obj, dict):
+        return all(is_plain_data(k) and is_plain_data(v) for k, v in obj.items())
+    return False
+
+
+def _update_hash(hasher: Any, obj: Any) -> None:
+    """Feed a stable byte representation of an object into a hasher
+
+    Args:
+        hasher (Any): hashlib hasher to update
+        obj (Any): Object to hash. Arrays, tensors, paths, builtin scalars and nested
+            lists, tuples and dicts are hashed by content, everything else by its pickle.
+    """
+    if obj is None or isinstance(obj, (bool, int, float, complex)):
+        hasher.update(f"{type(obj).__name__}:{obj!r};".encode())
+    elif isinstance(obj, (str, Path)):
+        hasher.update(f"{type(obj).__name__}:{obj};".encode())
+        # paths to existing files (e.g. images, checkpoints) are hashed by size and
+        # modification time, such that rewriting the file invalidates the cache
+        if os.path.isfile(obj):
+            stat = os.stat(obj)
+            hasher.update(f"file:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    elif isinstance(obj, bytes):
+        hasher.update(b"bytes:" + obj + b";")
+    elif isinstance(obj, np.ndarray):
+        hasher.update(f"ndarray:{obj.dtype.str}:{obj.shape};".encode())
+        hasher.update(np.ascontiguousarray(obj).data)
+    elif isinstance(obj, np.generic):
+        _update_hash(hasher, obj.item())
+    elif hasattr(obj, "detach") and hasattr(obj, "cpu") and hasattr(obj, "numpy"):
+        _update_hash(hasher, obj.detach().cpu().numpy())
+    elif isinstance(obj, (list, tuple)):
+        hasher.update(f"{type(obj).__name__}:{len(obj)}[".encode())
+        for item in obj:
+            _update_hash(hasher, item)
+        hasher.update(b"]")
+    elif isinstance(obj, dict):
+        hasher.update(f"dict:{len(obj)}{{".encode())
+        for key in sorted(obj, key=repr):
+            _update_hash(hasher, key)
+            _update_hash(hasher, obj[key])
+        hasher.update(b"}")
+    else:
+        hasher.update(f"{type(obj).__module__}.{type(obj).__qualname__}:".encode())
+        hasher.update(pickle.dumps(obj, protocol=4))
+        hasher.update(b";")
+
+
+def compute_cache_key(step: Any, *args: Any, **kwargs: Any) -> str:
+    """Compute the content address of a step invocation
+
+    Args:
+        step (Any): Pipeline step, must implement _cache_parameters
+        args (Any): Positional inputs of the step
+        kwargs (Any): Keyword inputs of the step
+
+    Returns:
+        str: Hexadecimal key that only depends on the step class, its semantic
+            parameters and the content of the inputs
+    """
+    hasher = hashlib.blake2b(digest_size=20)
+    hasher.update(f"v{CACHE_VERSION}:".encode())
+    hasher.update(
+        f"{step.__class__.__module__}.{step.__class__.__qualname__};".encode()
+    )
+    _update_hash(hasher, step._cache_parameters())
+    _update_hash(hasher, list(args))
+    _update_hash(hasher, kwargs)
+    return hasher.hexdigest()
+
+
+class StageCache:
+    """Size-bounded on-disk cache of step outputs addressed by their content"""
+
+    def __init__(
+        self, path: Union[str, Path], max_size: Optional[int] = None
+    ) -> None:
+        """Create a cache at a directory. The directory can be shared between
+           processes and pipelines, entries are written atomically.
+
+        Args:
+            path (Union[str, Path]): Root directory of the cache
+            max_size (Optional[int], optional): Maximum size of the cache in bytes.
+                When exceeded, the least recently used entries are evicted. None means
+                unbounded. Defaults to None.
+        """
+        assert max_size is None or max_size > 0, "max_size must be positive"
+        self.path = Path(path)
+        self.max_size = max_size
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._size = None
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(path={self.path},max_size={self.max_size})"
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_size"] = None
+        return state
+
+    def _entry_path(self, key: str) -> Path:
+        return self.path / key[:2] / f"{key}.pkl"
+
+    def _entries(self):
+        return self.path.glob("*/*.pkl")
+
+    def __contains__(self, key: str) -> bool:
+        return self._entry_path(key).exists()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Look up an entry and mark it as recently used
+
+        Args:
+            key (str): Key of the entry
+
+        Returns:
+            Tuple[bool, Any]: Whether the entry exists and its content (None on a miss)
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "rb") as entry_file:
+                output = pickle.load(entry_file)
+            os.utime(entry_path)
+        except FileNotFoundError:
+            return False, None
+        except (EOFError, pickle.UnpicklingError):
+            logging.warning(f"Removing corrupted cache entry {entry_path}")
+            self._remove(entry_path)
+            return False, None
+        return True, output
+
+    def put(self, key: str, output: Any) -> None:
+        """Store an entry and evict the least recently used ones if needed
+
+        Args:
+            key (str): Key of the entry
+            output (Any): Content of the entry, must be picklable
+        """
+        entry_path = self._entry_path(key)
+        entry_path.parent.mkdir(exist_ok=True)
+        file_descriptor, tmp_path = tempfile.mkstemp(
+            dir=entry_path.parent, suffix=".tmp"
+        )
+        try:
+            with os.fdopen(file_descriptor, "wb") as entry_file:
+                pickle.dump(output, entry_file, protocol=4)
+            os.replace(tmp_path, entry_path)
+        except BaseException:
+            self._remove(Path(tmp_path))
+            raise
+        if self.max_size is not None:
+            if self._size is None:
+                self._size = self.size()
+            else:
+                self._size += entry_path.stat().st_size
+            if self._size > self.max_size:
+                self.evict()
+
+    def size(self) -> int:
+        """Total size of the entries in bytes
+
+        Returns:
+            int: Size of the cache
+        """
+        size = 0
+        for entry_path in self._entries():
+            try:
+                size += entry_path.stat().st_size
+            except FileNotFoundError:
+                pass
+        return size
+
+    def evict(self, max_size: Optional[int] = None) -> None:
+        """Remove least recently used entries until the cache fits
+
+        Args:
+            max_size (Optional[int], optional): Target size in bytes. Defaults to self.max_size.
+        """
+        max_size = self.max_size if max_size is None else max_size
+        if max_size is None:
+            return
+        entries = []
+        for entry_path in self._entries():
+            try:
+                stat = entry_path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry_path))
+        entries.sort(key=lambda entry: entry[0])
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, entry_path in entries:
+            if size <= max_size:
+                break
+            self._remove(entry_path)
+            size -= entry_size
+        self._size = size
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        self.evict(max_size=0)
+
+    @staticmethod
+    def _remove(path: Path) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
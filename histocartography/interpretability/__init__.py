@@ -1,6 +1,13 @@
-from .grad_cam import GraphGradCAMExplainer, GraphGradCAMPPExplainer
-from .graph_pruning_explainer import GraphPruningExplainer
-from .lrp_gnn_explainer import GraphLRPExplainer
+from ..utils.lazy import lazy_attributes
+
+_LAZY_ATTRIBUTES = {
+    'GraphGradCAMExplainer': '.grad_cam',
+    'GraphGradCAMPPExplainer': '.grad_cam',
+    'GraphPruningExplainer': '.graph_pruning_explainer',
+    'GraphLRPExplainer': '.lrp_gnn_explainer',
+}
+
+__getattr__, __dir__ = lazy_attributes(__name__, _LAZY_ATTRIBUTES)
 
 __all__ = [
     'GraphGradCAMExplainer',
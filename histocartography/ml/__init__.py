@@ -1,11 +1,16 @@
-from .layers.dense_gin_layer import DenseGINLayer
-from .layers.gin_layer import GINLayer
-from .layers.pna_layer import PNALayer
-from .layers.multi_layer_gnn import MultiLayerGNN
+from ..utils.lazy import lazy_attributes
 
-from .models.cell_graph_model import CellGraphModel
-from .models.tissue_graph_model import TissueGraphModel
-from .models.hact_model import HACTModel
+_LAZY_ATTRIBUTES = {
+    'DenseGINLayer': '.layers.dense_gin_layer',
+    'GINLayer': '.layers.gin_layer',
+    'PNALayer': '.layers.pna_layer',
+    'MultiLayerGNN': '.layers.multi_layer_gnn',
+    'CellGraphModel': '.models.cell_graph_model',
+    'TissueGraphModel': '.models.tissue_graph_model',
+    'HACTModel': '.models.hact_model',
+}
+
+__getattr__, __dir__ = lazy_attributes(__name__, _LAZY_ATTRIBUTES)
 
 __all__ = [
     'DenseGINLayer',
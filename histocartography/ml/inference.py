@@ -0,0 +1,248 @@
+"""Inference modes and inference-graph optimization of convolutional models"""
+import copy
+import importlib
+import os
+import tempfile
+from typing import Callable, Iterable, Optional, Union
+
+import torch
+import torch.nn as nn
+
+# float32: unchanged model
+# bfloat16: forward pass under bfloat16 autocast
+# channels_last: model weights and inputs in the NHWC memory format
+# int8: conv blocks statically quantized to int8 (CPU only, needs calibration data)
+INFERENCE_MODES = ["float32", "bfloat16", "channels_last", "int8"]
+
+# torch API the inference modes need, with the torch version that added it
+_MODE_APIS = {
+    "bfloat16": ("torch.autocast", "1.10"),
+    "channels_last": ("torch.channels_last", "1.5"),
+    "int8": ("torch.ao.quantization", "1.10"),
+}
+
+
+def _has_torch_api(name: str) -> bool:
+    """Whether the installed torch has a module or attribute, given by its full name"""
+    try:
+        importlib.import_module(name)
+        return True
+    except ImportError:
+        module, _, attribute = name.rpartition(".")
+        try:
+            return hasattr(importlib.import_module(module), attribute)
+        except ImportError:
+            return False
+
+
+def _check_torch_api(name: str, version: str, feature: str) -> None:
+    """Asserts that the installed torch has the API a feature needs"""
+    assert _has_torch_api(
+        name
+    ), f"{feature} needs torch>={version} ({name}), found torch {torch.__version__}"
+
+
+def check_inference_mode(mode: str) -> None:
+    """Asserts that a mode is one of INFERENCE_MODES and that the installed torch supports it
+
+    Args:
+        mode (str): Inference mode
+    """
+    assert mode in INFERENCE_MODES, f"Unsupported inference mode {mode}, options are {INFERENCE_MODES}"
+    if mode in _MODE_APIS:
+        _check_torch_api(*_MODE_APIS[mode], f"{mode} inference")
+
+
+def _is_conv_block(module: nn.Module) -> bool:
+    """Whether a module is a conv block, i.e. a module with a Conv2d `conv`, optionally
+       followed by a BatchNorm2d + ReLU `act` (like the Conv2dWithActivation of HoverNet)"""
+    return isinstance(getattr(module, "conv", None), nn.Conv2d)
+
+
+def _has_bn_relu(block: nn.Module) -> bool:
+    act = getattr(block, "act", None)
+    return isinstance(getattr(act, "bn", None), nn.BatchNorm2d) and isinstance(
+        getattr(act, "relu", None), nn.ReLU
+    )
+
+
+def quantize_conv_blocks(
+    model: nn.Module, calibration_batches: Iterable[torch.Tensor]
+) -> nn.Module:
+    """Post-training static int8 quantization of the conv blocks of a model. The conv,
+       batch norm and ReLU of every block are fused into one quantized conv that reads and
+       writes float32 tensors, such that the code between the blocks (cropping, upsampling,
+       concatenations) runs unchanged. The activation ranges are calibrated on the given
+       batches. Dynamic quantization is not an option here, since PyTorch only quantizes
+       linear and recurrent layers dynamically.
+
+    Args:
+        model (nn.Module): Model in eval mode. It is not modified.
+        calibration_batches (Iterable[torch.Tensor]): Representative input batches
+
+    Returns:
+        nn.Module: Quantized copy of the model that runs on the CPU
+    """
+    check_inference_mode("int8")
+    from torch.ao.quantization import (
+        QuantWrapper,
+        convert,
+        fuse_modules,
+        get_default_qconfig,
+        prepare,
+    )
+
+    model = copy.deepcopy(model).cpu().eval()
+    qconfig = get_default_qconfig(torch.backends.quantized.engine)
+    nr_blocks = 0
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if not _is_conv_block(child):
+                continue
+            if _has_bn_relu(child):
+                fuse_modules(child, [["conv", "act.bn", "act.relu"]], inplace=True)
+            wrapper = QuantWrapper(child)
+            wrapper.qconfig = qconfig
+            setattr(parent, name, wrapper)
+            nr_blocks += 1
+    assert nr_blocks > 0, "The model has no conv blocks to quantize"
+
+    prepare(model, inplace=True)
+    nr_batches = 0
+    with torch.no_grad():
+        for batch in calibration_batches:
+            model(batch.cpu())
+            nr_batches += 1
+    assert nr_batches > 0, "Calibration needs at least one batch"
+    convert(model, inplace=True)
+    return model
+
+
+def prepare_model(
+    model: nn.Module, mode: str, calibration_batches: Iterable[torch.Tensor] = None
+) -> nn.Module:
+    """Prepares a model in eval mode for inference in one of the INFERENCE_MODES
+
+    Args:
+        model (nn.Module): Model in eval mode
+        mode (str): Inference mode, one of INFERENCE_MODES
+        calibration_batches (Iterable[torch.Tensor], optional): Representative input
+            batches, only needed for int8. Defaults to None.
+
+    Returns:
+        nn.Module: Model to pass to inference_forward
+    """
+    check_inference_mode(mode)
+    if mode == "channels_last":
+        return model.to(memory_format=torch.channels_last)
+    if mode == "int8":
+        assert calibration_batches is not None, "int8 inference needs calibration batches"
+        return quantize_conv_blocks(model, calibration_batches)
+    return model
+
+
+def inference_forward(model: nn.Module, batch: torch.Tensor, mode: str) -> torch.Tensor:
+    """Forward pass of a model prepared with prepare_model. Call it under torch.no_grad().
+
+    Args:
+        model (nn.Module): Prepared model
+        batch (torch.Tensor): Input batch
+        mode (str): Inference mode the model was prepared for
+
+    Returns:
+        torch.Tensor: float32 output
+    """
+    if mode == "channels_last":
+        batch = batch.contiguous(memory_format=torch.channels_last)
+    if mode == "bfloat16":
+        with torch.autocast(device_type=batch.device.type, dtype=torch.bfloat16):
+            out = model(batch)
+    else:
+        out = model(batch)
+    return out.float().contiguous()
+
+
+def check_freezing() -> None:
+    """Asserts that the installed torch can freeze TorchScript models (see freeze_model)"""
+    _check_torch_api("torch.jit.freeze", "1.8", "Freezing the model (optimize=True)")
+
+
+def freeze_model(model: nn.Module, example_input: torch.Tensor) -> torch.jit.ScriptModule:
+    """Traces a model in eval mode into TorchScript and freezes it: the parameters become
+       constants and every BatchNorm that follows a convolution is folded into its weights.
+
+    Args:
+        model (nn.Module): Model in eval mode, on the device of example_input
+        example_input (torch.Tensor): Input batch of the shape the model will see. The
+            batch size may differ later on.
+
+    Returns:
+        torch.jit.ScriptModule: Frozen model
+    """
+    check_freezing()
+    with torch.no_grad():
+        traced = torch.jit.trace(model.eval(), example_input)
+    return torch.jit.freeze(traced)
+
+
+def optimized_model_path(
+    path: Union[str, os.PathLike], example_input: torch.Tensor
+) -> str:
+    """Path of the frozen artifact of a checkpoint, next to it. The name identifies the
+       device, the input size and the torch version, since a frozen model only runs there.
+
+    Args:
+        path (Union[str, os.PathLike]): Path of the checkpoint (or a base path)
+        example_input (torch.Tensor): Input batch the model is traced with
+
+    Returns:
+        str: Path of the artifact
+    """
+    input_size = "x".join(str(size) for size in example_input.shape[1:])
+    return (
+        f"{os.path.splitext(path)[0]}_frozen_{example_input.device.type}"
+        f"_{input_size}_torch{torch.__version__.replace('+', '_')}.pt"
+    )
+
+
+def load_optimized_model(
+    load_model: Callable[[], nn.Module],
+    example_input: torch.Tensor,
+    artifact_path: Optional[Union[str, os.PathLike]] = None,
+    source_path: Optional[Union[str, os.PathLike]] = None,
+) -> torch.jit.ScriptModule:
+    """Loads the frozen model from artifact_path or builds it with freeze_model and saves it
+       there, such that the next instances skip the checkpoint, the tracing and the folding.
+       The artifact is written atomically, so concurrent workers never read a partial file.
+
+    Args:
+        load_model (Callable[[], nn.Module]): Loads the model in eval mode on the device of
+            example_input. Only called when there is no up-to-date artifact.
+        example_input (torch.Tensor): Input batch the model is traced with
+        artifact_path (Optional[Union[str, os.PathLike]], optional): Path of the cached
+            artifact. None does not cache. Defaults to None.
+        source_path (Optional[Union[str, os.PathLike]], optional): Checkpoint the model is
+            loaded from. The artifact is rebuilt when the checkpoint is newer. Defaults to None.
+
+    Returns:
+        torch.jit.ScriptModule: Frozen model
+    """
+    if artifact_path is not None and os.path.isfile(artifact_path):
+        if source_path is None or os.path.getmtime(artifact_path) >= os.path.getmtime(
+            source_path
+        ):
+            return torch.jit.load(artifact_path, map_location=example_input.device)
+    model = freeze_model(load_model(), example_input)
+    if artifact_path is not None:
+        directory = os.path.dirname(os.path.abspath(artifact_path))
+        os.makedirs(directory, exist_ok=True)
+        file_descriptor, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        os.close(file_descriptor)
+        try:
+            torch.jit.save(model, tmp_path)
+            os.replace(tmp_path, artifact_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return model
@@ -4,6 +4,7 @@ from torch.nn import Module
 from abc import abstractmethod
 from ..layers.multi_layer_gnn import MultiLayerGNN
 from .zoo import MODEL_NAME_TO_URL, MODEL_NAME_TO_CONFIG
+from ..registry import get_model, load_checkpoint
 from ...utils import download_box_link
 
 
@@ -63,8 +64,11 @@ class BaseModel(Module):
             url=MODEL_NAME_TO_URL[model_name],
             out_fname=os.path.join(checkpoint_path, model_name)
         )
+        # the checkpoint is read once per process, every model gets its own copy of the weights
+        model_path = os.path.join(checkpoint_path, model_name)
         self.load_state_dict(
-            torch.load(os.path.join(checkpoint_path, model_name))
+            get_model(model_path, 'cpu', 'state_dict',
+                      lambda: load_checkpoint(model_path, map_location='cpu'))
         )
 
     @abstractmethod
@@ -0,0 +1,71 @@
+"""Process-wide registry of the models loaded by the steps, such that every model is loaded once"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, Union
+
+import torch
+
+_MODELS: Dict[Tuple[Hashable, ...], Any] = dict()
+_LOCK = threading.RLock()
+
+
+def get_model(
+    source: str,
+    device: Union[str, torch.device],
+    precision: str,
+    load: Callable[[], Any],
+) -> Any:
+    """Returns the model registered under (source, device, precision) and loads it with load
+       on first use. All the steps of a process that use the same model then share one copy
+       of its weights, and the weights of a model loaded before the workers of a
+       BatchPipelineRunner are forked are shared with the workers page by page. The shared
+       models are in eval mode and their parameters do not require gradients: a step must not
+       modify the model it gets, but work on a copy (e.g. to quantize it).
+
+    Args:
+        source (str): Architecture or checkpoint path the model is loaded from
+        device (Union[str, torch.device]): Device the model is on
+        precision (str): Precision or variant of the model, e.g. "float32" or "frozen"
+        load (Callable[[], Any]): Loads the model. Called once per key.
+
+    Returns:
+        Any: Registered model (or whatever load returns, e.g. a tuple with metadata)
+    """
+    key = (str(source), str(device), precision)
+    with _LOCK:
+        if key not in _MODELS:
+            model = load()
+            for module in model if isinstance(model, tuple) else (model,):
+                if isinstance(module, torch.nn.Module):
+                    module.eval()
+                    for parameter in module.parameters():
+                        parameter.requires_grad_(False)
+            _MODELS[key] = model
+        return _MODELS[key]
+
+
+def clear_models() -> None:
+    """Removes all the models from the registry. The steps keep the models they hold."""
+    with _LOCK:
+        _MODELS.clear()
+
+
+def load_checkpoint(
+    path: str, map_location: Optional[Union[str, torch.device]] = None
+) -> Any:
+    """Loads a checkpoint with torch.load, memory-mapped when possible: the tensors on the CPU
+       then stay in the page cache of the file instead of being copied into the process, and
+       all the processes that load the same checkpoint share them. Checkpoints in the legacy
+       (non-zip) format and older versions of torch fall back to a regular load.
+
+    Args:
+        path (str): Path of the checkpoint
+        map_location (Optional[Union[str, torch.device]], optional): Device to load the
+            tensors to. Defaults to None.
+
+    Returns:
+        Any: Content of the checkpoint
+    """
+    try:
+        return torch.load(path, map_location=map_location, mmap=True)
+    except (TypeError, RuntimeError):
+        return torch.load(path, map_location=map_location)
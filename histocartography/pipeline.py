@@ -1,30 +1,80 @@
 """Pipeline utilities"""
+import io
+import json
 import logging
 import multiprocessing
 import os
 import sys
+import threading
+import tracemalloc
 from abc import ABC, abstractmethod
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
 from copy import deepcopy
 from functools import partial
+from itertools import islice
+from queue import Empty, Full, Queue
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Tuple, Union
 
 import h5py
+import numpy as np
 import pandas as pd
 from tqdm.auto import tqdm
 
+from histocartography.cache import StageCache, compute_cache_key, is_plain_data
+from histocartography.profiling import (
+    get_file_size,
+    measure,
+    summarize_metrics,
+    write_trace,
+)
+from histocartography.storage import StorageCodec, get_storage_codec
+from histocartography.store import ShardedStore
 from histocartography.utils import dynamic_import_from, signal_last
 
 
 class PipelineStep(ABC):
     """Base pipelines step"""
 
+    # Whether the outputs of the step can be stored in a StageCache
+    _cacheable = True
+    # Whether the step writes its outputs when save_path is set
+    _saves_output = True
+    # Whether the step modifies its input arrays in place. The runners pass read-only
+    # views of the arrays to the other steps and copies to the ones that mutate them.
+    _mutates_inputs = False
+    # Attributes that do not change the output of the step
+    _cache_ignore = (
+        "save_path",
+        "output_dir",
+        "output_key",
+        "cache",
+        "storage",
+        "store",
+        "verbose",
+        "num_workers",
+        "batch_size",
+        "device",
+        "last_metrics",
+        "last_batch_metrics",
+        "step_metrics",
+    )
+
     def __init__(
         self,
         save_path: Union[None, str, Path] = None,
         precompute: bool = True,
         link_path: Union[None, str, Path] = None,
         precompute_path: Union[None, str, Path] = None,
+        cache: Optional[StageCache] = None,
+        storage: Union[None, str, Dict[str, Any], StorageCodec] = None,
+        sharded: bool = False,
     ) -> None:
         """Abstract class that helps with saving and loading precomputed results
 
@@ -39,17 +89,34 @@ class PipelineStep(ABC):
             precompute_path (Union[None, str, Path], optional): Path to save the output of
                 the precomputation to. If not specified it defaults to the output directory
                 of the step when save_path is not None. Defaults to None.
+            cache (Optional[StageCache], optional): Content-addressed cache to look up
+                outputs in before computing them. Entries are keyed by the step parameters
+                and the content of the inputs. When None, no cache is used. Defaults to None.
+            storage (Union[None, str, Dict[str, Any], StorageCodec], optional): How to store the
+                outputs in h5 files: "none", "lzf", "gzip", "shuffle" or the keyword arguments of
+                a StorageCodec, e.g. {"codec": "gzip", "level": 4}. Defaults to gzip at level 9.
+            sharded (bool, optional): Whether to pack the saved outputs into the shards of a
+                ShardedStore in the output directory instead of writing one file per datapoint.
+                Only used when save_path is not None. Defaults to False.
         """
         assert (
             save_path is not None or link_path is None
         ), "link_path only supported when save_path is not None"
+        assert (
+            cache is None or self._cacheable
+        ), f"{self.__class__.__name__} does not support caching"
 
         name = self.__repr__()
+        self.cache = cache
+        self.storage = get_storage_codec(storage)
         self.save_path = save_path
+        self.store: Optional[ShardedStore] = None
         if self.save_path is not None:
             self.output_dir = Path(self.save_path) / name
             self.output_key = "default_key"
             self._mkdir()
+            if sharded:
+                self.store = ShardedStore(self.output_dir)
             if precompute_path is None:
                 precompute_path = save_path
 
@@ -124,6 +191,7 @@ class PipelineStep(ABC):
         self, *args: Any, output_name: Optional[str] = None, **kwargs: Any
     ) -> Any:
         """Main process function of the step and outputs the result. Try to saves the output when output_name is passed.
+           The measurements of the call are stored in self.last_metrics.
 
         Args:
             output_name (Optional[str], optional): Unique identifier of the passed datapoint. Defaults to None.
@@ -131,11 +199,261 @@ class PipelineStep(ABC):
         Returns:
             Any: Result of the pipeline step
         """
-        if output_name is not None and self.save_path is not None:
-            return self._process_and_save(
-                *args, output_name=output_name, **kwargs)
+        output, self.last_metrics = self.profiled_process(
+            *args, output_name=output_name, **kwargs
+        )
+        return output
+
+    def process_batch(
+        self,
+        batch_args: List[Tuple[Any, ...]],
+        output_names: Optional[List[Optional[str]]] = None,
+    ) -> List[Any]:
+        """Same as process for several datapoints at once. Steps that can share work between
+           datapoints (e.g. the batches of a model, or products with a shared matrix) override
+           _process_batch, the others process the datapoints one after the other.
+           The measurements of every datapoint are stored in self.last_batch_metrics.
+
+        Args:
+            batch_args (List[Tuple[Any, ...]]): Positional inputs of every datapoint
+            output_names (Optional[List[Optional[str]]], optional): Unique identifier of every
+                datapoint. Defaults to None.
+
+        Returns:
+            List[Any]: Result of the pipeline step for every datapoint
+        """
+        outputs, self.last_batch_metrics = self.profiled_process_batch(
+            batch_args, output_names
+        )
+        return outputs
+
+    def profiled_process(
+        self, *args: Any, output_name: Optional[str] = None, **kwargs: Any
+    ) -> Tuple[Any, Dict[str, Any]]:
+        """Same as process, but also returns the measurements of the call: wall_time, cpu_time,
+           peak_rss, peak_rss_increase, traced_peak (see histocartography.profiling.measure),
+           cache ("hit" if the output was reused, "miss" if it was looked up in the cache but
+           computed, None otherwise), bytes_read and bytes_written, and the measurements that
+           the step recorded in self.step_metrics while computing (e.g. counters like
+           nr_skipped_patches)
+
+        Args:
+            output_name (Optional[str], optional): Unique identifier of the passed datapoint. Defaults to None.
+
+        Returns:
+            Tuple[Any, Dict[str, Any]]: Result of the pipeline step, measurements
+        """
+        metrics = {
+            "cache": None,
+            "bytes_read": self._get_input_size(*args, **kwargs),
+            "bytes_written": 0,
+        }
+        self.step_metrics = dict()
+        with measure(metrics):
+            if self.cache is not None:
+                output = self._process_with_cache(
+                    *args, output_name=output_name, metrics=metrics, **kwargs
+                )
+            elif output_name is not None and self.save_path is not None:
+                output = self._process_and_save(
+                    *args, output_name=output_name, metrics=metrics, **kwargs
+                )
+            else:
+                output = self._process(*args, **kwargs)
+        metrics.update(self.step_metrics)
+        return output, metrics
+
+    def profiled_process_batch(
+        self,
+        batch_args: List[Tuple[Any, ...]],
+        output_names: Optional[List[Optional[str]]] = None,
+    ) -> Tuple[List[Any], List[Dict[str, Any]]]:
+        """Same as profiled_process for several datapoints at once. The outputs that are found in
+           the cache or among the saved outputs are reused, and the others are computed together
+           with _process_batch, such that steps that run a model can fill their batches with the
+           patches of several datapoints. The time of the call is split evenly between the
+           datapoints, and their measurements record the number of datapoints in batch_size.
+           The measurements the step recorded in self.step_metrics are the ones of the whole
+           batch.
+
+        Args:
+            batch_args (List[Tuple[Any, ...]]): Positional inputs of every datapoint
+            output_names (Optional[List[Optional[str]]], optional): Unique identifier of every
+                datapoint. Defaults to None.
+
+        Returns:
+            Tuple[List[Any], List[Dict[str, Any]]]: Result of the pipeline step and measurements
+                for every datapoint
+        """
+        if output_names is None:
+            output_names = [None] * len(batch_args)
+        assert len(output_names) == len(
+            batch_args), "Need an output name for every datapoint"
+        batch_metrics = [
+            {
+                "cache": None,
+                "bytes_read": self._get_input_size(*args),
+                "bytes_written": 0,
+            }
+            for args in batch_args
+        ]
+        outputs: List[Any] = [None] * len(batch_args)
+        cache_keys: List[Optional[str]] = [None] * len(batch_args)
+        to_compute = list()
+        metrics: Dict[str, Any] = dict()
+        self.step_metrics = dict()
+        with measure(metrics):
+            for i, (args, output_name) in enumerate(zip(batch_args, output_names)):
+                saves = output_name is not None and self.save_path is not None
+                if self.cache is not None:
+                    cache_keys[i] = compute_cache_key(self, *args)
+                    hit, output = self.cache.get(cache_keys[i])
+                    if not hit:
+                        batch_metrics[i]["cache"] = "miss"
+                        to_compute.append(i)
+                        continue
+                    batch_metrics[i]["cache"] = "hit"
+                    batch_metrics[i]["bytes_read"] += get_file_size(
+                        self.cache._entry_path(cache_keys[i])
+                    )
+                    outputs[i] = output
+                    if saves:
+                        self._save_output(output_name, output)
+                        batch_metrics[i]["bytes_written"] += self._get_output_size(
+                            output_name
+                        )
+                elif saves and self._has_output(output_name):
+                    outputs[i] = self._load_output(output_name)
+                    batch_metrics[i]["cache"] = "hit"
+                    batch_metrics[i]["bytes_read"] += self._get_output_size(
+                        output_name)
+                else:
+                    to_compute.append(i)
+            if len(to_compute) > 0:
+                computed = self._process_batch([batch_args[i] for i in to_compute])
+                for i, output in zip(to_compute, computed):
+                    outputs[i] = output
+                    if cache_keys[i] is not None:
+                        self.cache.put(cache_keys[i], output)
+                        batch_metrics[i]["bytes_written"] += get_file_size(
+                            self.cache._entry_path(cache_keys[i])
+                        )
+                    if output_names[i] is not None and self.save_path is not None:
+                        self._save_output(output_names[i], output)
+                        batch_metrics[i]["bytes_written"] += self._get_output_size(
+                            output_names[i]
+                        )
+        metrics.update(self.step_metrics)
+        for datapoint_metrics in batch_metrics:
+            datapoint_metrics.update(metrics)
+            datapoint_metrics["wall_time"] = metrics["wall_time"] / len(batch_args)
+            datapoint_metrics["cpu_time"] = metrics["cpu_time"] / len(batch_args)
+            datapoint_metrics["batch_size"] = len(batch_args)
+        return outputs, batch_metrics
+
+    def has_output(self, output_name: Optional[str]) -> bool:
+        """Whether the output of a datapoint was saved before, such that it can be loaded
+           instead of computed
+
+        Args:
+            output_name (Optional[str]): Unique identifier of the datapoint
+
+        Returns:
+            bool: Whether a saved output exists
+        """
+        return (
+            output_name is not None
+            and self.save_path is not None
+            and self._has_output(output_name)
+        )
+
+    def profiled_load(self, output_name: str) -> Tuple[Any, Dict[str, Any]]:
+        """Loads the saved output of a datapoint and measures it like profiled_process
+
+        Args:
+            output_name (str): Unique identifier of the datapoint
+
+        Returns:
+            Tuple[Any, Dict[str, Any]]: Saved output of the pipeline step, measurements
+        """
+        assert self.has_output(
+            output_name), f"No saved output of {output_name} to load"
+        metrics = {
+            "cache": "hit",
+            "bytes_read": self._get_output_size(output_name),
+            "bytes_written": 0,
+        }
+        with measure(metrics):
+            output = self._load_output(output_name)
+        return output, metrics
+
+    def _count(self, name: str, value: int) -> None:
+        """Adds to a counter in the measurements of the current call (see profiled_process)
+
+        Args:
+            name (str): Name of the counter, starts with "nr_"
+            value (int): Value to add
+        """
+        step_metrics = self.__dict__.setdefault("step_metrics", dict())
+        step_metrics[name] = step_metrics.get(name, 0) + value
+
+    def _get_input_size(self, *args: Any, **kwargs: Any) -> int:
+        """Number of bytes the step reads from disk to process the given inputs
+
+        Returns:
+            int: Number of bytes
+        """
+        return 0
+
+    def _cache_parameters(self) -> Dict[str, Any]:
+        """Parameters that determine the output of the step for given inputs
+
+        Returns:
+            Dict[str, Any]: Plain data attributes of the step without the ones in
+                _cache_ignore. Derived objects like models or transforms are skipped,
+                the parameters they are built from identify them.
+        """
+        return {
+            k: v
+            for k, v in self.__dict__.items()
+            if k not in self._cache_ignore and is_plain_data(v)
+        }
+
+    def _process_with_cache(
+        self,
+        *args: Any,
+        output_name: Optional[str] = None,
+        metrics: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> Any:
+        """Look up the output in the cache and only compute it on a miss.
+           The output is always (re)saved under output_name, such that saved
+           outputs never go stale when the inputs of a datapoint change.
+
+        Args:
+            output_name (Optional[str], optional): Unique identifier of the passed datapoint. Defaults to None.
+            metrics (Optional[Dict[str, Any]], optional): Measurements to update. Defaults to None.
+
+        Returns:
+            Any: Result of the pipeline step
+        """
+        if metrics is None:
+            metrics = {"bytes_read": 0, "bytes_written": 0}
+        key = compute_cache_key(self, *args, **kwargs)
+        hit, output = self.cache.get(key)
+        if hit:
+            logging.debug(f"{self.__class__.__name__}: Cache hit {key}")
+            metrics["cache"] = "hit"
+            metrics["bytes_read"] += get_file_size(self.cache._entry_path(key))
         else:
-            return self._process(*args, **kwargs)
+            output = self._process(*args, **kwargs)
+            self.cache.put(key, output)
+            metrics["cache"] = "miss"
+            metrics["bytes_written"] += get_file_size(self.cache._entry_path(key))
+        if output_name is not None and self.save_path is not None:
+            self._save_output(output_name, output)
+            metrics["bytes_written"] += self._get_output_size(output_name)
+        return output
 
     @abstractmethod
     def _process(self, *args: Any, **kwargs: Any) -> Any:
@@ -145,6 +463,19 @@ class PipelineStep(ABC):
             Any: Result of the pipeline step
         """
 
+    def _process_batch(self, batch_args: List[Tuple[Any, ...]]) -> List[Any]:
+        """Performs the computation of the pipeline step for several datapoints. Processes
+           them one after the other by default, steps that can share work between datapoints
+           (e.g. the batches of a model) override it.
+
+        Args:
+            batch_args (List[Tuple[Any, ...]]): Positional inputs of every datapoint
+
+        Returns:
+            List[Any]: Result of the pipeline step for every datapoint
+        """
+        return [self._process(*args) for args in batch_args]
+
     def _get_outputs(self, input_file: h5py.File) -> Union[Any, Tuple]:
         """Extracts the step output from a given h5 file
 
@@ -182,49 +513,192 @@ class PipelineStep(ABC):
             output_file.create_dataset(
                 f"{self.output_key}_{i}",
                 data=output,
-                compression="gzip",
-                compression_opts=9,
+                **self.storage.dataset_kwargs(output),
             )
 
+    def _get_output_path(self, output_name: str) -> Path:
+        """Path of the saved output of a datapoint
+
+        Args:
+            output_name (str): Unique identifier of the datapoint
+
+        Returns:
+            Path: Path of the output file
+        """
+        return self.output_dir / f"{output_name}.h5"
+
+    def _has_output(self, output_name: str) -> bool:
+        """Whether the output of a datapoint has already been saved
+
+        Args:
+            output_name (str): Unique identifier of the datapoint
+
+        Returns:
+            bool: Whether a saved output exists
+        """
+        output_path = self._get_output_path(output_name)
+        if self.store is not None:
+            return output_path.name in self.store
+        return output_path.exists()
+
+    def _get_output_size(self, output_name: str) -> int:
+        """Size of the saved output of a datapoint
+
+        Args:
+            output_name (str): Unique identifier of the datapoint
+
+        Returns:
+            int: Size in bytes, 0 if the output was not saved
+        """
+        output_path = self._get_output_path(output_name)
+        if self.store is not None:
+            return self.store.size(output_path.name)
+        return get_file_size(output_path)
+
+    def _read_output(self, file: Union[Path, BinaryIO]) -> Any:
+        """Read an output from a file in the format of the step
+
+        Args:
+            file (Union[Path, BinaryIO]): Path of the file or file object to read from
+
+        Returns:
+            Any: Previously computed output of the step
+        """
+        with h5py.File(file, "r") as input_file:
+            return self._get_outputs(input_file=input_file)
+
+    def _write_output(self, file: Union[Path, BinaryIO], output: Any) -> None:
+        """Write an output to a file in the format of the step
+
+        Args:
+            file (Union[Path, BinaryIO]): Path of the file or file object to write to
+            output (Any): Computed step output
+        """
+        with h5py.File(file, "w") as output_file:
+            self._set_outputs(output_file=output_file, outputs=output)
+
+    def _load_output(self, output_name: str) -> Any:
+        """Load the saved output of a datapoint from its file or from the store
+
+        Args:
+            output_name (str): Unique identifier of the datapoint
+
+        Raises:
+            read_error (OSError): When the unable to read to self.output_dir/output_name.h5
+
+        Returns:
+            Any: Previously computed output of the step
+        """
+        output_path = self._get_output_path(output_name)
+        try:
+            if self.store is not None:
+                return self._read_output(
+                    io.BytesIO(self.store.get(output_path.name)))
+            return self._read_output(output_path)
+        except OSError as read_error:
+            print(f"\n\nCould not read from {output_path}!\n\n")
+            raise read_error
+
+    def _save_output(self, output_name: str, output: Any) -> None:
+        """Save the output of a datapoint to its file or to the store
+
+        Args:
+            output_name (str): Unique identifier of the datapoint
+            output (Any): Computed step output
+
+        Raises:
+            write_error (OSError): When the unable to write to self.output_dir/output_name.h5
+        """
+        output_path = self._get_output_path(output_name)
+        try:
+            if self.store is not None:
+                buffer = io.BytesIO()
+                self._write_output(buffer, output)
+                self.store.put(output_path.name, buffer.getvalue())
+            else:
+                self._write_output(output_path, output)
+        except OSError as write_error:
+            print(f"\n\nCould not write to {output_path}!\n\n")
+            raise write_error
+
     def _process_and_save(
-        self, *args: Any, output_name: str, **kwargs: Any
+        self,
+        *args: Any,
+        output_name: str,
+        metrics: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
     ) -> Any:
         """Process and save in the provided path as as .h5 file
 
         Args:
             output_name (str): Unique identifier of the the passed datapoint
+            metrics (Optional[Dict[str, Any]], optional): Measurements to update. Defaults to None.
 
-        Raises:
-            read_error (OSError): When the unable to read to self.output_dir/output_name.h5
-            write_error (OSError): When the unable to write to self.output_dir/output_name.h5
         Returns:
             Any: Result of the pipeline step
         """
         assert (
             self.save_path is not None
         ), "Can only save intermediate output if base_path was not None when constructing the object"
-        output_path = self.output_dir / f"{output_name}.h5"
-        if output_path.exists():
+        if metrics is None:
+            metrics = {"bytes_read": 0, "bytes_written": 0}
+        if self._has_output(output_name):
             logging.info(
                 f"{self.__class__.__name__}: Output of {output_name} already exists, using it instead of recomputing"
             )
-            try:
-                with h5py.File(output_path, "r") as input_file:
-                    output = self._get_outputs(input_file=input_file)
-            except OSError as read_error:
-                print(f"\n\nCould not read from {output_path}!\n\n")
-                raise read_error
+            output = self._load_output(output_name)
+            metrics["cache"] = "hit"
+            metrics["bytes_read"] += self._get_output_size(output_name)
         else:
             output = self._process(*args, **kwargs)
-            try:
-                with h5py.File(output_path, "w") as output_file:
-                    self._set_outputs(output_file=output_file, outputs=output)
-            except OSError as write_error:
-                print(f"\n\nCould not write to {output_path}!\n\n")
-                raise write_error
+            self._save_output(output_name, output)
+            metrics["bytes_written"] += self._get_output_size(output_name)
         return output
 
 
+# Marks the end of the datapoints in the queues of PipelineRunner.run_pipelined
+_END_OF_DATAPOINTS = object()
+
+
+def _read_only(value: Any) -> Any:
+    """Read-only view of an array, such that a step cannot modify the variables of a run
+
+    Args:
+        value (Any): Variable of a run
+
+    Returns:
+        Any: Read-only view if the variable is an array, the variable otherwise
+    """
+    if isinstance(value, np.ndarray):
+        value = value.view()
+        value.flags.writeable = False
+    return value
+
+
+def _process_stage(
+    stage: PipelineStep,
+    step_input: List[Any],
+    output_name: Optional[str],
+    load: bool = False,
+) -> Tuple[Any, Dict[str, Any]]:
+    """Runs a single stage and measures it. Module-level such that it can be
+       submitted to a process executor.
+
+    Args:
+        stage (PipelineStep): Stage to run
+        step_input (List[Any]): Positional inputs of the stage
+        output_name (Optional[str]): Unique identifier of the datapoint
+        load (bool, optional): Whether to load the saved output instead of processing
+            the inputs. Defaults to False.
+
+    Returns:
+        Tuple[Any, Dict[str, Any]]: Output of the stage, measurements of the stage
+    """
+    if load:
+        return stage.profiled_load(output_name)
+    return stage.profiled_process(*step_input, output_name=output_name)
+
+
 class PipelineRunner:
     def __init__(
         self,
@@ -234,6 +708,12 @@ class PipelineRunner:
         stages: Iterable[dict] = [],
         save_intermediate: bool = False,
         precompute: bool = True,
+        executor: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        cache_path: Union[None, str, Path] = None,
+        cache_size: Optional[int] = None,
+        storage: Union[None, str, Dict[str, Any]] = None,
+        sharded: bool = False,
     ) -> None:
         """Create a pipeline runner for a given configuration
 
@@ -245,11 +725,43 @@ class PipelineRunner:
             stages (Iterable[dict], optional): Stages to complete. Defaults to [].
             save_intermediate (bool, optional): Whether to save the intermediate steps. Defaults to False.
             precompute (bool, optional): Whether to perform the precomputation steps. Defaults to True.
+            executor (Optional[str], optional): How to schedule the stages. If None, the stages run
+                one after the other in the order of the configuration. With "thread" or "process",
+                the stages are scheduled according to the dependency graph defined by their inputs
+                and outputs, and independent stages run concurrently on a thread or process pool.
+                The process pool pickles the stage and its inputs for every call, so it is only
+                worthwhile for stages that hold the GIL and have cheap inputs. Defaults to None.
+            max_workers (Optional[int], optional): Maximum number of stages running concurrently.
+                Only used when executor is not None. Defaults to None.
+            cache_path (Union[None, str, Path], optional): Directory of a content-addressed cache
+                shared by all stages. Stages look up their output by their parameters and the
+                content of their inputs, so the cache can be shared between pipelines and
+                processes. Stages can opt out with "cache: false" in their configuration.
+                When None, no cache is used. Defaults to None.
+            cache_size (Optional[int], optional): Maximum size of the cache in bytes. The least
+                recently used entries are evicted first. None means unbounded. Defaults to None.
+            storage (Union[None, str, Dict[str, Any]], optional): Default storage codec of the
+                stages (see PipelineStep), stages can override it with their storage parameter.
+                If None, the stages use their own default. Defaults to None.
+            sharded (bool, optional): Whether the saving stages pack their outputs into a
+                ShardedStore instead of writing one file per datapoint (see PipelineStep).
+                Stages can override it with their sharded parameter. Defaults to False.
         """
+        assert executor in [
+            None,
+            "thread",
+            "process",
+        ], f"Unsupported executor {executor}. Options are None, 'thread' and 'process'."
         self.inputs = [] if inputs is None else inputs
         self.outputs = [] if outputs is None else outputs
+        self.executor = executor
+        self.max_workers = max_workers
         self.stages: List[PipelineStep] = list()
         self.stage_configs = list()
+        self.stage_workers: List[int] = list()
+        self.cache = (
+            None if cache_path is None else StageCache(cache_path, max_size=cache_size)
+        )
         path = output_path
         for is_last_stage, stage in signal_last(stages):
             requires_saving = output_path is not None and (
@@ -259,14 +771,24 @@ class PipelineRunner:
             stage_class = dynamic_import_from(
                 f"histocartography.{name}", config.pop("class")
             )
-            pipeline_stage = partial(
-                stage_class,
-                save_path=path if requires_saving else None,
-                precompute=False,
-                **config.pop("params", {}),
+            use_cache = config.pop("cache", stage_class._cacheable)
+            workers = config.pop("workers", 1)
+            assert workers > 0, f"{stage_class.__name__} needs at least one worker"
+            params = config.pop("params", {})
+            if storage is not None:
+                params.setdefault("storage", storage)
+            if sharded:
+                params.setdefault("sharded", sharded)
+            self.stages.append(
+                self._build_stage(
+                    stage_class,
+                    path if requires_saving else None,
+                    use_cache,
+                    params,
+                )
             )
-            self.stages.append(pipeline_stage())
             self.stage_configs.append(config)
+            self.stage_workers.append(workers)
 
             if requires_saving:
                 assert (
@@ -274,9 +796,111 @@ class PipelineRunner:
                 ), f"Cannot update nested path if no save path is defined"
                 path = str(self.stages[-1].output_dir)
         self.final_path = path
+        self._build_dependencies()
+        self.stage_times: List[Optional[float]] = [None] * len(self.stages)
+        self.stage_metrics: List[Optional[Dict[str, Any]]] = [None] * len(self.stages)
         if precompute:
             self.precompute(save_intermediate)
 
+    def _build_stage(
+        self,
+        stage_class: type,
+        save_path: Optional[str],
+        use_cache: bool,
+        params: Dict[str, Any],
+    ) -> PipelineStep:
+        """Instantiates the step of a stage without precomputation
+
+        Args:
+            stage_class (type): Class of the step
+            save_path (Optional[str]): Base path to save the outputs of the step to
+            use_cache (bool): Whether the step uses the cache of the runner
+            params (Dict[str, Any]): Keyword arguments of the step
+
+        Returns:
+            PipelineStep: Step of the stage
+        """
+        return stage_class(
+            save_path=save_path,
+            precompute=False,
+            cache=self.cache if use_cache else None,
+            **params,
+        )
+
+    @property
+    def stage_names(self) -> List[str]:
+        """Unique names of the stages, i.e. the class name and the position in the configuration
+
+        Returns:
+            List[str]: Names of the stages
+        """
+        return [
+            f"{stage.__class__.__name__}[{i}]" for i, stage in enumerate(self.stages)
+        ]
+
+    def _build_dependencies(self) -> None:
+        """Builds the stage dependency graph from the inputs and outputs of the configuration.
+           Every computed value gets a unique key (name@stage), such that a stage always reads
+           the last value computed before it in the configuration, even if a later stage
+           overwrites the same name.
+        """
+        latest: Dict[str, str] = dict()
+        producers: Dict[str, int] = dict()
+        self.stage_input_keys: List[List[str]] = list()
+        self.stage_output_keys: List[List[str]] = list()
+        self.stage_parents: List[List[int]] = list()
+        for i, config in enumerate(self.stage_configs):
+            input_keys = [latest.get(k, k) for k in config["inputs"]]
+            self.stage_input_keys.append(input_keys)
+            self.stage_parents.append(
+                sorted({producers[k] for k in input_keys if k in producers})
+            )
+            output_keys = [f"{k}@{i}" for k in config.get("outputs", [])]
+            for key, output_key in zip(config.get("outputs", []), output_keys):
+                latest[key] = output_key
+                producers[output_key] = i
+            self.stage_output_keys.append(output_keys)
+        self.output_keys = {k: latest.get(k, k) for k in self.outputs}
+        self.stage_children: List[List[int]] = [list() for _ in self.stages]
+        for i, parents in enumerate(self.stage_parents):
+            for parent in parents:
+                self.stage_children[parent].append(i)
+
+    def critical_path(
+        self, stage_times: Optional[List[float]] = None
+    ) -> Tuple[List[str], float]:
+        """Computes the longest chain of dependent stages of the pipeline
+
+        Args:
+            stage_times (Optional[List[float]], optional): Duration of every stage. If None, the
+                durations measured during the last call of run are used, or a unit duration per
+                stage if run was never called. Defaults to None.
+
+        Returns:
+            Tuple[List[str], float]: Names of the stages on the critical path, total duration of the path
+        """
+        if stage_times is None:
+            if any(t is None for t in self.stage_times):
+                stage_times = [1.0] * len(self.stages)
+            else:
+                stage_times = self.stage_times
+        if len(self.stages) == 0:
+            return [], 0.0
+        finish_times = list()
+        predecessors: List[Optional[int]] = list()
+        # stages are topologically ordered by construction
+        for i, parents in enumerate(self.stage_parents):
+            predecessor = max(parents, key=lambda p: finish_times[p], default=None)
+            start_time = 0.0 if predecessor is None else finish_times[predecessor]
+            finish_times.append(start_time + stage_times[i])
+            predecessors.append(predecessor)
+        last = max(range(len(finish_times)), key=lambda i: finish_times[i])
+        path = [last]
+        while predecessors[path[-1]] is not None:
+            path.append(predecessors[path[-1]])
+        names = self.stage_names
+        return [names[i] for i in reversed(path)], finish_times[last]
+
     def precompute(self, save_intermediate: bool) -> None:
         """Run the precomputation step of the pipeline.
 
@@ -300,10 +924,250 @@ class PipelineRunner:
                 link_path=link_path,
                 precompute_path=precompute_path)
 
+    def _store_outputs(
+        self, index: int, step_output: Any, variables: Dict[str, Any]
+    ) -> None:
+        """Stores the output of a stage in the variables
+
+        Args:
+            index (int): Index of the stage
+            step_output (Any): Output of the stage
+            variables (Dict[str, Any]): Variables of the current run
+        """
+        config = self.stage_configs[index]
+        if not isinstance(step_output, tuple):
+            step_output = tuple([step_output])
+        assert len(step_output) == len(config.get("outputs", [])), (
+            f"Number of outputs in config mismatches actual number of outputs in {self.stages[index].__class__.__name__}"
+            f"Got {len(step_output)} outputs of type {list(map(type, step_output))},"
+            f"but expected {len(config.get('outputs', []))} outputs"
+        )
+        for key, value in zip(self.stage_output_keys[index], step_output):
+            variables[key] = value
+
+    def _get_step_input(self, index: int, variables: Dict[str, Any]) -> List[Any]:
+        """Inputs of a stage: read-only views of the variables, or copies if the stage
+           mutates its inputs
+
+        Args:
+            index (int): Index of the stage
+            variables (Dict[str, Any]): Variables of the current run
+
+        Returns:
+            List[Any]: Positional inputs of the stage
+        """
+        if self.stages[index]._mutates_inputs:
+            return [deepcopy(variables[k]) for k in self.stage_input_keys[index]]
+        return [_read_only(variables[k]) for k in self.stage_input_keys[index]]
+
+    def _count_consumers(self, plan: List[str]) -> Dict[str, int]:
+        """Number of stages that still have to read every variable
+
+        Args:
+            plan (List[str]): What to do for every stage, see _plan
+
+        Returns:
+            Dict[str, int]: Number of computed stages that read every variable
+        """
+        consumers: Dict[str, int] = dict()
+        for input_keys, action in zip(self.stage_input_keys, plan):
+            if action == "compute":
+                for key in input_keys:
+                    consumers[key] = consumers.get(key, 0) + 1
+        return consumers
+
+    def _free_variables(
+        self,
+        keys: Iterable[str],
+        variables: Dict[str, Any],
+        consumers: Dict[str, int],
+    ) -> None:
+        """Drops the variables that no stage reads anymore and that are not outputs of the
+           pipeline, such that their memory is freed as early as possible
+
+        Args:
+            keys (Iterable[str]): Variables to check
+            variables (Dict[str, Any]): Variables of the current run
+            consumers (Dict[str, int]): Number of stages that still have to read every variable
+        """
+        output_keys = set(self.output_keys.values())
+        for key in list(keys):
+            if consumers.get(key, 0) == 0 and key not in output_keys:
+                variables.pop(key, None)
+
+    def _release_stage(
+        self, index: int, variables: Dict[str, Any], consumers: Dict[str, int]
+    ) -> None:
+        """Marks the inputs of a computed stage as read and frees the variables of the
+           stage that have no consumers left
+
+        Args:
+            index (int): Index of the stage
+            variables (Dict[str, Any]): Variables of the current run
+            consumers (Dict[str, int]): Number of stages that still have to read every variable
+        """
+        for key in self.stage_input_keys[index]:
+            consumers[key] -= 1
+        self._free_variables(
+            self.stage_input_keys[index] + self.stage_output_keys[index],
+            variables,
+            consumers,
+        )
+
+    def _record_metrics(
+        self, index: int, metrics: Dict[str, Any], output_name: Optional[str]
+    ) -> None:
+        """Stores the measurements of a stage
+
+        Args:
+            index (int): Index of the stage
+            metrics (Dict[str, Any]): Measurements of the stage
+            output_name (Optional[str]): Unique identifier of the datapoint
+        """
+        self.stage_times[index] = metrics["wall_time"]
+        self.stage_metrics[index] = {
+            "name": output_name,
+            "stage": self.stage_names[index],
+            **metrics,
+        }
+
+    def _plan(self, output_name: Optional[str]) -> List[str]:
+        """Decides for every stage whether it has to be computed, whether its saved output
+           can be loaded or whether it can be skipped. The plan is resolved backwards from the
+           outputs of the pipeline: a stage is needed if a needed stage computes from its
+           outputs. A needed stage is loaded if its output was saved, and computed otherwise,
+           which makes its inputs needed. Stages without outputs and saving stages whose
+           output is missing are always needed, such that a run produces the same files.
+
+        Args:
+            output_name (Optional[str]): Unique identifier of the datapoint
+
+        Returns:
+            List[str]: For every stage, "compute", "load" or "skip"
+        """
+        needed_keys = set(self.output_keys.values())
+        plan = ["skip"] * len(self.stages)
+        for i in reversed(range(len(self.stages))):
+            stage = self.stages[i]
+            output_keys = self.stage_output_keys[i]
+            has_output = stage.has_output(output_name)
+            is_needed = (
+                len(output_keys) == 0
+                or any(k in needed_keys for k in output_keys)
+                or (
+                    output_name is not None
+                    and stage.save_path is not None
+                    and stage._saves_output
+                    and not has_output
+                )
+            )
+            if not is_needed:
+                continue
+            if has_output:
+                plan[i] = "load"
+            else:
+                plan[i] = "compute"
+                needed_keys.update(self.stage_input_keys[i])
+        return plan
+
+    def _run_sequentially(
+        self,
+        variables: Dict[str, Any],
+        output_name: Optional[str],
+        plan: List[str],
+        consumers: Dict[str, int],
+    ) -> None:
+        """Runs the stages in the order of the configuration
+
+        Args:
+            variables (Dict[str, Any]): Variables of the current run
+            output_name (Optional[str]): Unique identifier of the datapoint
+            plan (List[str]): What to do for every stage, see _plan
+            consumers (Dict[str, int]): Number of stages that still have to read every variable
+        """
+        for i, stage in enumerate(self.stages):
+            if plan[i] == "skip":
+                continue
+            step_input = (
+                self._get_step_input(i, variables) if plan[i] == "compute" else []
+            )
+            step_output, metrics = _process_stage(
+                stage, step_input, output_name, load=plan[i] == "load")
+            del step_input
+            self._record_metrics(i, metrics, output_name)
+            self._store_outputs(i, step_output, variables)
+            del step_output
+            if plan[i] == "compute":
+                self._release_stage(i, variables, consumers)
+            else:
+                self._free_variables(
+                    self.stage_output_keys[i], variables, consumers)
+
+    def _run_concurrently(
+        self,
+        variables: Dict[str, Any],
+        output_name: Optional[str],
+        plan: List[str],
+        consumers: Dict[str, int],
+    ) -> None:
+        """Runs the stages on an executor as soon as all the stages they depend on are done
+
+        Args:
+            variables (Dict[str, Any]): Variables of the current run
+            output_name (Optional[str]): Unique identifier of the datapoint
+            plan (List[str]): What to do for every stage, see _plan
+            consumers (Dict[str, int]): Number of stages that still have to read every variable
+        """
+        executor_class = (
+            ThreadPoolExecutor if self.executor == "thread" else ProcessPoolExecutor
+        )
+        # stages that load their output do not wait for their parents
+        nr_missing_parents = [
+            len(parents) if action == "compute" else 0
+            for parents, action in zip(self.stage_parents, plan)
+        ]
+        with executor_class(max_workers=self.max_workers) as executor:
+            running: Dict[Future, int] = dict()
+
+            def submit(index: int) -> None:
+                load = plan[index] == "load"
+                step_input = [] if load else self._get_step_input(index, variables)
+                future = executor.submit(
+                    _process_stage, self.stages[index], step_input, output_name, load
+                )
+                running[future] = index
+
+            for i, nr_missing in enumerate(nr_missing_parents):
+                if nr_missing == 0 and plan[i] != "skip":
+                    submit(i)
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = running.pop(future)
+                    step_output, metrics = future.result()
+                    self._record_metrics(i, metrics, output_name)
+                    self._store_outputs(i, step_output, variables)
+                    if plan[i] == "compute":
+                        self._release_stage(i, variables, consumers)
+                    else:
+                        self._free_variables(
+                            self.stage_output_keys[i], variables, consumers)
+                    for child in self.stage_children[i]:
+                        if plan[child] != "compute":
+                            continue
+                        nr_missing_parents[child] -= 1
+                        if nr_missing_parents[child] == 0:
+                            submit(child)
+
     def run(
         self, output_name: Optional[str] = None, **inputs: Dict[str, Any]
     ) -> Dict[str, Any]:
-        """Run the preprocessing pipeline for a given name and input parameters and return the specified outputs
+        """Run the preprocessing pipeline for a given name and input parameters and return the specified outputs.
+           Only the stages needed for the outputs are run, and saved outputs are loaded instead of
+           recomputed only where a stage that has to be recomputed consumes them (see _plan).
+           The inputs are not copied: the stages get read-only views of the arrays (or copies if
+           they declare _mutates_inputs), and every variable is freed after its last consumer.
+           The measurements of every stage are stored in self.stage_metrics (None for skipped stages).
 
         Args:
             output_name (Optional[str], optional): Unique identifier of the datapoint. Defaults to None.
@@ -320,26 +1184,585 @@ class PipelineRunner:
             assert input_name in inputs, f"{input_name} not found in keyword arguments"
 
         # Compute pipelines steps
-        variables = deepcopy(inputs)
-        for stage, config in zip(self.stages, self.stage_configs):
-            step_input = [variables[k] for k in config["inputs"]]
-            step_output = stage.process(*step_input, output_name=output_name)
-            if not isinstance(step_output, tuple):
-                step_output = tuple([step_output])
-            assert len(step_output) == len(config.get("outputs", [])), (
-                f"Number of outputs in config mismatches actual number of outputs in {stage.__class__.__name__}"
-                f"Got {len(step_output)} outputs of type {list(map(type, step_output))},"
-                f"but expected {len(config.get('outputs', []))} outputs"
+        variables = dict(inputs)
+        self.stage_times = [None] * len(self.stages)
+        self.stage_metrics = [None] * len(self.stages)
+        plan = self._plan(output_name)
+        consumers = self._count_consumers(plan)
+        self._free_variables(inputs.keys(), variables, consumers)
+        for i, action in enumerate(plan):
+            if action == "skip":
+                self.stage_times[i] = 0.0
+        logging.debug(
+            f"Plan of {output_name}: "
+            + ", ".join(f"{n}: {a}" for n, a in zip(self.stage_names, plan))
+        )
+        if self.executor is None:
+            self._run_sequentially(variables, output_name, plan, consumers)
+        else:
+            self._run_concurrently(variables, output_name, plan, consumers)
+            stage_names, path_time = self.critical_path()
+            logging.info(
+                f"Critical path of {output_name}: {' -> '.join(stage_names)} ({path_time:.2f}s)"
             )
-            for key, value in zip(config.get("outputs", []), step_output):
-                variables[key] = value
 
         # Handle output
-        for output_name in self.outputs:
+        for output_name, key in self.output_keys.items():
             assert (
-                output_name in variables
+                key in variables
             ), f"{output_name} should be returned, but was never computed"
-        return {k: variables[k] for k in self.outputs}
+        return {k: variables[v] for k, v in self.output_keys.items()}
+
+    def run_batch(
+        self,
+        batch_inputs: List[Dict[str, Any]],
+        output_names: Optional[List[Optional[str]]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Run the preprocessing pipeline for several datapoints at once and return the specified
+           outputs of every datapoint. The stages run one after the other in the order of the
+           configuration, and every stage processes all the datapoints that need it in a single
+           call (see PipelineStep.profiled_process_batch), such that the model-heavy stages fill
+           their batches with the patches of several images. All the intermediate values of the
+           datapoints are kept in memory until the end of the run.
+           The measurements of every datapoint are stored in self.batch_stage_metrics, one list
+           per datapoint like self.stage_metrics.
+
+        Args:
+            batch_inputs (List[Dict[str, Any]]): Input parameters of every datapoint
+            output_names (Optional[List[Optional[str]]], optional): Unique identifier of every
+                datapoint. Defaults to None.
+
+        Returns:
+            List[Dict[str, Any]]: Output of the pipeline for every datapoint as defined in the configuration
+        """
+        if output_names is None:
+            output_names = [None] * len(batch_inputs)
+        assert len(output_names) == len(
+            batch_inputs), "Need an output name for every datapoint"
+        for output_name, inputs in zip(output_names, batch_inputs):
+            assert (
+                output_name is None or self.final_path is not None
+            ), f"Saving is only possible when output_path has been passed to the constructor."
+            for input_name in self.inputs:
+                assert input_name in inputs, f"{input_name} not found in keyword arguments"
+
+        batch_variables = [dict(inputs) for inputs in batch_inputs]
+        plans = [self._plan(output_name) for output_name in output_names]
+        batch_consumers = [self._count_consumers(plan) for plan in plans]
+        for inputs, variables, consumers in zip(
+            batch_inputs, batch_variables, batch_consumers
+        ):
+            self._free_variables(inputs.keys(), variables, consumers)
+        self.batch_stage_metrics: List[List[Optional[Dict[str, Any]]]] = [
+            [None] * len(self.stages) for _ in batch_inputs
+        ]
+        for i, stage in enumerate(self.stages):
+            to_compute = list()
+            for j, plan in enumerate(plans):
+                if plan[i] == "compute":
+                    to_compute.append(j)
+                elif plan[i] == "load":
+                    step_output, metrics = stage.profiled_load(output_names[j])
+                    self._store_outputs(i, step_output, batch_variables[j])
+                    self._free_variables(
+                        self.stage_output_keys[i], batch_variables[j], batch_consumers[j])
+                    self.batch_stage_metrics[j][i] = {
+                        "name": output_names[j],
+                        "stage": self.stage_names[i],
+                        **metrics,
+                    }
+            if len(to_compute) == 0:
+                continue
+            step_outputs, batch_metrics = stage.profiled_process_batch(
+                [tuple(self._get_step_input(i, batch_variables[j])) for j in to_compute],
+                [output_names[j] for j in to_compute],
+            )
+            for j, step_output, metrics in zip(to_compute, step_outputs, batch_metrics):
+                self._store_outputs(i, step_output, batch_variables[j])
+                self._release_stage(i, batch_variables[j], batch_consumers[j])
+                self.batch_stage_metrics[j][i] = {
+                    "name": output_names[j],
+                    "stage": self.stage_names[i],
+                    **metrics,
+                }
+
+        for output_name, key in self.output_keys.items():
+            for variables in batch_variables:
+                assert (
+                    key in variables
+                ), f"{output_name} should be returned, but was never computed"
+        return [
+            {k: variables[v] for k, v in self.output_keys.items()}
+            for variables in batch_variables
+        ]
+
+    def _start_datapoint(
+        self, index: int, name: Any, inputs: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """State of a datapoint that flows through the stages of run_pipelined
+
+        Args:
+            index (int): Position of the datapoint
+            name (Any): Unique identifier of the datapoint
+            inputs (Dict[str, Any]): Input parameters of the datapoint
+
+        Returns:
+            Dict[str, Any]: Position, name, variables, plan, consumers and measurements of the datapoint
+        """
+        for input_name in self.inputs:
+            assert input_name in inputs, f"{input_name} not found in keyword arguments"
+        output_name = name if self.final_path is not None else None
+        plan = self._plan(output_name)
+        consumers = self._count_consumers(plan)
+        variables = dict(inputs)
+        self._free_variables(inputs.keys(), variables, consumers)
+        return {
+            "index": index,
+            "name": name,
+            "output_name": output_name,
+            "variables": variables,
+            "plan": plan,
+            "consumers": consumers,
+            "metrics": [None] * len(self.stages),
+        }
+
+    def _run_stage_on_datapoint(self, index: int, datapoint: Dict[str, Any]) -> None:
+        """Runs a stage of run_pipelined for a datapoint, according to the plan of the datapoint
+
+        Args:
+            index (int): Index of the stage
+            datapoint (Dict[str, Any]): State of the datapoint, see _start_datapoint
+        """
+        action = datapoint["plan"][index]
+        if action == "skip":
+            return
+        variables = datapoint["variables"]
+        step_input = (
+            self._get_step_input(index, variables) if action == "compute" else []
+        )
+        step_output, metrics = _process_stage(
+            self.stages[index],
+            step_input,
+            datapoint["output_name"],
+            load=action == "load",
+        )
+        del step_input
+        datapoint["metrics"][index] = {
+            "name": datapoint["name"],
+            "stage": self.stage_names[index],
+            **metrics,
+        }
+        self._store_outputs(index, step_output, variables)
+        del step_output
+        if action == "compute":
+            self._release_stage(index, variables, datapoint["consumers"])
+        else:
+            self._free_variables(
+                self.stage_output_keys[index], variables, datapoint["consumers"])
+
+    def run_pipelined(
+        self,
+        datapoints: Iterable[Tuple[Any, Dict[str, Any]]],
+        queue_size: int = 2,
+        preserve_order: bool = False,
+    ) -> Iterable[Tuple[Any, Dict[str, Any], List[Dict[str, Any]]]]:
+        """Runs the pipeline for a stream of datapoints with the stages working on different
+           datapoints at the same time: every stage runs on its own threads (one by default,
+           "workers: n" in the configuration of a stage) and passes the datapoints to the next
+           stage through a bounded queue. The next image can thus be decoded while the current
+           one is in nuclei extraction, and an image can be in nuclei extraction while the
+           previous one is in graph building. Most of the work of the stages (image decoding,
+           numpy, opencv, torch and h5 I/O) releases the GIL. A stage with several workers
+           shares its step between threads, and the datapoints leave it in any order.
+           When a queue is full, the stage before it waits (backpressure), such that at most
+           about queue_size datapoints per stage are in memory. When a stage fails, all the
+           stages stop and the error is raised. The names are the output names of the
+           datapoints if the runner saves outputs.
+
+        Args:
+            datapoints (Iterable[Tuple[Any, Dict[str, Any]]]): Names and input parameters of the datapoints.
+                It is consumed lazily.
+            queue_size (int, optional): Maximum number of datapoints waiting in front of every stage.
+                Defaults to 2.
+            preserve_order (bool, optional): Whether to yield the datapoints in the order of the input.
+                Otherwise, they are yielded as soon as they are done. Defaults to False.
+
+        Returns:
+            Iterable[Tuple[Any, Dict[str, Any], List[Dict[str, Any]]]]: Name, output of the pipeline
+                as defined in the configuration and measurements of the stages of every datapoint
+        """
+        assert queue_size > 0, "queue_size must be positive"
+        stop = threading.Event()
+        errors: List[BaseException] = list()
+        lock = threading.Lock()
+        # queue i feeds stage i, the last queue collects the finished datapoints
+        queues: List[Queue] = [
+            Queue(maxsize=queue_size) for _ in range(len(self.stages) + 1)
+        ]
+        running_workers = list(self.stage_workers)
+
+        def fail(error: BaseException) -> None:
+            with lock:
+                errors.append(error)
+            stop.set()
+
+        def put(queue: Queue, item: Any) -> bool:
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    continue
+            return False
+
+        def get(queue: Queue) -> Any:
+            while not stop.is_set():
+                try:
+                    return queue.get(timeout=0.1)
+                except Empty:
+                    continue
+            return None
+
+        def feed() -> None:
+            try:
+                for index, (name, inputs) in enumerate(datapoints):
+                    if not put(queues[0], self._start_datapoint(index, name, inputs)):
+                        return
+                put(queues[0], _END_OF_DATAPOINTS)
+            except BaseException as error:
+                fail(error)
+
+        def work(stage_index: int) -> None:
+            try:
+                while True:
+                    datapoint = get(queues[stage_index])
+                    if datapoint is None:
+                        return
+                    if datapoint is _END_OF_DATAPOINTS:
+                        # the last worker of the stage passes the end on to the next stage,
+                        # the others give it back to their siblings
+                        with lock:
+                            running_workers[stage_index] -= 1
+                            is_last = running_workers[stage_index] == 0
+                        put(queues[stage_index + int(is_last)], _END_OF_DATAPOINTS)
+                        return
+                    self._run_stage_on_datapoint(stage_index, datapoint)
+                    if not put(queues[stage_index + 1], datapoint):
+                        return
+            except BaseException as error:
+                fail(error)
+
+        threads = [threading.Thread(target=feed, daemon=True)]
+        for i, nr_workers in enumerate(self.stage_workers):
+            threads.extend(
+                threading.Thread(target=work, args=(i,), daemon=True)
+                for _ in range(nr_workers)
+            )
+        for thread in threads:
+            thread.start()
+        finished: Dict[int, Dict[str, Any]] = dict()
+        next_index = 0
+        try:
+            while True:
+                datapoint = get(queues[-1])
+                if datapoint is None or datapoint is _END_OF_DATAPOINTS:
+                    break
+                finished[datapoint["index"]] = datapoint
+                if preserve_order:
+                    ready = list()
+                    while next_index in finished:
+                        ready.append(finished.pop(next_index))
+                        next_index += 1
+                else:
+                    ready = [finished.pop(datapoint["index"])]
+                for datapoint in ready:
+                    variables = datapoint["variables"]
+                    for output_name, key in self.output_keys.items():
+                        assert (
+                            key in variables
+                        ), f"{output_name} should be returned, but was never computed"
+                    yield (
+                        datapoint["name"],
+                        {k: variables[v] for k, v in self.output_keys.items()},
+                        [m for m in datapoint["metrics"] if m is not None],
+                    )
+            if errors:
+                raise errors[0]
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+
+# Minimum size in bytes of the output arrays that workers send through shared memory
+SHARED_MEMORY_THRESHOLD = 1 << 20
+
+# Pipeline of the current worker process, built once by _init_worker
+_WORKER_PIPELINE: Optional[PipelineRunner] = None
+
+
+def _init_worker(
+    pipeline_config: Dict[str, Any],
+    save_path: Optional[str],
+    save_intermediate: bool,
+    trace_memory: bool = False,
+) -> None:
+    """Initializes a worker process of the BatchPipelineRunner by building its
+       PipelineRunner once, such that all stages (and their models) are reused for every row
+
+    Args:
+        pipeline_config (Dict[str, Any]): Configuration of the pipeline
+        save_path (Optional[str]): Path to save the outputs to
+        save_intermediate (bool): Whether to save intermediate outputs
+        trace_memory (bool, optional): Whether to trace the allocations with tracemalloc. Defaults to False.
+    """
+    # Disable multiprocessing
+    os.environ["OPENBLAS_NUM_THREADS"] = "1"
+    os.environ["MKL_NUM_THREADS"] = "1"
+    os.environ["OMP_NUM_THREADS"] = "1"
+
+    if trace_memory:
+        tracemalloc.start()
+
+    global _WORKER_PIPELINE
+    _WORKER_PIPELINE = BatchPipelineRunner(
+        pipeline_config=pipeline_config,
+        save_path=save_path,
+        save_intermediate=save_intermediate,
+    )._build_pipeline_runner()
+
+
+class _SharedArray:
+    """Reference to an array that a worker process placed in shared memory"""
+
+    def __init__(
+        self, name: str, shape: Tuple[int, ...], dtype: str, is_tensor: bool
+    ) -> None:
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+        self.is_tensor = is_tensor
+
+
+def _share_arrays(obj: Any, threshold: Optional[int]) -> Any:
+    """Moves the large numpy arrays and CPU tensors of a (nested) output into shared memory,
+       such that they do not need to be pickled to send them to the main process
+
+    Args:
+        obj (Any): Output to send
+        threshold (Optional[int]): Minimum size in bytes of the arrays to share. None disables sharing.
+
+    Returns:
+        Any: Output with the large arrays replaced by _SharedArray references
+    """
+    if threshold is None:
+        return obj
+    if isinstance(obj, tuple):
+        return tuple(_share_arrays(item, threshold) for item in obj)
+    if isinstance(obj, list):
+        return [_share_arrays(item, threshold) for item in obj]
+    if isinstance(obj, dict):
+        return {k: _share_arrays(v, threshold) for k, v in obj.items()}
+    is_tensor = (
+        type(obj).__module__.startswith("torch")
+        and hasattr(obj, "numpy")
+        and getattr(obj, "device", None) is not None
+        and obj.device.type == "cpu"
+    )
+    array = obj.detach().numpy() if is_tensor else obj
+    if not isinstance(array, np.ndarray) or array.nbytes < max(threshold, 1):
+        return obj
+    from multiprocessing import shared_memory
+
+    memory = shared_memory.SharedMemory(create=True, size=array.nbytes)
+    np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)[...] = array
+    shared_array = _SharedArray(
+        memory.name, array.shape, array.dtype.str, is_tensor)
+    memory.close()
+    return shared_array
+
+
+def _unshare_arrays(obj: Any) -> Any:
+    """Copies the arrays placed in shared memory by _share_arrays out of it and frees the memory
+
+    Args:
+        obj (Any): Received output
+
+    Returns:
+        Any: Output with the _SharedArray references replaced by the arrays
+    """
+    if isinstance(obj, tuple):
+        return tuple(_unshare_arrays(item) for item in obj)
+    if isinstance(obj, list):
+        return [_unshare_arrays(item) for item in obj]
+    if isinstance(obj, dict):
+        return {k: _unshare_arrays(v) for k, v in obj.items()}
+    if not isinstance(obj, _SharedArray):
+        return obj
+    from multiprocessing import shared_memory
+
+    memory = shared_memory.SharedMemory(name=obj.name)
+    try:
+        array = np.ndarray(obj.shape, dtype=obj.dtype, buffer=memory.buf).copy()
+    finally:
+        memory.close()
+        memory.unlink()
+    if obj.is_tensor:
+        import torch
+
+        return torch.from_numpy(array)
+    return array
+
+
+def _run_row(
+    pipeline: PipelineRunner, name: Any, row: Dict[str, Any]
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Runs the pipeline for a single row of the metadata. The outputs are only
+       saved under the name if the pipeline saves outputs.
+
+    Args:
+        pipeline (PipelineRunner): Pipeline to run
+        name (Any): Unique identifier of the datapoint
+        row (Dict[str, Any]): Inputs of the datapoint
+
+    Returns:
+        Tuple[Dict[str, Any], List[Dict[str, Any]]]: Output of the pipeline, measurements of every stage
+    """
+    output_name = name if pipeline.final_path is not None else None
+    out = pipeline.run(output_name=output_name, **row)
+    metrics = [m for m in pipeline.stage_metrics if m is not None]
+    for stage_metrics in metrics:
+        stage_metrics["name"] = name
+    return out, metrics
+
+
+def _run_rows(
+    pipeline: PipelineRunner, rows: List[Tuple[Any, Dict[str, Any]]]
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Runs the pipeline for several rows of the metadata at once (see PipelineRunner.run_batch)
+
+    Args:
+        pipeline (PipelineRunner): Pipeline to run
+        rows (List[Tuple[Any, Dict[str, Any]]]): Names and inputs of the datapoints
+
+    Returns:
+        Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]: Output of the pipeline for every row,
+            measurements of every stage
+    """
+    if len(rows) == 1:
+        out, metrics = _run_row(pipeline, *rows[0])
+        return [out], metrics
+    names = [name for name, _ in rows]
+    outs = pipeline.run_batch(
+        [row for _, row in rows],
+        output_names=names if pipeline.final_path is not None else None,
+    )
+    metrics = list()
+    for name, row_metrics in zip(names, pipeline.batch_stage_metrics):
+        for stage_metrics in row_metrics:
+            if stage_metrics is not None:
+                stage_metrics["name"] = name
+                metrics.append(stage_metrics)
+    return outs, metrics
+
+
+def _iter_rows(
+    pipeline: PipelineRunner,
+    rows: Iterable[Tuple[Any, Dict[str, Any]]],
+    batch_rows: int = 1,
+    pipelined: bool = False,
+    preserve_order: bool = True,
+) -> Iterable[Tuple[List[Tuple[Any, Dict[str, Any]]], List[Dict[str, Any]]]]:
+    """Runs the pipeline for rows of the metadata, either in groups of batch_rows rows that
+       run through the stages together or pipelined (see PipelineRunner.run_pipelined)
+
+    Args:
+        pipeline (PipelineRunner): Pipeline to run
+        rows (Iterable[Tuple[Any, Dict[str, Any]]]): Names and inputs of the datapoints
+        batch_rows (int, optional): Number of rows that run through the stages together. Defaults to 1.
+        pipelined (bool, optional): Whether the stages work on different rows at the same time.
+            Defaults to False.
+        preserve_order (bool, optional): Whether pipelined rows are yielded in the order of the
+            input. Defaults to True.
+
+    Returns:
+        Iterable[Tuple[List[Tuple[Any, Dict[str, Any]]], List[Dict[str, Any]]]]: Names and outputs
+            of the processed rows, measurements of every stage
+    """
+    assert batch_rows > 0, "batch_rows must be positive"
+    assert not (
+        pipelined and batch_rows > 1
+    ), "Rows are either batched or pipelined, not both"
+    if pipelined:
+        for name, out, metrics in pipeline.run_pipelined(
+            rows, preserve_order=preserve_order
+        ):
+            yield [(name, out)], metrics
+        return
+    rows = iter(rows)
+    group = list(islice(rows, batch_rows))
+    while group:
+        outs, metrics = _run_rows(pipeline, group)
+        yield [(name, out) for (name, _), out in zip(group, outs)], metrics
+        group = list(islice(rows, batch_rows))
+
+
+def _worker_task(
+    chunk: List[Tuple[Any, Dict[str, Any]]],
+    return_out: bool = False,
+    shared_memory_threshold: Optional[int] = None,
+    batch_rows: int = 1,
+    pipelined: bool = False,
+) -> Tuple[List[Tuple[Any, Any]], List[Dict[str, Any]]]:
+    """Runs the pipeline of the current worker process for a chunk of rows
+
+    Args:
+        chunk (List[Tuple[Any, Dict[str, Any]]]): Names and inputs of the datapoints to process
+        return_out (bool, optional): Whether to send the outputs back. Defaults to False.
+        shared_memory_threshold (Optional[int], optional): Minimum size in bytes of the output arrays
+            to send through shared memory. None disables sharing. Defaults to None.
+        batch_rows (int, optional): Number of rows of the chunk that run through the stages
+            together. Defaults to 1.
+        pipelined (bool, optional): Whether the stages work on different rows of the chunk at
+            the same time. Defaults to False.
+
+    Returns:
+        Tuple[List[Tuple[Any, Any]], List[Dict[str, Any]]]: Names and outputs (None if return_out
+            is False) of the processed datapoints, measurements of every stage
+    """
+    assert (
+        _WORKER_PIPELINE is not None
+    ), "Worker process was not initialized with _init_worker"
+    results = list()
+    metrics = list()
+    for rows_results, rows_metrics in _iter_rows(
+        _WORKER_PIPELINE, chunk, batch_rows=batch_rows, pipelined=pipelined
+    ):
+        metrics.extend(rows_metrics)
+        for name, out in rows_results:
+            results.append(
+                (name, _share_arrays(out, shared_memory_threshold) if return_out else None)
+            )
+    return results, metrics
+
+
+def _chunk_rows(
+    metadata: pd.DataFrame, chunksize: int
+) -> Iterable[List[Tuple[Any, Dict[str, Any]]]]:
+    """Splits the rows of a metadata dataframe into chunks of plain (name, inputs) tuples
+
+    Args:
+        metadata (pd.DataFrame): Dataframe with the columns as defined in the config inputs
+        chunksize (int): Number of rows per chunk
+
+    Returns:
+        Iterable[List[Tuple[Any, Dict[str, Any]]]]: Chunks of rows
+    """
+    rows = zip(metadata.index, metadata.to_dict(orient="records"))
+    chunk = list(islice(rows, chunksize))
+    while chunk:
+        yield chunk
+        chunk = list(islice(rows, chunksize))
 
 
 class BatchPipelineRunner:
@@ -374,22 +1797,6 @@ class BatchPipelineRunner:
             **config,
         )
 
-    def _worker_task(self, data: Tuple[Any, pd.core.series.Series]) -> None:
-        """Runs the task of a single worker
-
-        Args:
-            data (Tuple[Any, pd.core.series.Series]): The index and row of the dataframe,
-                                                      as returned from df.iterrows()
-        """
-        # Disable multiprocessing
-        os.environ["OPENBLAS_NUM_THREADS"] = "1"
-        os.environ["MKL_NUM_THREADS"] = "1"
-        os.environ["OMP_NUM_THREADS"] = "1"
-
-        name, row = data
-        pipeline = self._build_pipeline_runner()
-        pipeline.run(output_name=name, **row)
-
     def link_output(self, link_directory: str) -> None:
         """Creates a symlink between the output directory of the pipeline and the provided path.
            Overwrites link if it already exists.
@@ -419,51 +1826,527 @@ class BatchPipelineRunner:
         tmp_runner = self._build_pipeline_runner()
         tmp_runner.precompute(self.save_intermediate)
 
+    def _run_worker_pool(
+        self,
+        metadata: pd.DataFrame,
+        cores: int,
+        chunksize: int,
+        trace_memory: bool = False,
+        return_out: bool = False,
+        preserve_order: bool = False,
+        max_in_flight: Optional[int] = None,
+        shared_memory_threshold: Optional[int] = None,
+        batch_rows: int = 1,
+        pipelined: bool = False,
+    ) -> Iterable[Tuple[List[Tuple[Any, Any]], List[Dict[str, Any]]]]:
+        """Runs the pipeline on a pool of worker processes and yields the results chunk by chunk
+
+        Args:
+            metadata (pd.DataFrame): Dataframe with the columns as defined in the config inputs
+            cores (int): Number of worker processes
+            chunksize (int): Number of rows sent to a worker at once
+            trace_memory (bool, optional): Whether to trace the allocations with tracemalloc. Defaults to False.
+            return_out (bool, optional): Whether to send the outputs back. Defaults to False.
+            preserve_order (bool, optional): Whether to yield the chunks in the order of the metadata
+                instead of as soon as they are done. Defaults to False.
+            max_in_flight (Optional[int], optional): Maximum number of chunks that are submitted or
+                done but not yet yielded. If None, 2 chunks per worker. Defaults to None.
+            shared_memory_threshold (Optional[int], optional): Minimum size in bytes of the output
+                arrays to send through shared memory. None disables sharing. Defaults to None.
+            batch_rows (int, optional): Number of rows of a chunk that run through the stages
+                together. Defaults to 1.
+            pipelined (bool, optional): Whether the stages work on different rows of a chunk at
+                the same time. Defaults to False.
+
+        Returns:
+            Iterable[Tuple[List[Tuple[Any, Any]], List[Dict[str, Any]]]]: Names and outputs of the
+                datapoints of a chunk, measurements of the chunk
+        """
+        if max_in_flight is None:
+            max_in_flight = 2 * cores
+        assert max_in_flight > 0, "max_in_flight must be positive"
+        chunks = enumerate(_chunk_rows(metadata, chunksize))
+        done: Queue = Queue()
+        finished: Dict[int, Any] = dict()
+        nr_submitted = 0
+        nr_yielded = 0
+        next_index = 0
+        # the workers share the resource tracker of this process, which owns the shared
+        # memory of the outputs and frees what was not unlinked when the process exits
+        from multiprocessing import resource_tracker
+
+        resource_tracker.ensure_running()
+        worker_pool = multiprocessing.Pool(
+            cores,
+            initializer=_init_worker,
+            initargs=(
+                self.pipeline_config,
+                self.save_path,
+                self.save_intermediate,
+                trace_memory,
+            ),
+        )
+
+        def on_result(index: int, result: Any) -> None:
+            done.put((index, result, None))
+
+        def on_error(index: int, error: BaseException) -> None:
+            done.put((index, None, error))
+
+        def submit() -> None:
+            nonlocal nr_submitted
+            for index, chunk in islice(chunks, 1):
+                worker_pool.apply_async(
+                    _worker_task,
+                    (chunk, return_out, shared_memory_threshold, batch_rows, pipelined),
+                    callback=partial(on_result, index),
+                    error_callback=partial(on_error, index),
+                )
+                nr_submitted += 1
+
+        try:
+            for _ in range(max_in_flight):
+                submit()
+            while nr_yielded < nr_submitted:
+                index, result, error = done.get()
+                if error is not None:
+                    raise error
+                finished[index] = result
+                ready = list()
+                if preserve_order:
+                    while next_index in finished:
+                        ready.append(next_index)
+                        next_index += 1
+                else:
+                    ready.append(index)
+                for index in ready:
+                    result = finished.pop(index)
+                    nr_yielded += 1
+                    submit()
+                    yield result
+            worker_pool.close()
+        except BaseException:
+            worker_pool.terminate()
+            raise
+        finally:
+            worker_pool.join()
+            # free the shared memory of the outputs that were never yielded
+            for results, _ in finished.values():
+                for _, out in results:
+                    _unshare_arrays(out)
+
+    def iter_run(
+        self,
+        metadata: pd.DataFrame,
+        cores: int = 1,
+        preserve_order: bool = False,
+        max_in_flight: Optional[int] = None,
+        chunksize: int = 1,
+        shared_memory_threshold: Optional[int] = SHARED_MEMORY_THRESHOLD,
+        batch_rows: int = 1,
+        pipelined: bool = False,
+    ) -> Iterable[Tuple[Any, Dict[str, Any]]]:
+        """Runs the pipeline for the provided metadata dataframe and yields the outputs of every
+           datapoint as soon as they are available, such that they can be consumed while the
+           workers keep processing. The measurements of the stages are appended to self.metrics.
+
+        Args:
+            metadata (pd.DataFrame): Dataframe with the columns as defined in the config inputs
+            cores (int, optional): Number of cores to use for multiprocessing. Defaults to 1.
+            preserve_order (bool, optional): Whether to yield the outputs in the order of the
+                metadata. Otherwise, they are yielded as the workers finish. Defaults to False.
+            max_in_flight (Optional[int], optional): Maximum number of chunks that are being
+                processed or waiting to be yielded, which bounds the memory of the buffered
+                outputs. If None, 2 chunks per worker. Defaults to None.
+            chunksize (int, optional): Number of rows sent to a worker at once. Defaults to 1.
+            shared_memory_threshold (Optional[int], optional): Output arrays (and CPU tensors)
+                of at least this many bytes are sent from the workers through shared memory
+                instead of being pickled. None disables shared memory. Defaults to 1 MiB.
+            batch_rows (int, optional): Number of rows that run through the stages together
+                (see PipelineRunner.run_batch), such that the model-heavy stages batch the
+                patches of several images. With several cores, the rows are batched within
+                the chunks of the workers, so chunksize should be a multiple of it. Defaults to 1.
+            pipelined (bool, optional): Whether the stages work on different rows at the same time
+                (see PipelineRunner.run_pipelined). With several cores, the rows of a chunk are
+                pipelined within a worker. Defaults to False.
+
+        Returns:
+            Iterable[Tuple[Any, Dict[str, Any]]]: Name of the datapoint (index of the metadata)
+                and output of the pipeline as defined in the configuration
+        """
+        self.metrics: List[Dict[str, Any]] = list()
+        if cores == 1:
+            pipeline = self._build_pipeline_runner()
+            for results, metrics in _iter_rows(
+                pipeline,
+                zip(metadata.index, metadata.to_dict(orient="records")),
+                batch_rows=batch_rows,
+                pipelined=pipelined,
+                preserve_order=preserve_order,
+            ):
+                self.metrics.extend(metrics)
+                yield from results
+        else:
+            for results, metrics in self._run_worker_pool(
+                metadata,
+                cores,
+                chunksize,
+                return_out=True,
+                preserve_order=preserve_order,
+                max_in_flight=max_in_flight,
+                shared_memory_threshold=shared_memory_threshold,
+                batch_rows=batch_rows,
+                pipelined=pipelined,
+            ):
+                self.metrics.extend(metrics)
+                outputs = [(name, _unshare_arrays(out)) for name, out in results]
+                yield from outputs
+
     def run(
-        self, metadata: pd.DataFrame, cores: int = 1, return_out: bool = False
+        self,
+        metadata: pd.DataFrame,
+        cores: int = 1,
+        return_out: bool = False,
+        chunksize: Optional[int] = None,
+        trace_path: Union[None, str, Path] = None,
+        trace_memory: bool = False,
+        batch_rows: int = 1,
+        pipelined: bool = False,
     ) -> Optional[Dict[str, Dict[str, Any]]]:
         """Runs the pipeline for the provided metadata dataframe and a specified
            number of cores for multiprocessing.
-           Does not support saving of outputs
+           Does not support saving of outputs.
+           The measurements of every stage and datapoint are stored in self.metrics
+           and aggregated per stage in self.summary.
 
         Args:
             metadata (pd.DataFrame): Dataframe with the columns as defined in the config inputs
-            cores (int, optional): Number of cores to use for multiprocessing. Defaults to 1.
+            cores (int, optional): Number of cores to use for multiprocessing. Each worker process
+                builds the pipeline once and reuses it for all of its rows. Defaults to 1.
             return_out (bool, optional): If the method should also return the output batch data.
-                If True, make sure you have enough memory. Only supported
-                for single-core processing. Default to False.
+                If True, make sure you have enough memory, or use iter_run to consume the
+                outputs as they are computed. Default to False.
+            chunksize (Optional[int], optional): Number of rows sent to a worker at once when
+                cores > 1. If None, the rows are split into about 4 chunks per worker of at least
+                batch_rows rows. Defaults to None.
+            trace_path (Union[None, str, Path], optional): Path to write the measurements to as
+                JSON lines, one line per stage and datapoint. The per-stage summary is written
+                next to it as <stem>_summary.csv. If None, nothing is written. Defaults to None.
+            trace_memory (bool, optional): Whether to trace the allocations with tracemalloc
+                to measure the peak allocated memory of every stage. Slows down the processing.
+                Defaults to False.
+            batch_rows (int, optional): Number of rows that run through the stages together
+                (see PipelineRunner.run_batch), such that the model-heavy stages batch the
+                patches of several images. Their intermediate outputs are kept in memory at
+                the same time. With several cores, the rows are batched within the chunks of
+                the workers. Defaults to 1.
+            pipelined (bool, optional): Whether the stages work on different rows at the same time
+                (see PipelineRunner.run_pipelined). With several cores, the rows of a chunk are
+                pipelined within a worker. Defaults to False.
 
         Returns:
             batched_out (Optional[Dict[str, Dict[str, Any]]]): If return_out is True, returns the processed output.
                 Otherwise returns None
         """
-        assert not (
-            return_out and cores > 1
-        ), "Option to return output only supported with single-core processing."
-
         self.precompute()
+        self.metrics: List[Dict[str, Any]] = list()
+        batched_out = dict()
         if cores == 1:
-            batched_out = dict()
             pipeline = self._build_pipeline_runner()
-            for name, row in tqdm(
-                metadata.iterrows(), total=len(metadata), file=sys.stdout
-            ):
-                out = pipeline.run(output_name=name, **row)
-                if return_out:
-                    batched_out[name] = out
-            if return_out:
-                return batched_out
+            start_tracing = trace_memory and not tracemalloc.is_tracing()
+            if start_tracing:
+                tracemalloc.start()
+            try:
+                with tqdm(total=len(metadata), file=sys.stdout) as progress_bar:
+                    for results, metrics in _iter_rows(
+                        pipeline,
+                        zip(metadata.index, metadata.to_dict(orient="records")),
+                        batch_rows=batch_rows,
+                        pipelined=pipelined,
+                    ):
+                        self.metrics.extend(metrics)
+                        if return_out:
+                            for name, out in results:
+                                batched_out[name] = out
+                        progress_bar.update(len(results))
+            finally:
+                if start_tracing:
+                    tracemalloc.stop()
         else:
-            worker_pool = multiprocessing.Pool(cores)
-            for _ in tqdm(
-                worker_pool.imap_unordered(
-                    self._worker_task,
-                    metadata.iterrows(),
-                ),
-                total=len(metadata),
-                file=sys.stdout,
-            ):
-                pass
-            worker_pool.close()
-            worker_pool.join()
+            if chunksize is None:
+                chunksize = max(batch_rows, len(metadata) // (4 * cores))
+            with tqdm(total=len(metadata), file=sys.stdout) as progress_bar:
+                for results, metrics in self._run_worker_pool(
+                    metadata,
+                    cores,
+                    chunksize,
+                    trace_memory=trace_memory,
+                    return_out=return_out,
+                    shared_memory_threshold=SHARED_MEMORY_THRESHOLD,
+                    batch_rows=batch_rows,
+                    pipelined=pipelined,
+                ):
+                    self.metrics.extend(metrics)
+                    if return_out:
+                        for name, out in results:
+                            batched_out[name] = _unshare_arrays(out)
+                    progress_bar.update(len(results))
+            if return_out:
+                # same order as with a single core
+                batched_out = {
+                    name: batched_out[name] for name in metadata.index}
+
+        self.summary = summarize_metrics(self.metrics)
+        logging.info(f"Per-stage summary:\n{self.summary.to_string()}")
+        if trace_path is not None:
+            write_trace(self.metrics, trace_path)
+            trace_path = Path(trace_path)
+            self.summary.to_csv(
+                trace_path.with_name(f"{trace_path.stem}_summary.csv"))
+        if return_out:
+            return batched_out
         return None
+
+
+class _SweepVariantRunner(PipelineRunner):
+    """PipelineRunner of a variant of a sweep, whose steps are shared with the other
+       variants if they have the same class, parameters and save path"""
+
+    def __init__(self, stage_pool: Dict[str, PipelineStep], **kwargs: Any) -> None:
+        self._stage_pool = stage_pool
+        super().__init__(**kwargs)
+
+    def _build_stage(
+        self,
+        stage_class: type,
+        save_path: Optional[str],
+        use_cache: bool,
+        params: Dict[str, Any],
+    ) -> PipelineStep:
+        key = json.dumps(
+            [
+                f"{stage_class.__module__}.{stage_class.__name__}",
+                save_path,
+                use_cache,
+                params,
+            ],
+            sort_keys=True,
+            default=str,
+        )
+        if key not in self._stage_pool:
+            self._stage_pool[key] = super()._build_stage(
+                stage_class, save_path, use_cache, params
+            )
+        return self._stage_pool[key]
+
+
+class SweepPipelineRunner:
+    def __init__(
+        self,
+        variants: Dict[str, Dict[str, Any]],
+        output_path: Optional[str] = None,
+        save_intermediate: bool = False,
+        precompute: bool = True,
+        **kwargs: Any,
+    ) -> None:
+        """Runs several variants of a pipeline (e.g. the points of a parameter sweep) on the
+           same inputs. The stages of the variants are merged into a trie: variants whose first
+           stages have the same configuration share these stages, which are computed once per
+           datapoint, and only the stages after the first difference run per variant. A sweep
+           over the parameters of the graph builder thus runs the image loading, stain
+           normalization and nuclei detection once. The steps are shared as well, such that
+           a model is only loaded once.
+
+        Args:
+            variants (Dict[str, Dict[str, Any]]): Configuration of every variant (inputs, outputs
+                and stages, like for the PipelineRunner) by name
+            output_path (Optional[str], optional): Path to the outputs. Every variant saves its
+                outputs under output_path/<name of the variant>, outputs of shared stages are
+                written to all of them. When set to None the outputs are not saved. Defaults to None.
+            save_intermediate (bool, optional): Whether to save the intermediate steps. Defaults to False.
+            precompute (bool, optional): Whether to perform the precomputation steps. Defaults to True.
+            kwargs (Any): Further keyword arguments of the PipelineRunner of every variant, e.g.
+                cache_path or storage
+        """
+        assert len(variants) > 0, "Need at least one variant"
+        self.save_intermediate = save_intermediate
+        self.runners: Dict[str, PipelineRunner] = dict()
+        self.root = self._new_node()
+        stage_pool: Dict[str, PipelineStep] = dict()
+        for name, config in variants.items():
+            stage_keys = [
+                json.dumps(stage, sort_keys=True, default=str)
+                for stage in config.get("stages", [])
+            ]
+            variant_path = None
+            if output_path is not None:
+                variant_path = os.path.join(output_path, str(name))
+                os.makedirs(variant_path, exist_ok=True)
+            runner = _SweepVariantRunner(
+                stage_pool,
+                output_path=variant_path,
+                save_intermediate=save_intermediate,
+                precompute=False,
+                **kwargs,
+                **deepcopy(config),
+            )
+            self.runners[name] = runner
+            node = self.root
+            for index, stage_key in enumerate(stage_keys):
+                if stage_key not in node["children"]:
+                    node["children"][stage_key] = self._new_node()
+                node = node["children"][stage_key]
+                node["owners"].append((name, index))
+            node["ends"].append(name)
+        self.stage_metrics: List[Dict[str, Any]] = list()
+        if precompute:
+            self.precompute()
+
+    @staticmethod
+    def _new_node() -> Dict[str, Any]:
+        """Node of the trie of stages
+
+        Returns:
+            Dict[str, Any]: Children by configuration of their stage, variants (and index of the
+                stage in the variant) that run the stage of the node, variants that end at the node
+        """
+        return {"children": dict(), "owners": list(), "ends": list()}
+
+    @property
+    def nr_stages(self) -> int:
+        """Number of stages that run per datapoint, i.e. the number of nodes of the trie
+
+        Returns:
+            int: Number of distinct stages
+        """
+        nodes = [self.root]
+        count = 0
+        while nodes:
+            node = nodes.pop()
+            nodes.extend(node["children"].values())
+            count += len(node["children"])
+        return count
+
+    def precompute(self) -> None:
+        """Run the precomputation step of the pipelines of all the variants"""
+        for runner in self.runners.values():
+            runner.precompute(self.save_intermediate)
+
+    def run(
+        self, output_name: Optional[str] = None, **inputs: Dict[str, Any]
+    ) -> Dict[str, Dict[str, Any]]:
+        """Run all the variants for a given name and input parameters. Every stage of the trie
+           runs once, or is loaded if one of the variants saved its output before.
+           The measurements of every stage are stored in self.stage_metrics, with the
+           variants that share the stage under "variants".
+
+        Args:
+            output_name (Optional[str], optional): Unique identifier of the datapoint. Defaults to None.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Output of the pipeline of every variant as defined in its configuration
+        """
+        for runner in self.runners.values():
+            assert (
+                output_name is None or runner.final_path is not None
+            ), f"Saving is only possible when output_path has been passed to the constructor."
+            for input_name in runner.inputs:
+                assert input_name in inputs, f"{input_name} not found in keyword arguments"
+        self.stage_metrics = list()
+        outputs: Dict[str, Dict[str, Any]] = dict()
+        self._run_node(self.root, dict(inputs), output_name, outputs)
+        return {name: outputs[name] for name in self.runners}
+
+    def iter_run(
+        self, datapoints: Iterable[Tuple[Any, Dict[str, Any]]]
+    ) -> Iterable[Tuple[Any, Dict[str, Dict[str, Any]]]]:
+        """Run all the variants for several datapoints, one after the other. The outputs are
+           saved under the names of the datapoints if output_path was set.
+
+        Args:
+            datapoints (Iterable[Tuple[Any, Dict[str, Any]]]): Names and input parameters of the datapoints
+
+        Returns:
+            Iterable[Tuple[Any, Dict[str, Dict[str, Any]]]]: Name of the datapoint and output
+                of every variant
+        """
+        saves = any(r.final_path is not None for r in self.runners.values())
+        for name, inputs in datapoints:
+            yield name, self.run(output_name=name if saves else None, **inputs)
+
+    def _run_node(
+        self,
+        node: Dict[str, Any],
+        variables: Dict[str, Any],
+        output_name: Optional[str],
+        outputs: Dict[str, Dict[str, Any]],
+    ) -> None:
+        """Collects the outputs of the variants that end at a node and runs the stages of
+           its children, depth first
+
+        Args:
+            node (Dict[str, Any]): Node of the trie, see _new_node
+            variables (Dict[str, Any]): Variables computed by the stages from the root to the node
+            output_name (Optional[str]): Unique identifier of the datapoint
+            outputs (Dict[str, Dict[str, Any]]): Outputs of the variants to update
+        """
+        for name in node["ends"]:
+            runner = self.runners[name]
+            for key in runner.output_keys.values():
+                assert (
+                    key in variables
+                ), f"{key} should be returned by {name}, but was never computed"
+            outputs[name] = {k: variables[v] for k, v in runner.output_keys.items()}
+        for child in node["children"].values():
+            child_variables = dict(variables)
+            self._run_stage(child, child_variables, output_name)
+            self._run_node(child, child_variables, output_name, outputs)
+
+    def _run_stage(
+        self,
+        node: Dict[str, Any],
+        variables: Dict[str, Any],
+        output_name: Optional[str],
+    ) -> None:
+        """Runs the stage of a node once for all the variants that share it and writes its
+           output to the output directories of all of them
+
+        Args:
+            node (Dict[str, Any]): Node of the trie, see _new_node
+            variables (Dict[str, Any]): Variables of the stage, updated with its outputs
+            output_name (Optional[str]): Unique identifier of the datapoint
+        """
+        stages: List[PipelineStep] = list()
+        for name, index in node["owners"]:
+            stage = self.runners[name].stages[index]
+            if all(stage is not other for other in stages):
+                stages.append(stage)
+        name, index = node["owners"][0]
+        runner = self.runners[name]
+        saved = [stage for stage in stages if stage.has_output(output_name)]
+        if len(saved) > 0:
+            step_output, metrics = saved[0].profiled_load(output_name)
+        else:
+            # the first stage that saves computes, such that its output is saved as well
+            stage = next((s for s in stages if s.save_path is not None), stages[0])
+            step_output, metrics = _process_stage(
+                stage, runner._get_step_input(index, variables), output_name
+            )
+        if output_name is not None:
+            for stage in stages:
+                if (
+                    stage.save_path is not None
+                    and stage._saves_output
+                    and not stage.has_output(output_name)
+                ):
+                    stage._save_output(output_name, step_output)
+                    metrics["bytes_written"] += stage._get_output_size(output_name)
+        self.stage_metrics.append(
+            {
+                "name": output_name,
+                "stage": runner.stage_names[index],
+                "variants": [name for name, _ in node["owners"]],
+                **metrics,
+            }
+        )
+        runner._store_outputs(index, step_output, variables)
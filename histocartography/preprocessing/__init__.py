@@ -1,44 +1,52 @@
-# feature extraction
-from .feature_extraction import HandcraftedFeatureExtractor
-from .feature_extraction import DeepFeatureExtractor
-from .feature_extraction import AugmentedDeepFeatureExtractor
-from .feature_extraction import GridDeepFeatureExtractor
-from .feature_extraction import GridAugmentedDeepFeatureExtractor
-from .feature_extraction import MaskedGridDeepFeatureExtractor
+from ..utils.lazy import lazy_attributes
 
-# graph builders
-from .graph_builders import RAGGraphBuilder
-from .graph_builders import KNNGraphBuilder
+# The steps are imported from their module on first access, such that
+# lightweight steps do not import the dependencies of the model-based ones.
+_LAZY_ATTRIBUTES = {
+    # feature extraction
+    'HandcraftedFeatureExtractor': '.feature_extraction',
+    'DeepFeatureExtractor': '.feature_extraction',
+    'AugmentedDeepFeatureExtractor': '.feature_extraction',
+    'GridDeepFeatureExtractor': '.feature_extraction',
+    'GridAugmentedDeepFeatureExtractor': '.feature_extraction',
+    'MaskedGridDeepFeatureExtractor': '.feature_extraction',
 
-# io
-from .io import ImageLoader
-from .io import DGLGraphLoader
-from .io import H5Loader
+    # graph builders
+    'RAGGraphBuilder': '.graph_builders',
+    'KNNGraphBuilder': '.graph_builders',
 
-# nuclei concept extraction
-from .nuclei_concept_extraction import NucleiConceptExtractor
+    # io
+    'ImageLoader': '.io',
+    'DGLGraphLoader': '.io',
+    'H5Loader': '.io',
 
-# nuclei extraction
-from .nuclei_extraction import NucleiExtractor
+    # nuclei concept extraction
+    'NucleiConceptExtractor': '.nuclei_concept_extraction',
 
-# stain normalization
-from .stain_normalizers import MacenkoStainNormalizer
-from .stain_normalizers import VahadaneStainNormalizer
+    # nuclei extraction
+    'NucleiExtractor': '.nuclei_extraction',
 
-# stats
-from .stats import GraphDiameter
-from .stats import SuperpixelCounter
+    # stain normalization
+    'MacenkoStainNormalizer': '.stain_normalizers',
+    'VahadaneStainNormalizer': '.stain_normalizers',
 
-# superpixel
-from .superpixel import ColorMergedSuperpixelExtractor
-from .superpixel import SLICSuperpixelExtractor
+    # stats
+    'GraphDiameter': '.stats',
+    'SuperpixelCounter': '.stats',
 
-# tissue mask
-from .tissue_mask import GaussianTissueMask
-from .tissue_mask import AnnotationPostProcessor
+    # superpixel
+    'ColorMergedSuperpixelExtractor': '.superpixel',
+    'SLICSuperpixelExtractor': '.superpixel',
 
-# assignment matrix
-from .assignment_matrix import AssignmnentMatrixBuilder
+    # tissue mask
+    'GaussianTissueMask': '.tissue_mask',
+    'AnnotationPostProcessor': '.tissue_mask',
+
+    # assignment matrix
+    'AssignmnentMatrixBuilder': '.assignment_matrix',
+}
+
+__getattr__, __dir__ = lazy_attributes(__name__, _LAZY_ATTRIBUTES)
 
 __all__ = [
     'HandcraftedFeatureExtractor',
@@ -0,0 +1,85 @@
+"""Batching of the patches of several images through a model"""
+
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+
+import torch
+from torch.utils.data import ConcatDataset, DataLoader, Dataset
+from tqdm import tqdm
+
+
+class _IndexedDataset(Dataset):
+    """Helper class that tags the items of a dataset with the index of the dataset"""
+
+    def __init__(self, dataset: Dataset, dataset_index: int) -> None:
+        """
+        Args:
+            dataset (Dataset): Dataset of (key, patch) items
+            dataset_index (int): Index of the dataset in the batch of datasets
+        """
+        self.dataset = dataset
+        self.dataset_index = dataset_index
+
+    def __getitem__(self, index: int) -> Tuple[int, Any, torch.Tensor]:
+        key, patch = self.dataset[index]
+        return self.dataset_index, key, patch
+
+    def __len__(self) -> int:
+        return len(self.dataset)
+
+
+def _collate_indexed_patches(
+    batch: List[Tuple[int, Any, torch.Tensor]]
+) -> Tuple[List[int], List[Any], torch.Tensor]:
+    """Patch collate function that keeps the dataset indices and the keys as lists"""
+    dataset_indices = [item[0] for item in batch]
+    keys = [item[1] for item in batch]
+    patches = torch.stack([item[2] for item in batch])
+    return dataset_indices, keys, patches
+
+
+def iter_patch_batches(
+    datasets: Sequence[Dataset],
+    batch_size: int,
+    num_workers: int = 0,
+    verbose: bool = False,
+    desc: str = None,
+    batch_transform: Optional[Callable[[torch.Tensor], torch.Tensor]] = None,
+) -> Iterator[Tuple[List[int], List[Any], torch.Tensor]]:
+    """Yields batches of the patches of several datasets of (key, patch) items, e.g. the patches
+       of several images. The datasets are concatenated, such that all batches but the last are
+       full even if the datasets are small, and a single data loader is started for all of them.
+       The results of a batch are scattered back to the datasets with the dataset indices.
+
+    Args:
+        datasets (Sequence[Dataset]): Datasets of (key, patch) items
+        batch_size (int): Number of patches per batch
+        num_workers (int, optional): Number of workers of the data loader. Defaults to 0.
+        verbose (bool, optional): tqdm processing bar. Defaults to False.
+        desc (str, optional): Description of the processing bar. Defaults to None.
+        batch_transform (Optional[Callable[[torch.Tensor], torch.Tensor]], optional): Applied to
+            every stacked batch of patches, e.g. to convert datasets of raw patches to the input
+            of the model in one vectorized operation. Defaults to None.
+
+    Returns:
+        Iterator[Tuple[List[int], List[Any], torch.Tensor]]: Index of the dataset and key of
+            every patch of the batch, patches of the batch
+    """
+    assert batch_size > 0, "batch_size must be positive"
+    dataset = ConcatDataset(
+        [_IndexedDataset(dataset, i) for i, dataset in enumerate(datasets)]
+    )
+    if len(dataset) == 0:
+        return
+    loader = DataLoader(
+        dataset,
+        shuffle=False,
+        batch_size=batch_size,
+        num_workers=num_workers,
+        collate_fn=_collate_indexed_patches,
+    )
+    for dataset_indices, keys, patches in tqdm(
+        loader, total=len(loader), desc=desc, disable=not verbose
+    ):
+        if batch_transform is not None:
+            patches = batch_transform(patches)
+        yield dataset_indices, keys, patches
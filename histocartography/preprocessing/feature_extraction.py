@@ -2,6 +2,7 @@
 
 import copy
 import math
+import os
 import warnings
 from abc import abstractmethod
 from pathlib import Path
@@ -17,17 +18,20 @@ import torchvision
 from histocartography.preprocessing.tissue_mask import GaussianTissueMask
 from histocartography.utils import dynamic_import_from
 from scipy.stats import skew
-from skimage.feature import greycomatrix, greycoprops
 from skimage.filters.rank import entropy as Entropy
 from skimage.measure import regionprops
 from skimage.morphology import disk
-from sklearn.metrics.pairwise import euclidean_distances
 from torch import nn
 from torch.utils.data import DataLoader, Dataset
 from torchvision import transforms
 from tqdm.auto import tqdm
 
+from ..ml.inference import check_freezing, load_optimized_model, optimized_model_path
+from ..ml.registry import get_model, load_checkpoint
 from ..pipeline import PipelineStep
+from .batching import iter_patch_batches
+from .instance_features import TEXTURE_FEATURES, instance_features
+from .neighborhood import SpatialNeighborhood, get_spatial_neighborhood
 
 
 class FeatureExtractor(PipelineStep):
@@ -148,6 +152,42 @@ class FeatureExtractor(PipelineStep):
 class HandcraftedFeatureExtractor(FeatureExtractor):
     """Helper class to extract handcrafted features from instance maps"""
 
+    _cache_ignore = FeatureExtractor._cache_ignore + ("n_jobs", "executor")
+
+    def __init__(
+        self,
+        feature_names: Optional[List[str]] = None,
+        n_jobs: int = 1,
+        executor: str = "thread",
+        **kwargs,
+    ) -> None:
+        """
+        Create a handcrafted feature extractor
+
+        Args:
+            feature_names (Optional[List[str]], optional): Features to extract, in this order,
+                from HANDCRAFTED_FEATURES_NAMES. Only the computations they need are run,
+                e.g. ["area", "eccentricity"] only needs the moments of the instances. None
+                extracts all features. Defaults to None.
+            n_jobs (int, optional): Number of workers that compute the features of the
+                instances of an image, split into spatial chunks (see instance_features).
+                -1 uses all cores. Defaults to 1.
+            executor (str, optional): Whether the workers are threads ("thread") or
+                processes ("process"). Defaults to "thread".
+        """
+        assert executor in ["thread", "process"], f"Unsupported executor {executor}"
+        if feature_names is not None:
+            unknown = [n for n in feature_names if n not in HANDCRAFTED_FEATURES_NAMES]
+            assert len(unknown) == 0, f"Unknown handcrafted features {unknown}"
+            # part of the output directory name only when it differs from the default
+            self.feature_names = feature_names
+        super().__init__(**kwargs)
+        # also set when it is the default, which is not part of the output directory name
+        self.feature_names = feature_names
+        # the scheduling of the computations is not part of the output directory name
+        self.n_jobs = n_jobs
+        self.executor = executor
+
     @staticmethod
     def _color_features_per_channel(
             img_rgb_ch,
@@ -190,147 +230,107 @@ class HandcraftedFeatureExtractor(FeatureExtractor):
                           Texture: glcm_contrast, glcm_dissililarity, glcm_homogeneity, glcm_energy, glcm_ASM, glcm_dispersion
                                    (glcm = grey-level co-occurance matrix);
                           Crowdedness: mean_crowdedness, std_crowdedness
+                          or only the feature_names of the extractor, in their order.
 
         """
-        node_feat = []
-
-        img_gray = cv2.cvtColor(input_image, cv2.COLOR_RGB2GRAY)
-        img_square = np.square(input_image)
-
-        # For each instance
-        regions = regionprops(instance_map)
-
-        # pre-extract centroids to compute crowdedness
-        centroids = [r.centroid for r in regions]
-        all_mean_crowdedness, all_std_crowdedness = self._compute_crowdedness(
-            centroids)
-
-        for region_id, region in enumerate(regions):
-
-            sp_mask = instance_map[region['bbox'][0]:region['bbox'][2], region['bbox'][1]:region['bbox'][3]] == region['label'] 
-            sp_gray = img_gray[region['bbox'][0]:region['bbox'][2], region['bbox'][1]:region['bbox'][3]] * sp_mask
-
-            # Compute using mask [16 features]
-            area = region["area"]
-            convex_area = region["convex_area"]
-            eccentricity = region["eccentricity"]
-            equivalent_diameter = region["equivalent_diameter"]
-            euler_number = region["euler_number"]
-            extent = region["extent"]
-            filled_area = region["filled_area"]
-            major_axis_length = region["major_axis_length"]
-            minor_axis_length = region["minor_axis_length"]
-            orientation = region["orientation"]
-            perimeter = region["perimeter"]
-            solidity = region["solidity"]
-            convex_hull_perimeter = self._compute_convex_hull_perimeter(sp_mask)
-            roughness = convex_hull_perimeter / perimeter
-            shape_factor = 4 * np.pi * area / convex_hull_perimeter ** 2
-            ellipticity = minor_axis_length / major_axis_length
-            roundness = (4 * np.pi * area) / (perimeter ** 2)
-
-            feats_shape = [
-                area,
-                convex_area,
-                eccentricity,
-                equivalent_diameter,
-                euler_number,
-                extent,
-                filled_area,
-                major_axis_length,
-                minor_axis_length,
-                orientation,
-                perimeter,
-                solidity,
-                roughness,
-                shape_factor,
-                ellipticity,
-                roundness,
-            ]
-
-            # GLCM texture features (gray color space) [5 features]
-            glcm = greycomatrix(sp_gray, [1], [0])
-            # Filter out the first row and column
-            filt_glcm = glcm[1:, 1:, :, :]
-
-            glcm_contrast = greycoprops(filt_glcm, prop="contrast")
-            glcm_contrast = glcm_contrast[0, 0]
-            glcm_dissimilarity = greycoprops(filt_glcm, prop="dissimilarity")
-            glcm_dissimilarity = glcm_dissimilarity[0, 0]
-            glcm_homogeneity = greycoprops(filt_glcm, prop="homogeneity")
-            glcm_homogeneity = glcm_homogeneity[0, 0]
-            glcm_energy = greycoprops(filt_glcm, prop="energy")
-            glcm_energy = glcm_energy[0, 0]
-            glcm_ASM = greycoprops(filt_glcm, prop="ASM")
-            glcm_ASM = glcm_ASM[0, 0]
-            glcm_dispersion = np.std(filt_glcm)
-
-            feats_texture = [
-                glcm_contrast,
-                glcm_dissimilarity,
-                glcm_homogeneity,
-                glcm_energy,
-                glcm_ASM,
-                glcm_dispersion,
-            ]
-
-            feats_crowdedness = [
-                all_mean_crowdedness[region_id],
-                all_std_crowdedness[region_id],
-            ]
-
-            sp_feats = feats_shape + feats_texture + feats_crowdedness
-            features = np.hstack(sp_feats)
-            node_feat.append(features)
-
-        node_feat = np.vstack(node_feat)
+        feature_names = (
+            list(HANDCRAFTED_FEATURES_NAMES)
+            if self.feature_names is None
+            else self.feature_names
+        )
+        instance_names = [n for n in feature_names if n not in CROWDEDNESS_FEATURES]
+        features = dict()
+        if len(instance_names) > 0:
+            img_gray = None
+            if any(n in TEXTURE_FEATURES for n in instance_names):
+                img_gray = cv2.cvtColor(input_image, cv2.COLOR_RGB2GRAY)
+            # All the instances at once, in label order (the order of regionprops)
+            feats_instances = instance_features(
+                img_gray,
+                instance_map,
+                instance_names,
+                n_jobs=self.n_jobs,
+                executor=self.executor,
+            )
+            features.update(zip(instance_names, feats_instances.T))
+        if any(n in CROWDEDNESS_FEATURES for n in feature_names):
+            all_mean_crowdedness, all_std_crowdedness = self._compute_crowdedness(
+                get_spatial_neighborhood(instance_map))
+            features["mean_crowdedness"] = np.reshape(all_mean_crowdedness, -1)
+            features["std_crowdedness"] = np.reshape(all_std_crowdedness, -1)
+
+        node_feat = np.stack([features[n] for n in feature_names], axis=1)
         return torch.Tensor(node_feat)
 
     @staticmethod
-    def _compute_crowdedness(centroids, k=10):
-        n_centroids = len(centroids)
+    def _compute_crowdedness(neighborhood: SpatialNeighborhood, k: int = 10):
+        """Mean and standard deviation of the distances of every instance to its k nearest
+           neighbors and itself"""
+        n_centroids = len(neighborhood)
         if n_centroids < 3:
             mean_crow = np.array([[0]] * n_centroids)
             std_crow = np.array([[0]] * n_centroids)
             return mean_crow, std_crow
         if n_centroids < k:
             k = n_centroids - 2
-        dist = euclidean_distances(centroids, centroids)
-        idx = np.argpartition(dist, kth=k + 1, axis=-1)
-        x = np.take_along_axis(dist, idx, axis=-1)[:, : k + 1]
+        x, _ = neighborhood.query(min(k + 1, n_centroids))
         std_crowd = np.reshape(np.std(x, axis=1), newshape=(-1, 1))
         mean_crow = np.reshape(np.mean(x, axis=1), newshape=(-1, 1))
         return mean_crow, std_crowd
 
-    def _compute_convex_hull_perimeter(self, sp_mask):
-        """Compute the perimeter of the convex hull induced by the input mask."""
-        if cv2.__version__[0] == "3":
-            _, contours, _ = cv2.findContours(
-                np.uint8(sp_mask), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE
-            )
-        elif cv2.__version__[0] == "4":
-            contours, _ = cv2.findContours(
-                np.uint8(sp_mask), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE
-            )
-        hull = cv2.convexHull(contours[0])
-        convex_hull_perimeter = cv2.arcLength(hull, True)
-
-        return convex_hull_perimeter
-
 
 class PatchFeatureExtractor:
     """Helper class to use a CNN to extract features from an image"""
 
-    def __init__(self, architecture: str, device: torch.device) -> None:
+    def __init__(
+        self,
+        architecture: str,
+        device: torch.device,
+        optimize: bool = False,
+        input_size: Optional[int] = None,
+    ) -> None:
         """
         Create a patch feature extracter of a given architecture and put it on GPU if available.
 
         Args:
             architecture (str): String of architecture. According to torchvision.models syntax.
             device (torch.device): Torch Device.
+            optimize (bool): Fold the batch norms into the convolutions and freeze the model into
+                TorchScript. The frozen model is cached next to the weights (except for MLflow
+                models) and loaded directly by the next extractors. Needs torch>=1.8.
+                Defaults to False.
+            input_size (int): Size of the input patches, needed to optimize. Defaults to None.
         """
         self.device = device
 
+        # the models are shared by all the extractors of the process (see get_model)
+        if optimize:
+            assert input_size is not None, "Optimizing the model needs the input size"
+            check_freezing()
+            self.model, self.num_features = get_model(
+                architecture,
+                self.device,
+                f"frozen_{input_size}",
+                lambda: self._get_optimized_model(architecture, input_size),
+            )
+        else:
+            self.model, self.num_features = get_model(
+                architecture,
+                self.device,
+                "float32",
+                lambda: self._get_embedding_model(architecture),
+            )
+
+    def _get_embedding_model(self, architecture: str) -> Tuple[nn.Module, int]:
+        """
+        Load a model and remove its classifier.
+
+        Args:
+            architecture (str): String of architecture. According to torchvision.models syntax.
+
+        Returns:
+            Tuple[nn.Module, int]: Embedding model in eval mode, number of output features.
+        """
         if architecture.startswith("s3://mlflow"):
             model = self._get_mlflow_model(url=architecture)
         elif architecture.endswith(".pth"):
@@ -338,9 +338,58 @@ class PatchFeatureExtractor:
         else:
             model = self._get_torchvision_model(architecture).to(self.device)
 
-        self.num_features = self._get_num_features(model)
-        self.model = self._remove_classifier(model)
-        self.model.eval()
+        num_features = self._get_num_features(model)
+        model = self._remove_classifier(model)
+        model.eval()
+        return model, num_features
+
+    def _get_optimized_model(
+        self, architecture: str, input_size: int
+    ) -> Tuple[torch.jit.ScriptModule, int]:
+        """
+        Load the frozen embedding model, or build and cache it.
+
+        Args:
+            architecture (str): String of architecture. According to torchvision.models syntax.
+            input_size (int): Size of the input patches.
+
+        Returns:
+            Tuple[torch.jit.ScriptModule, int]: Frozen embedding model, number of output features.
+        """
+        example_input = torch.zeros(1, 3, input_size, input_size, device=self.device)
+        model = load_optimized_model(
+            lambda: self._get_embedding_model(architecture)[0],
+            example_input,
+            artifact_path=self._get_optimized_model_path(architecture, example_input),
+            source_path=architecture if architecture.endswith(".pth") else None,
+        )
+        with torch.no_grad():
+            num_features = model(example_input).reshape(1, -1).shape[1]
+        return model, num_features
+
+    @staticmethod
+    def _get_optimized_model_path(
+        architecture: str, example_input: torch.Tensor
+    ) -> Optional[str]:
+        """
+        Path of the cached optimized model: next to a local model, in the torch hub checkpoints
+        of the pretrained torchvision weights, and None (not cached) for MLflow models.
+
+        Args:
+            architecture (str): String of architecture. According to torchvision.models syntax.
+            example_input (torch.Tensor): Input batch the model is traced with.
+
+        Returns:
+            Optional[str]: Path of the optimized model.
+        """
+        if architecture.startswith("s3://mlflow"):
+            return None
+        if architecture.endswith(".pth"):
+            return optimized_model_path(architecture, example_input)
+        # torch.hub.get_dir exists in every torch that can freeze models (see check_freezing)
+        return optimized_model_path(
+            os.path.join(torch.hub.get_dir(), "checkpoints", architecture), example_input
+        )
 
     @staticmethod
     def _get_num_features(model: nn.Module) -> int:
@@ -373,7 +422,7 @@ class PatchFeatureExtractor:
         Returns:
             nn.Module: A PyTorch model.
         """
-        model = torch.load(path, map_location=self.device)
+        model = load_checkpoint(path, map_location=self.device)
         return model
 
     def _get_mlflow_model(self, url: str) -> nn.Module:
@@ -556,10 +605,12 @@ class InstanceMapPatchDataset(Dataset):
         max_x = min_x + self.patch_size
         max_y = min_y + self.patch_size
 
-        patch = copy.deepcopy(self.image[min_y:max_y, min_x:max_x])
+        patch = self.image[min_y:max_y, min_x:max_x]
 
         if self.with_instance_masking:
             instance_mask = ~(self.instance_map[min_y:max_y, min_x:max_x] == region_id)
+            # the patches are views of the image, only copy the ones that are masked
+            patch = patch.copy()
             patch[instance_mask, :] = self.fill_value
 
         return patch
@@ -653,6 +704,8 @@ class InstanceMapPatchDataset(Dataset):
 class DeepFeatureExtractor(FeatureExtractor):
     """Helper class to extract deep features from instance maps"""
 
+    _cache_ignore = FeatureExtractor._cache_ignore + ("optimize",)
+
     def __init__(
         self,
         architecture: str,
@@ -666,6 +719,7 @@ class DeepFeatureExtractor(FeatureExtractor):
         num_workers: int = 0,
         verbose: bool = False,
         with_instance_masking: bool = False,
+        optimize: bool = False,
         **kwargs,
     ) -> None:
         """
@@ -685,6 +739,11 @@ class DeepFeatureExtractor(FeatureExtractor):
             num_workers (int): Number of workers in data loader. Defaults to 0.
             verbose (bool): tqdm processing bar. Defaults to False.
             with_instance_masking (bool): If pixels outside instance should be masked. Defaults to False.
+            optimize (bool): Fold the batch norms into the convolutions and freeze the network
+                             into TorchScript, cached for the next extractors. Needs
+                             torch>=1.8. The features are the ones of the unfrozen network
+                             up to float rounding, so it is not part of the output directory
+                             name. Defaults to False.
         """
         self.architecture = self._preprocess_architecture(architecture)
         self.patch_size = patch_size
@@ -701,6 +760,7 @@ class DeepFeatureExtractor(FeatureExtractor):
         else:
             self.normalizer = None
         super().__init__(**kwargs)
+        self.optimize = optimize
 
         # Handle GPU
         cuda = torch.cuda.is_available()
@@ -713,7 +773,10 @@ class DeepFeatureExtractor(FeatureExtractor):
             self.normalizer_mean = [0.485, 0.456, 0.406]
             self.normalizer_std = [0.229, 0.224, 0.225]
         self.patch_feature_extractor = PatchFeatureExtractor(
-            architecture, device=self.device
+            architecture,
+            device=self.device,
+            optimize=optimize,
+            input_size=resize_size if resize_size is not None else patch_size,
         )
         self.fill_value = fill_value
         self.batch_size = batch_size
@@ -722,13 +785,6 @@ class DeepFeatureExtractor(FeatureExtractor):
         if self.num_workers in [0, 1]:
             torch.set_num_threads(1)
 
-    def _collate_patches(self, batch):
-        """Patch collate function"""
-        instance_indices = [item[0] for item in batch]
-        patches = [item[1] for item in batch]
-        patches = torch.stack(patches)
-        return instance_indices, patches
-
     def _extract_features(
         self,
         input_image: np.ndarray,
@@ -745,54 +801,91 @@ class DeepFeatureExtractor(FeatureExtractor):
         Returns:
             torch.Tensor: Extracted features of shape [nr_instances, nr_features]
         """
-        if self.downsample_factor != 1:
-            input_image = self._downsample(input_image, self.downsample_factor)
-            instance_map = self._downsample(
-                instance_map, self.downsample_factor)
+        return self._extract_features_batch(
+            [(input_image, instance_map)], transform=transform)[0]
 
-        image_dataset = InstanceMapPatchDataset(
-            image=input_image,
-            instance_map=instance_map,
-            resize_size=self.resize_size,
-            patch_size=self.patch_size,
-            stride=self.stride,
-            fill_value=self.fill_value,
-            mean=self.normalizer_mean,
-            std=self.normalizer_std,
-            transform=transform,
-            with_instance_masking=self.with_instance_masking,
-        )
-        image_loader = DataLoader(
-            image_dataset,
-            shuffle=False,
-            batch_size=self.batch_size,
+    def _process_batch(  # type: ignore[override]
+        self, batch_args: List[Tuple[Any, ...]]
+    ) -> List[torch.Tensor]:
+        """
+        Extract features for several images, filling the batches of the network with
+        the patches of all of them.
+
+        Args:
+            batch_args (List[Tuple[Any, ...]]): RGB input image and instance map of every datapoint.
+
+        Returns:
+            List[torch.Tensor]: Extracted features of every datapoint.
+        """
+        return self._extract_features_batch(batch_args)
+
+    def _extract_features_batch(
+        self,
+        batch_args: List[Tuple[Any, ...]],
+        transform: Optional[Callable] = None
+    ) -> List[torch.Tensor]:
+        """
+        Extract features for several RGB images and their extracted instance maps. The patches
+        of all the images go through the network in full batches and the embeddings are
+        scattered back to the instances of their image.
+
+        Args:
+            batch_args (List[Tuple[Any, ...]]): RGB input image and instance map of every datapoint.
+            transform (Callable): Transform to apply. Defaults to None.
+        Returns:
+            List[torch.Tensor]: Extracted features of shape [nr_instances, nr_features] of every datapoint.
+        """
+        image_datasets = list()
+        for input_image, instance_map in batch_args:
+            if self.downsample_factor != 1:
+                input_image = self._downsample(input_image, self.downsample_factor)
+                instance_map = self._downsample(
+                    instance_map, self.downsample_factor)
+            image_datasets.append(
+                InstanceMapPatchDataset(
+                    image=input_image,
+                    instance_map=instance_map,
+                    resize_size=self.resize_size,
+                    patch_size=self.patch_size,
+                    stride=self.stride,
+                    fill_value=self.fill_value,
+                    mean=self.normalizer_mean,
+                    std=self.normalizer_std,
+                    transform=transform,
+                    with_instance_masking=self.with_instance_masking,
+                )
+            )
+        features = [
+            torch.zeros(
+                size=(
+                    len(image_dataset.properties),
+                    self.patch_feature_extractor.num_features,
+                ),
+                dtype=torch.float32,
+                device=self.device,
+            )
+            for image_dataset in image_datasets
+        ]
+        counts = [
+            torch.zeros(len(image_dataset.properties), device=self.device)
+            for image_dataset in image_datasets
+        ]
+        for dataset_indices, instance_indices, patches in iter_patch_batches(
+            image_datasets,
+            self.batch_size,
             num_workers=self.num_workers,
-            collate_fn=self._collate_patches
-        )
-        features = torch.empty(
-            size=(
-                len(image_dataset.properties),
-                self.patch_feature_extractor.num_features,
-            ),
-            dtype=torch.float32,
-            device=self.device,
-        )
-        embeddings = dict()
-        for instance_indices, patches in tqdm(
-            image_loader, total=len(image_loader), disable=not self.verbose
+            verbose=self.verbose,
         ):
             emb = self.patch_feature_extractor(patches)
-            for j, key in enumerate(instance_indices):
-                if key in embeddings:
-                    embeddings[key][0] += emb[j]
-                    embeddings[key][1] += 1
-                else:
-                    embeddings[key] = [emb[j], 1]
-
-        for k, v in embeddings.items():
-            features[k, :] = v[0] / v[1]
-
-        return features.cpu().detach()
+            emb = emb.reshape(patches.shape[0], -1)
+            for j, (index, key) in enumerate(zip(dataset_indices, instance_indices)):
+                features[index][key, :] += emb[j]
+                counts[index][key] += 1
+
+        return [
+            (image_features / image_counts.clamp(min=1).unsqueeze(1)).cpu().detach()
+            for image_features, image_counts in zip(features, counts)
+        ]
 
 
 class AugmentedDeepFeatureExtractor(DeepFeatureExtractor):
@@ -851,6 +944,29 @@ class AugmentedDeepFeatureExtractor(DeepFeatureExtractor):
         all_features = all_features.permute(1, 0, 2)
         return all_features
 
+    def _process_batch(  # type: ignore[override]
+        self, batch_args: List[Tuple[Any, ...]]
+    ) -> List[torch.Tensor]:
+        """
+        Extract features for several images for all augmentations, filling the batches of
+        the network with the patches of all of them.
+
+        Args:
+            batch_args (List[Tuple[Any, ...]]): RGB input image and instance map of every datapoint.
+
+        Returns:
+            List[torch.Tensor]: Extracted features of shape [nr_instances, nr_augmentations, nr_features]
+                of every datapoint.
+        """
+        all_features = [
+            self._extract_features_batch(batch_args, transform=transform)
+            for transform in self.transforms
+        ]
+        return [
+            torch.stack(features).permute(1, 0, 2)
+            for features in zip(*all_features)
+        ]
+
 
 class GridPatchDataset(Dataset):
     def __init__(
@@ -979,6 +1095,8 @@ class MaskedGridPatchDataset(GridPatchDataset):
 
 
 class GridDeepFeatureExtractor(FeatureExtractor):
+    _cache_ignore = FeatureExtractor._cache_ignore + ("optimize",)
+
     def __init__(
         self,
         architecture: str,
@@ -991,6 +1109,7 @@ class GridDeepFeatureExtractor(FeatureExtractor):
         fill_value: int = 255,
         num_workers: int = 0,
         verbose: bool = False,
+        optimize: bool = False,
         **kwargs,
     ) -> None:
         """
@@ -1009,6 +1128,11 @@ class GridDeepFeatureExtractor(FeatureExtractor):
             fill_value (int): Constant pixel value for image padding. Defaults to 255.
             num_workers (int): Number of workers in data loader. Defaults to 0.
             verbose (bool): tqdm processing bar. Defaults to False.
+            optimize (bool): Fold the batch norms into the convolutions and freeze the network
+                             into TorchScript, cached for the next extractors. Needs
+                             torch>=1.8. The features are the ones of the unfrozen network
+                             up to float rounding, so it is not part of the output directory
+                             name. Defaults to False.
         """
         self.architecture = self._preprocess_architecture(architecture)
         self.patch_size = patch_size
@@ -1028,6 +1152,7 @@ class GridDeepFeatureExtractor(FeatureExtractor):
         super().__init__(**kwargs)
         if not verbose:
             self.verbose = verbose
+        self.optimize = optimize
 
         # Handle GPU
         cuda = torch.cuda.is_available()
@@ -1040,7 +1165,10 @@ class GridDeepFeatureExtractor(FeatureExtractor):
             self.normalizer_mean = [0.485, 0.456, 0.406]
             self.normalizer_std = [0.229, 0.224, 0.225]
         self.patch_feature_extractor = PatchFeatureExtractor(
-            architecture, device=self.device
+            architecture,
+            device=self.device,
+            optimize=optimize,
+            input_size=resize_size if resize_size is not None else patch_size,
         )
         self.batch_size = batch_size
         self.fill_value = fill_value
@@ -1349,6 +1477,8 @@ def _get_pad_size(size: int, patch_size: int, stride: int) -> Tuple[int, int]:
     return top_pad, bottom_pad
 
 
+CROWDEDNESS_FEATURES = ["mean_crowdedness", "std_crowdedness"]
+
 HANDCRAFTED_FEATURES_NAMES = {
     "area": 0,
     "convex_area": 1,
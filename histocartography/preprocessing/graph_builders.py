@@ -3,7 +3,7 @@
 import logging
 from abc import abstractmethod
 from pathlib import Path
-from typing import Any, Optional, Tuple, Union
+from typing import Any, BinaryIO, Optional, Tuple, Union
 
 import cv2
 import dgl
@@ -11,12 +11,12 @@ import networkx as nx
 import numpy as np
 import pandas as pd
 import torch
-from dgl.data.utils import load_graphs, save_graphs
 from skimage.measure import regionprops
-from sklearn.neighbors import kneighbors_graph
 
 from ..pipeline import PipelineStep
+from .neighborhood import get_spatial_neighborhood
 from .utils import fast_histogram
+from ..utils.graph import load_graphs_from_file, save_graphs_to_file
 
 
 LABEL = "label"
@@ -106,42 +106,21 @@ class BaseGraphBuilder(PipelineStep):
         self._build_topology(instance_map, centroids, graph)
         return graph
 
-    def _process_and_save(  # type: ignore[override]
-        self,
-        instance_map: np.ndarray,
-        features: torch.Tensor,
-        annotation: Optional[np.ndarray] = None,
-        output_name: str = None,
-    ) -> dgl.DGLGraph:
-        """Process and save in provided directory
+    def _get_output_path(self, output_name: str) -> Path:
+        """Graphs are saved as DGL binary files
+
         Args:
             output_name (str): Name of output file
-            instance_map (np.ndarray): Instance map depicting tissue components
-                                       (eg nuclei, tissue superpixels)
-            features (torch.Tensor): Features of each node. Shape (nr_nodes, nr_features)
-            annotation (Optional[np.ndarray], optional): Optional node level to include.
-                                                         Defaults to None.
-        Returns:
-            dgl.DGLGraph: [description]
         """
-        assert (
-            self.save_path is not None
-        ), "Can only save intermediate output if base_path was not None during construction"
-        output_path = self.output_dir / f"{output_name}.bin"
-        if output_path.exists():
-            logging.info(
-                f"Output of {output_name} already exists, using it instead of recomputing"
-            )
-            graphs, _ = load_graphs(str(output_path))
-            assert len(graphs) == 1
-            graph = graphs[0]
-        else:
-            graph = self._process(
-                instance_map=instance_map,
-                features=features,
-                annotation=annotation)
-            save_graphs(str(output_path), [graph])
-        return graph
+        return self.output_dir / f"{output_name}.bin"
+
+    def _read_output(self, file: Union[Path, BinaryIO]) -> dgl.DGLGraph:
+        graphs = load_graphs_from_file(file)
+        assert len(graphs) == 1
+        return graphs[0]
+
+    def _write_output(self, file: Union[Path, BinaryIO], output: dgl.DGLGraph) -> None:
+        save_graphs_to_file(file, [output])
 
     def _get_node_centroids(
             self, instance_map: np.ndarray
@@ -152,15 +131,9 @@ class BaseGraphBuilder(PipelineStep):
         Returns:
             centroids (np.ndarray): Node centroids
         """
-        regions = regionprops(instance_map)
-        centroids = np.empty((len(regions), 2))
-        for i, region in enumerate(regions):
-            center_y, center_x = region.centroid  # (y, x)
-            center_x = int(round(center_x))
-            center_y = int(round(center_y))
-            centroids[i, 0] = center_x
-            centroids[i, 1] = center_y
-        return centroids
+        # regionprops centroids (y, x), shared with the other steps on the instance map
+        centroids = get_spatial_neighborhood(instance_map).centroids
+        return np.round(centroids[:, ::-1])  # (x, y)
 
     def _set_node_centroids(
             self,
@@ -375,17 +348,17 @@ class KNNGraphBuilder(BaseGraphBuilder):
     ) -> None:
         """Build topology using (thresholded) kNN"""
 
-        # build kNN adjacency
-        adj = kneighbors_graph(
-            centroids,
-            self.k,
-            mode="distance",
-            include_self=False,
-            metric="euclidean").toarray()
+        # kNN between the instance centroids, shared with the other steps on the instance map
+        neighborhood = get_spatial_neighborhood(instance_map)
+        k = min(self.k, max(len(neighborhood) - 1, 0))
+        distances, neighbors = neighborhood.query_others(k)
 
-        # filter edges that are too far (ie larger than thresh)
+        # filter edges of length 0 and edges that are too far (ie larger than thresh)
+        keep = distances > 0
         if self.thresh is not None:
-            adj[adj > self.thresh] = 0
+            keep &= distances <= self.thresh
 
-        edge_list = np.nonzero(adj)
-        graph.add_edges(list(edge_list[0]), list(edge_list[1]))
+        sources = np.repeat(np.arange(len(neighborhood)), k)[keep.ravel()]
+        targets = neighbors[keep]
+        order = np.lexsort((targets, sources))
+        graph.add_edges(list(sources[order]), list(targets[order]))
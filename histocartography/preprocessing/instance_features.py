@@ -0,0 +1,692 @@
+"""Handcrafted features of all the instances of an instance map at once
+
+The features match the regionprops properties and the GLCM features of the instances,
+but are computed with bincounts and sorts over the pixels of all the instances instead
+of a Python loop over the regions.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import wraps
+from itertools import repeat
+from typing import TYPE_CHECKING, Any, Callable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from scipy import ndimage as ndi
+from skimage.measure import label
+
+if TYPE_CHECKING:
+    from multiprocessing import shared_memory
+
+# Euler number contribution of the 2x2 windows, indexed by the window configuration
+# 8 * top_left + 2 * top_right + 4 * bottom_left + bottom_right (8-connectivity)
+_EULER_COEFS = np.array([0, 0, 0, 0, 0, 0, -1, 0, 1, 0, 0, 0, 0, 0, -1, 0])
+
+# Perimeter weights of the border pixels, indexed by 1 + 2 * (number of border 4-neighbours)
+# + 10 * (number of border diagonal neighbours) of the same instance
+_PERIMETER_WEIGHTS = np.zeros(50)
+_PERIMETER_WEIGHTS[[5, 7, 15, 17, 25, 27]] = 1
+_PERIMETER_WEIGHTS[[21, 33]] = np.sqrt(2)
+_PERIMETER_WEIGHTS[[13, 23]] = (1 + np.sqrt(2)) / 2
+
+_NEIGHBOURS_4 = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+_NEIGHBOURS_DIAGONAL = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+SHAPE_FEATURES = [
+    "area",
+    "convex_area",
+    "eccentricity",
+    "equivalent_diameter",
+    "euler_number",
+    "extent",
+    "filled_area",
+    "major_axis_length",
+    "minor_axis_length",
+    "orientation",
+    "perimeter",
+    "solidity",
+    "roughness",
+    "shape_factor",
+    "ellipticity",
+    "roundness",
+]
+TEXTURE_FEATURES = [
+    "glcm_contrast",
+    "glcm_dissimilarity",
+    "glcm_homogeneity",
+    "glcm_energy",
+    "glcm_ASM",
+    "glcm_dispersion",
+]
+NR_SHAPE_FEATURES = len(SHAPE_FEATURES)
+NR_TEXTURE_FEATURES = len(TEXTURE_FEATURES)
+# chunks per worker of the parallel feature extraction, to balance the load
+CHUNKS_PER_JOB = 4
+
+
+class InstancePixels:
+    """Pixels of the instances of an instance map, grouped by instance in label order"""
+
+    def __init__(self, instance_map: np.ndarray) -> None:
+        """
+        Args:
+            instance_map (np.ndarray): Instance map with non-negative integer labels. The
+                background is 0 and is ignored.
+        """
+        assert instance_map.ndim == 2, "Instance map must be 2D"
+        assert np.issubdtype(instance_map.dtype, np.integer), "Instance map must be integer"
+        flat = instance_map.ravel()
+        max_label = int(flat.max()) if flat.size > 0 else 0
+        assert flat.size == 0 or flat.min() >= 0, "Instance map labels must be non-negative"
+        if max_label <= flat.size:
+            present = np.bincount(flat, minlength=max_label + 1) > 0
+            present[0] = False
+            self.labels = np.flatnonzero(present)
+            lookup = np.zeros(max_label + 1, dtype=np.int64)
+            lookup[self.labels] = np.arange(1, len(self.labels) + 1)
+            index = lookup[flat]
+        else:
+            labels, index = np.unique(flat, return_inverse=True)
+            index = index.ravel()
+            if labels[0] == 0:
+                self.labels = labels[1:]
+            else:
+                self.labels = labels
+                index = index + 1
+        # instance index + 1 of every pixel, 0 for the background
+        self.index_map = index.reshape(instance_map.shape)
+        self.nr_instances = len(self.labels)
+
+        pixels = np.flatnonzero(index)
+        pixels = pixels[np.argsort(index[pixels], kind="stable")]
+        self.instance_index = index[pixels] - 1
+        self.rows, self.cols = np.divmod(pixels, instance_map.shape[1])
+        self.area = np.bincount(self.instance_index, minlength=self.nr_instances)
+        self.starts = np.concatenate([[0], np.cumsum(self.area)])
+        if self.nr_instances > 0:
+            first = self.starts[:-1]
+            self.min_row = self.rows[first]
+            self.max_row = self.rows[self.starts[1:] - 1]
+            self.min_col = np.minimum.reduceat(self.cols, first)
+            self.max_col = np.maximum.reduceat(self.cols, first)
+        else:
+            self.min_row = self.max_row = self.min_col = self.max_col = np.zeros(0, np.int64)
+
+        # row and column relative to the bounding box, exact integer sums
+        self.local_rows = (self.rows - self.min_row[self.instance_index]).astype(np.float64)
+        self.local_cols = (self.cols - self.min_col[self.instance_index]).astype(np.float64)
+
+    def _sum(self, values: np.ndarray) -> np.ndarray:
+        """Sum of per-pixel values per instance"""
+        return np.bincount(self.instance_index, values, minlength=self.nr_instances)
+
+
+def _padded_shifts(index_map: np.ndarray, offsets: List[tuple]) -> List[np.ndarray]:
+    """Views of the zero-padded index map shifted by the given (row, col) offsets"""
+    padded = np.pad(index_map, 1)
+    height, width = index_map.shape
+    return [
+        padded[1 + dr: 1 + dr + height, 1 + dc: 1 + dc + width] for dr, dc in offsets
+    ]
+
+
+def _euler_numbers(instances: InstancePixels) -> np.ndarray:
+    """Euler number of every instance (8-connectivity), from its 2x2 windows"""
+    padded = np.pad(instances.index_map, 1)
+    corners = [padded[:-1, :-1], padded[:-1, 1:], padded[1:, :-1], padded[1:, 1:]]
+    # windows within one instance or the background contribute 0
+    mixed = np.flatnonzero(
+        ~((corners[0] == corners[1]) & (corners[0] == corners[2]) & (corners[0] == corners[3]))
+    )
+    corners = [corner.ravel()[mixed] for corner in corners]
+    euler = np.zeros(instances.nr_instances, dtype=np.int64)
+    for position, corner in enumerate(corners):
+        # count every instance of a window once, at its first corner
+        first = corner > 0
+        for previous in corners[:position]:
+            first &= corner != previous
+        config = (
+            8 * (corners[0] == corner)
+            + 2 * (corners[1] == corner)
+            + 4 * (corners[2] == corner)
+            + (corners[3] == corner)
+        )
+        euler += np.bincount(
+            corner[first] - 1,
+            _EULER_COEFS[config[first]],
+            minlength=instances.nr_instances,
+        ).astype(np.int64)
+    return euler
+
+
+def _perimeters(instances: InstancePixels) -> np.ndarray:
+    """Perimeter of every instance, like skimage.measure.perimeter with 4-connectivity"""
+    index_map = instances.index_map
+    neighbours = _padded_shifts(index_map, _NEIGHBOURS_4)
+    interior = np.ones(index_map.shape, dtype=bool)
+    for neighbour in neighbours:
+        interior &= neighbour == index_map
+    border_map = np.where(interior, 0, index_map)
+    rows, cols = np.nonzero(border_map)
+    border = border_map[rows, cols]
+    value = np.ones(len(border), dtype=np.int64)
+    for offsets, weight in [(_NEIGHBOURS_4, 2), (_NEIGHBOURS_DIAGONAL, 10)]:
+        for neighbour in _padded_shifts(border_map, offsets):
+            value += weight * (neighbour[rows, cols] == border)
+    return np.bincount(
+        border - 1, _PERIMETER_WEIGHTS[value], minlength=instances.nr_instances
+    )
+
+
+def _component_counts(instances: InstancePixels) -> np.ndarray:
+    """Number of 8-connected components of every instance"""
+    components = label(instances.index_map, background=0, connectivity=2)
+    component_index = np.zeros(components.max() + 1, dtype=np.int64)
+    component_index[components] = instances.index_map
+    return np.bincount(component_index[1:] - 1, minlength=instances.nr_instances)
+
+
+def _filled_areas(instances: InstancePixels, euler: np.ndarray) -> np.ndarray:
+    """Area of every instance with its holes filled. The Euler number is the number of
+    components minus the number of holes: an instance whose Euler number is its number of
+    components is its own filled instance, the others are filled one by one."""
+    filled = instances.area.copy()
+    for index in np.flatnonzero(euler != _component_counts(instances)):
+        mask = instances.index_map[
+            instances.min_row[index]: instances.max_row[index] + 1,
+            instances.min_col[index]: instances.max_col[index] + 1,
+        ] == index + 1
+        filled[index] = ndi.binary_fill_holes(mask, np.ones((3, 3))).sum()
+    return filled
+
+
+def _row_extremes(instances: InstancePixels):
+    """Leftmost and rightmost pixel of every row of every instance"""
+    key = instances.instance_index * (instances.max_row.max() + 1) + instances.rows
+    row_starts = np.flatnonzero(np.diff(key, prepend=-1))
+    row_ends = np.append(row_starts[1:], len(key)) - 1
+    return (
+        instances.instance_index[row_starts],
+        instances.rows[row_starts],
+        instances.cols[row_starts],
+        instances.cols[row_ends],
+    )
+
+
+def _convex_hull_features(instances: InstancePixels):
+    """Convex area, like regionprops (pixel centres in the hull of the pixel diamonds,
+    borders included), and perimeter of the convex hull of the pixel centres of every
+    instance. Only the leftmost and rightmost pixels of every row are on a hull."""
+    nr_instances = instances.nr_instances
+    index, rows, left, right = _row_extremes(instances)
+    group_starts = np.searchsorted(index, np.arange(nr_instances + 1))
+
+    # (x, y) points: pixel centres, and pixel diamonds in doubled coordinates
+    centres = np.stack([left, rows, right, rows], axis=1).reshape(-1, 2).astype(np.int32)
+    diamonds = np.stack(
+        [
+            2 * left - 1, 2 * rows,
+            2 * left, 2 * rows - 1,
+            2 * left, 2 * rows + 1,
+            2 * right + 1, 2 * rows,
+            2 * right, 2 * rows - 1,
+            2 * right, 2 * rows + 1,
+        ],
+        axis=1,
+    ).reshape(-1, 2).astype(np.int32)
+
+    hull_perimeter = np.zeros(nr_instances)
+    vertices = []
+    for instance in range(nr_instances):
+        start, end = group_starts[instance], group_starts[instance + 1]
+        hull = cv2.convexHull(centres[2 * start: 2 * end])
+        hull_perimeter[instance] = cv2.arcLength(hull, True)
+        vertices.append(cv2.convexHull(diamonds[6 * start: 6 * end]).reshape(-1, 2))
+
+    # pixel centres within the diamond hulls, row by row
+    nr_vertices = np.array([len(hull) for hull in vertices])
+    vertices = np.concatenate(vertices).astype(np.float64)
+    vertex_instance = np.repeat(np.arange(nr_instances), nr_vertices)
+    vertex_starts = np.concatenate([[0], np.cumsum(nr_vertices)])
+    following = np.arange(len(vertices)) + 1
+    following[vertex_starts[1:] - 1] = vertex_starts[:-1]
+    x1, y1 = vertices[:, 0], vertices[:, 1]
+    x2, y2 = vertices[following, 0], vertices[following, 1]
+
+    # hull x at the (even) pixel rows spanned by every non-horizontal edge
+    slanted = y1 != y2
+    low = np.ceil(np.minimum(y1, y2) / 2).astype(np.int64)
+    high = np.floor(np.maximum(y1, y2) / 2).astype(np.int64)
+    nr_rows = np.where(slanted, np.maximum(high - low + 1, 0), 0)
+    edge = np.repeat(np.arange(len(vertices)), nr_rows)
+    pixel_row = low[edge] + np.arange(len(edge)) - np.repeat(
+        np.cumsum(nr_rows) - nr_rows, nr_rows
+    )
+    x = x1[edge] + (2 * pixel_row - y1[edge]) * (x2[edge] - x1[edge]) / (y2[edge] - y1[edge])
+    # and at the vertices on pixel rows, for the horizontal edges
+    on_row = np.flatnonzero(y1 % 2 == 0)
+    instance = np.concatenate([vertex_instance[edge], vertex_instance[on_row]])
+    pixel_row = np.concatenate([pixel_row, (y1[on_row] // 2).astype(np.int64)])
+    x = np.concatenate([x, x1[on_row]])
+
+    row_offsets = np.concatenate([[0], np.cumsum(instances.max_row - instances.min_row + 1)])
+    row = row_offsets[instance] + pixel_row - instances.min_row[instance]
+    nr_rows = row_offsets[-1]
+    hull_left = np.full(nr_rows, np.inf)
+    hull_right = np.full(nr_rows, -np.inf)
+    np.minimum.at(hull_left, row, x)
+    np.maximum.at(hull_right, row, x)
+    tolerance = 1e-9
+    row_count = np.maximum(
+        np.floor(hull_right / 2 + tolerance) - np.ceil(hull_left / 2 - tolerance) + 1, 0
+    )
+    convex_area = np.add.reduceat(row_count, row_offsets[:-1]) if nr_rows > 0 else np.zeros(0)
+    return convex_area, hull_perimeter
+
+
+def _cached_property(method: Callable[[Any], Any]) -> property:
+    """Property computed on first access and then stored in the instance, like
+    functools.cached_property (which needs Python 3.8)"""
+    attribute = "_cached_" + method.__name__
+
+    @wraps(method)
+    def getter(self: Any) -> Any:
+        if attribute not in self.__dict__:
+            self.__dict__[attribute] = method(self)
+        return self.__dict__[attribute]
+
+    return property(getter)
+
+
+class _ShapeFeatures:
+    """Shape features of instances, every feature computed on first access together with
+    the intermediate results it depends on"""
+
+    def __init__(self, instances: InstancePixels) -> None:
+        self.instances = instances
+        self.area = instances.area.astype(np.float64)
+
+    @_cached_property
+    def _inertia(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Eigenvalues of the inertia tensor and orientation, from exact integer moments"""
+        instances, area = self.instances, self.area
+        sum_r = instances._sum(instances.local_rows)
+        sum_c = instances._sum(instances.local_cols)
+        var_r = area * instances._sum(instances.local_rows ** 2) - sum_r ** 2
+        var_c = area * instances._sum(instances.local_cols ** 2) - sum_c ** 2
+        cov = area * instances._sum(instances.local_rows * instances.local_cols) - sum_r * sum_c
+        # inertia tensor [[a, b], [b, c]]
+        a, b, c = var_c / area ** 2, -cov / area ** 2, var_r / area ** 2
+        spread = np.sqrt(((a - c) / 2) ** 2 + b ** 2)
+        orientation = np.where(
+            var_c == var_r,
+            np.where(b < 0, np.pi / 4, -np.pi / 4),
+            0.5 * np.arctan2(-2 * b, c - a),
+        )
+        return (
+            np.maximum((a + c) / 2 + spread, 0),
+            np.maximum((a + c) / 2 - spread, 0),
+            orientation,
+        )
+
+    @_cached_property
+    def _convex_hull(self) -> Tuple[np.ndarray, np.ndarray]:
+        return _convex_hull_features(self.instances)
+
+    @_cached_property
+    def convex_area(self) -> np.ndarray:
+        return self._convex_hull[0]
+
+    @_cached_property
+    def eccentricity(self) -> np.ndarray:
+        eigval_1, eigval_2, _ = self._inertia
+        return np.where(eigval_1 == 0, 0, np.sqrt(1 - eigval_2 / eigval_1))
+
+    @_cached_property
+    def equivalent_diameter(self) -> np.ndarray:
+        return np.sqrt(4 * self.area / np.pi)
+
+    @_cached_property
+    def euler_number(self) -> np.ndarray:
+        return _euler_numbers(self.instances)
+
+    @_cached_property
+    def extent(self) -> np.ndarray:
+        instances = self.instances
+        return self.area / (
+            (instances.max_row - instances.min_row + 1)
+            * (instances.max_col - instances.min_col + 1)
+        )
+
+    @_cached_property
+    def filled_area(self) -> np.ndarray:
+        return _filled_areas(self.instances, self.euler_number)
+
+    @_cached_property
+    def major_axis_length(self) -> np.ndarray:
+        return 4 * np.sqrt(self._inertia[0])
+
+    @_cached_property
+    def minor_axis_length(self) -> np.ndarray:
+        return 4 * np.sqrt(self._inertia[1])
+
+    @_cached_property
+    def orientation(self) -> np.ndarray:
+        return self._inertia[2]
+
+    @_cached_property
+    def perimeter(self) -> np.ndarray:
+        return _perimeters(self.instances)
+
+    @_cached_property
+    def solidity(self) -> np.ndarray:
+        return self.area / self.convex_area
+
+    @_cached_property
+    def roughness(self) -> np.ndarray:
+        return self._convex_hull[1] / self.perimeter
+
+    @_cached_property
+    def shape_factor(self) -> np.ndarray:
+        return 4 * np.pi * self.area / self._convex_hull[1] ** 2
+
+    @_cached_property
+    def ellipticity(self) -> np.ndarray:
+        return self.minor_axis_length / self.major_axis_length
+
+    @_cached_property
+    def roundness(self) -> np.ndarray:
+        return 4 * np.pi * self.area / self.perimeter ** 2
+
+
+def shape_features(
+    instances: InstancePixels, names: Optional[List[str]] = None
+) -> np.ndarray:
+    """Shape features of every instance (see SHAPE_FEATURES). Only the computations that
+    the requested features need are run, e.g. the area, eccentricity and axis lengths
+    only need the moments, but no perimeter, convex hull or Euler number.
+
+    Args:
+        instances (InstancePixels): Instances
+        names (Optional[List[str]], optional): Features to compute, in this order. None
+            computes all SHAPE_FEATURES. Defaults to None.
+
+    Returns:
+        np.ndarray: Features of shape (nr_instances, len(names))
+    """
+    names = SHAPE_FEATURES if names is None else names
+    assert all(name in SHAPE_FEATURES for name in names), f"Shape features are {SHAPE_FEATURES}"
+    if instances.nr_instances == 0:
+        return np.zeros((0, len(names)))
+    features = _ShapeFeatures(instances)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        columns = [getattr(features, name) for name in names]
+    return np.stack(columns, axis=1).astype(np.float64).reshape(-1, len(names))
+
+
+def texture_features(
+    gray_image: np.ndarray, instances: InstancePixels, names: Optional[List[str]] = None
+) -> np.ndarray:
+    """GLCM features of every instance (see TEXTURE_FEATURES): contrast, dissimilarity,
+    homogeneity, energy, ASM and dispersion of the grey-level co-occurrence matrix of the
+    horizontally adjacent pixels of the instance (distance 1, angle 0), without the grey
+    level 0. The matrices of all the instances are accumulated at once over
+    (instance, i, j) keys, and only when the energy, ASM or dispersion is requested.
+
+    Args:
+        gray_image (np.ndarray): uint8 grey-level image
+        instances (InstancePixels): Instances
+        names (Optional[List[str]], optional): Features to compute, in this order. None
+            computes all TEXTURE_FEATURES. Defaults to None.
+
+    Returns:
+        np.ndarray: Features of shape (nr_instances, len(names))
+    """
+    names = TEXTURE_FEATURES if names is None else names
+    assert all(name in TEXTURE_FEATURES for name in names), f"Texture features are {TEXTURE_FEATURES}"
+    nr_instances = instances.nr_instances
+    index_map = instances.index_map
+    pairs = (index_map[:, :-1] == index_map[:, 1:]) & (index_map[:, :-1] > 0)
+    pairs &= (gray_image[:, :-1] > 0) & (gray_image[:, 1:] > 0)
+    rows, cols = np.nonzero(pairs)
+    instance = index_map[rows, cols] - 1
+    level_i = gray_image[rows, cols].astype(np.int64)
+    level_j = gray_image[rows, cols + 1].astype(np.int64)
+    difference = (level_i - level_j).astype(np.float64)
+
+    nr_pairs = np.bincount(instance, minlength=nr_instances).astype(np.float64)
+    normalization = np.maximum(nr_pairs, 1)
+    columns = dict()
+    if "glcm_contrast" in names:
+        columns["glcm_contrast"] = np.bincount(
+            instance, difference ** 2, minlength=nr_instances) / normalization
+    if "glcm_dissimilarity" in names:
+        columns["glcm_dissimilarity"] = np.bincount(
+            instance, np.abs(difference), minlength=nr_instances) / normalization
+    if "glcm_homogeneity" in names:
+        columns["glcm_homogeneity"] = np.bincount(
+            instance, 1 / (1 + difference ** 2), minlength=nr_instances) / normalization
+    if {"glcm_energy", "glcm_ASM", "glcm_dispersion"} & set(names):
+        keys, counts = np.unique(
+            (instance * 256 + level_i) * 256 + level_j, return_counts=True
+        )
+        sum_squared_counts = np.bincount(
+            keys // (256 * 256), counts.astype(np.float64) ** 2, minlength=nr_instances
+        )
+        columns["glcm_ASM"] = sum_squared_counts / normalization ** 2
+        columns["glcm_energy"] = np.sqrt(columns["glcm_ASM"])
+        # matrix without the grey level 0
+        nr_cells = 255 * 255
+        columns["glcm_dispersion"] = np.sqrt(
+            np.maximum(sum_squared_counts / nr_cells - (nr_pairs / nr_cells) ** 2, 0)
+        )
+    return np.stack([columns[name] for name in names], axis=1).reshape(
+        nr_instances, len(names)
+    )
+
+
+def _features(
+    gray_image: Optional[np.ndarray], instances: InstancePixels, names: List[str]
+) -> np.ndarray:
+    """Shape and texture features of the instances, in the order of names"""
+    shape_names = [name for name in names if name in SHAPE_FEATURES]
+    texture_names = [name for name in names if name in TEXTURE_FEATURES]
+    columns = dict()
+    if len(shape_names) > 0:
+        columns.update(zip(shape_names, shape_features(instances, shape_names).T))
+    if len(texture_names) > 0:
+        assert gray_image is not None, "Texture features need the grey-level image"
+        columns.update(
+            zip(texture_names, texture_features(gray_image, instances, texture_names).T)
+        )
+    if len(names) == 0:
+        return np.zeros((instances.nr_instances, 0))
+    return np.stack([columns[name] for name in names], axis=1)
+
+
+def _chunk_features(
+    gray_image: Optional[np.ndarray],
+    instance_map: np.ndarray,
+    names: List[str],
+    window: Tuple[slice, slice],
+    labels: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Features of some instances, computed on the window of the maps that contains them.
+       The other instances in the window are ignored.
+
+    Args:
+        gray_image (Optional[np.ndarray]): uint8 grey-level image
+        instance_map (np.ndarray): Instance map
+        names (List[str]): Shape and texture features to compute
+        window (Tuple[slice, slice]): Window that contains the instances
+        labels (np.ndarray): Sorted labels of the instances
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Labels and features of the instances
+    """
+    crop = instance_map[window]
+    crop = np.where(np.isin(crop, labels), crop, 0)
+    instances = InstancePixels(crop)
+    features = _features(
+        None if gray_image is None else gray_image[window], instances, names
+    )
+    return instances.labels, features
+
+
+def _shared_chunk_features(
+    gray_image: Optional[Tuple[str, Tuple[int, ...], str]],
+    instance_map: Tuple[str, Tuple[int, ...], str],
+    names: List[str],
+    window: Tuple[slice, slice],
+    labels: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """_chunk_features on arrays in shared memory, given by (name, shape, dtype)"""
+    from multiprocessing import shared_memory
+
+    memories, arrays = [], []
+    for reference in (gray_image, instance_map):
+        if reference is None:
+            arrays.append(None)
+            continue
+        name, shape, dtype = reference
+        memories.append(shared_memory.SharedMemory(name=name))
+        arrays.append(np.ndarray(shape, dtype=dtype, buffer=memories[-1].buf))
+    try:
+        return _chunk_features(*arrays, names, window, labels)
+    finally:
+        # the views need to be released before the blocks are closed
+        del arrays
+        for memory in memories:
+            memory.close()
+
+
+def _to_shared_memory(
+    array: np.ndarray,
+) -> Tuple["shared_memory.SharedMemory", Tuple[str, Tuple[int, ...], str]]:
+    """Copies an array into a new shared memory block
+
+    Returns:
+        Tuple[shared_memory.SharedMemory, Tuple[str, Tuple[int, ...], str]]: Block, to close
+            and unlink when done, and (name, shape, dtype) of the array in it
+    """
+    from multiprocessing import shared_memory
+
+    memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)[...] = array
+    return memory, (memory.name, array.shape, array.dtype.str)
+
+
+def instance_chunks(
+    instance_map: np.ndarray, nr_chunks: int
+) -> List[Tuple[Tuple[slice, slice], np.ndarray]]:
+    """Splits the instances of an instance map into spatial chunks: horizontal stripes of
+       about the same number of instances, ordered by the top of their bounding box
+
+    Args:
+        instance_map (np.ndarray): Instance map with non-negative integer labels
+        nr_chunks (int): Number of chunks
+
+    Returns:
+        List[Tuple[Tuple[slice, slice], np.ndarray]]: Window of the map that contains the
+            bounding boxes of the instances of a chunk, and their sorted labels
+    """
+    bounding_boxes = ndi.find_objects(instance_map)
+    labels = np.array(
+        [label for label, box in enumerate(bounding_boxes, start=1) if box is not None],
+        dtype=np.int64,
+    )
+    if len(labels) == 0:
+        return []
+    boxes = np.array(
+        [
+            [box[0].start, box[1].start, box[0].stop, box[1].stop]
+            for box in bounding_boxes
+            if box is not None
+        ]
+    )
+    order = np.argsort(boxes[:, 0], kind="stable")
+    chunks = []
+    for chunk in np.array_split(order, min(nr_chunks, len(labels))):
+        window = (
+            slice(boxes[chunk, 0].min(), boxes[chunk, 2].max()),
+            slice(boxes[chunk, 1].min(), boxes[chunk, 3].max()),
+        )
+        chunks.append((window, np.sort(labels[chunk])))
+    return chunks
+
+
+def instance_features(
+    gray_image: Optional[np.ndarray],
+    instance_map: np.ndarray,
+    names: Optional[List[str]] = None,
+    n_jobs: int = 1,
+    executor: str = "thread",
+) -> np.ndarray:
+    """Shape and texture features (see shape_features and texture_features) of all the
+       instances of an instance map, in label order. Only the computations that
+       the requested features need are run. With several jobs, the instances are split into
+       spatial chunks (see instance_chunks) that are processed on a thread or process pool
+       and reassembled in label order. The threads work on views of the image and the
+       instance map, the processes on copies in shared memory. Every instance is computed
+       in one chunk, so the features do not depend on the chunking.
+
+    Args:
+        gray_image (Optional[np.ndarray]): uint8 grey-level image. Only needed for the
+            texture features.
+        instance_map (np.ndarray): Instance map with non-negative integer labels
+        names (Optional[List[str]], optional): Features to compute, in this order, from
+            SHAPE_FEATURES and TEXTURE_FEATURES. None computes all of them. Defaults to None.
+        n_jobs (int, optional): Number of workers. 1 computes all instances at once in the
+            current thread, -1 uses all cores. Defaults to 1.
+        executor (str, optional): "thread" or "process". Defaults to "thread".
+
+    Returns:
+        np.ndarray: Features of shape (nr_instances, len(names))
+    """
+    assert executor in ["thread", "process"], f"Unsupported executor {executor}"
+    names = SHAPE_FEATURES + TEXTURE_FEATURES if names is None else list(names)
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    assert n_jobs >= 1, "n_jobs must be positive or -1"
+    if n_jobs == 1:
+        instances = InstancePixels(instance_map)
+        return _features(gray_image, instances, names)
+
+    chunks = instance_chunks(instance_map, CHUNKS_PER_JOB * n_jobs)
+    windows = [window for window, _ in chunks]
+    chunk_labels = [labels for _, labels in chunks]
+    memories: List["shared_memory.SharedMemory"] = []
+    try:
+        if executor == "thread":
+            pool = ThreadPoolExecutor(max_workers=n_jobs)
+            arguments = (repeat(gray_image), repeat(instance_map), repeat(names))
+            compute = _chunk_features
+        else:
+            # the workers register the shared memory with the tracker of this process
+            from multiprocessing import resource_tracker
+
+            resource_tracker.ensure_running()
+            pool = ProcessPoolExecutor(max_workers=n_jobs)
+            references = []
+            for array in (gray_image, instance_map):
+                if array is None:
+                    references.append(None)
+                    continue
+                memory, reference = _to_shared_memory(np.ascontiguousarray(array))
+                memories.append(memory)
+                references.append(reference)
+            arguments = (repeat(references[0]), repeat(references[1]), repeat(names))
+            compute = _shared_chunk_features
+        with pool:
+            results = list(pool.map(compute, *arguments, windows, chunk_labels))
+    finally:
+        for memory in memories:
+            memory.close()
+            memory.unlink()
+
+    if len(results) == 0:
+        return np.zeros((0, len(names)))
+    labels = np.concatenate([labels for labels, _ in results])
+    features = np.concatenate([features for _, features in results])
+    return features[np.argsort(labels)]
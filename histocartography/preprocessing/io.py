@@ -1,17 +1,42 @@
+import io
+import os
 from pathlib import Path
-from typing import Any, Union
+from typing import TYPE_CHECKING, Any, Union
 import h5py
 
-import dgl
 import numpy as np
-from dgl.data.utils import load_graphs
 
 from ..pipeline import PipelineStep
+from ..profiling import get_file_size
+from ..store import get_store
 from .utils import load_image
 from ..utils.io import h5_to_numpy 
 
+if TYPE_CHECKING:
+    import dgl
+
+
+def _open_stored(path: Union[str, Path]) -> Union[str, Path, io.BytesIO]:
+    """Transparently opens files that a pipeline step saved to a sharded store
+
+    Args:
+        path (Union[str, Path]): Path of the file
+
+    Returns:
+        Union[str, Path, io.BytesIO]: The path if the file exists, otherwise its content
+            in the sharded store of its directory, if any
+    """
+    if not os.path.exists(path):
+        store = get_store(path)
+        if store is not None:
+            return io.BytesIO(store.get(Path(path).name))
+    return path
+
 
 class FileLoader(PipelineStep):
+    _cacheable = False
+    _saves_output = False
+
     def mkdir(self) -> Path:
         """Create path to output files"""
         assert (
@@ -19,8 +44,17 @@ class FileLoader(PipelineStep):
         ), "Can only create directory if base_path was not None when constructing the object"
         return Path(self.save_path)
 
-    def _process_and_save(self, *args, output_name, **kwargs: Any) -> Any:
-        return self._process(*args, **kwargs)
+    def _has_output(self, output_name: str) -> bool:
+        return False
+
+    def _save_output(self, output_name: str, output: Any) -> None:
+        pass
+
+    def _get_input_size(self, path: Union[str, Path], *args, **kwargs) -> int:
+        if not os.path.exists(path):
+            store = get_store(path)
+            return 0 if store is None else store.size(Path(path).name)
+        return get_file_size(path)
 
 
 class ImageLoader(FileLoader):
@@ -34,9 +68,11 @@ class ImageLoader(FileLoader):
 class DGLGraphLoader(FileLoader):
     def _process(  # type: ignore[override]
         self, path: Union[str, Path]
-    ) -> dgl.DGLGraph:
-        graph_path = str(path)  # DGL cannot handle pathlib.Path
-        graphs, _ = load_graphs(graph_path)
+    ) -> "dgl.DGLGraph":
+        # dgl is only imported when graphs are loaded
+        from ..utils.graph import load_graphs_from_file
+
+        graphs = load_graphs_from_file(_open_stored(path))
         if len(graphs) == 1:
             return graphs[0]
         return graphs
@@ -46,7 +82,7 @@ class H5Loader(FileLoader):
     def _process(  # type: ignore[override]
         self, path: Union[str, Path]
     ) -> Any:
-        with h5py.File(path, "r") as f:
+        with h5py.File(_open_stored(path), "r") as f:
             keys = list(f.keys())
             if len(keys) == 1:
                 return h5_to_numpy(f[keys[0]])
@@ -0,0 +1,140 @@
+"""Spatial neighborhoods of the instances of an instance map"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+# number of instance maps whose neighborhoods are kept by get_spatial_neighborhood
+NR_CACHED_NEIGHBORHOODS = 4
+
+_NEIGHBORHOODS: "OrderedDict[str, SpatialNeighborhood]" = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def instance_centroids(instance_map: np.ndarray) -> np.ndarray:
+    """Centroids of the instances of an instance map, like the regionprops centroids: the
+       mean (row, col) of the pixels of every instance, in label order
+
+    Args:
+        instance_map (np.ndarray): Instance map with non-negative integer labels. The
+            background is 0 and is ignored.
+
+    Returns:
+        np.ndarray: Centroids (row, col) of shape (nr_instances, 2)
+    """
+    rows, cols = np.nonzero(instance_map)
+    labels = instance_map[rows, cols].astype(np.int64)
+    area = np.bincount(labels)
+    present = np.flatnonzero(area)
+    return np.stack(
+        [
+            np.bincount(labels, rows)[present] / area[present],
+            np.bincount(labels, cols)[present] / area[present],
+        ],
+        axis=1,
+    ).reshape(-1, 2)
+
+
+class SpatialNeighborhood:
+    """k-nearest neighbors of the instances of an instance map, between their centroids.
+    The queries are answered by a KD-tree in O(n log n), and the neighbors of the largest k
+    queried so far are kept, such that smaller queries reuse them."""
+
+    def __init__(self, centroids: np.ndarray) -> None:
+        """
+        Args:
+            centroids (np.ndarray): Centroids of the instances, of shape (nr_instances, 2)
+        """
+        self.centroids = np.asarray(centroids, dtype=np.float64).reshape(-1, 2)
+        self.tree = cKDTree(self.centroids) if len(self.centroids) > 0 else None
+        self._lock = threading.Lock()
+        self._distances = np.zeros((len(self.centroids), 0))
+        self._indices = np.zeros((len(self.centroids), 0), dtype=np.int64)
+
+    @classmethod
+    def from_instance_map(cls, instance_map: np.ndarray) -> "SpatialNeighborhood":
+        """Neighborhood of the regionprops centroids of the instances (see instance_centroids)"""
+        return cls(instance_centroids(instance_map))
+
+    def __len__(self) -> int:
+        return len(self.centroids)
+
+    def query(self, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """k nearest neighbors of every instance, itself included (as its first neighbor,
+           unless other instances have the same centroid)
+
+        Args:
+            k (int): Number of neighbors. At most the number of instances.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Distances and indices of the neighbors, sorted by
+                distance, of shape (nr_instances, k)
+        """
+        assert 0 <= k <= len(self), f"Cannot query {k} neighbors of {len(self)} instances"
+        with self._lock:
+            if k > self._indices.shape[1]:
+                distances, indices = self.tree.query(self.centroids, k=k)
+                self._distances = np.reshape(distances, (len(self), k))
+                self._indices = np.reshape(indices, (len(self), k)).astype(np.int64)
+            return self._distances[:, :k], self._indices[:, :k]
+
+    def query_others(self, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """k nearest neighbors of every instance, itself excluded
+
+        Args:
+            k (int): Number of neighbors. Less than the number of instances.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Distances and indices of the neighbors, sorted by
+                distance, of shape (nr_instances, k)
+        """
+        assert 0 <= k < max(len(self), 1), f"Cannot query {k} other neighbors of {len(self)} instances"
+        if k == 0:
+            return self._distances[:, :0], self._indices[:, :0]
+        distances, indices = self.query(k + 1)
+        others = indices != np.arange(len(self))[:, np.newaxis]
+        # the instance itself is not always among its k + 1 nearest neighbors when several
+        # instances have the same centroid, then the farthest neighbor is dropped
+        others &= np.cumsum(others, axis=1) <= k
+        return (
+            distances[others].reshape(len(self), k),
+            indices[others].reshape(len(self), k),
+        )
+
+
+def get_spatial_neighborhood(instance_map: np.ndarray) -> SpatialNeighborhood:
+    """Neighborhood of the instances of an instance map, shared by all the steps of the
+       process that work on the same instance map (e.g. the crowdedness features of the
+       HandcraftedFeatureExtractor and the edges of the KNNGraphBuilder). The neighborhoods
+       of the last NR_CACHED_NEIGHBORHOODS instance maps are kept, looked up by content.
+
+    Args:
+        instance_map (np.ndarray): Instance map with non-negative integer labels
+
+    Returns:
+        SpatialNeighborhood: Neighborhood of the instances, in label order
+    """
+    hasher = hashlib.blake2b(digest_size=20)
+    hasher.update(f"{instance_map.dtype.str}:{instance_map.shape};".encode())
+    hasher.update(np.ascontiguousarray(instance_map).data)
+    key = hasher.hexdigest()
+    with _LOCK:
+        if key in _NEIGHBORHOODS:
+            _NEIGHBORHOODS.move_to_end(key)
+            return _NEIGHBORHOODS[key]
+    neighborhood = SpatialNeighborhood.from_instance_map(instance_map)
+    with _LOCK:
+        _NEIGHBORHOODS[key] = neighborhood
+        while len(_NEIGHBORHOODS) > NR_CACHED_NEIGHBORHOODS:
+            _NEIGHBORHOODS.popitem(last=False)
+    return neighborhood
+
+
+def clear_spatial_neighborhoods() -> None:
+    """Removes all the neighborhoods kept by get_spatial_neighborhood"""
+    with _LOCK:
+        _NEIGHBORHOODS.clear()
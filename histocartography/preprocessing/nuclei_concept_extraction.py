@@ -4,7 +4,7 @@ import numpy as np
 import torch
 
 from ..pipeline import PipelineStep
-from .feature_extraction import HANDCRAFTED_FEATURES_NAMES, HandcraftedFeatureExtractor
+from .feature_extraction import HandcraftedFeatureExtractor
 
 
 class NucleiConceptExtractor(PipelineStep):
@@ -12,7 +12,11 @@ class NucleiConceptExtractor(PipelineStep):
     Extract nuclei-level measurable concepts.
     """
 
-    def __init__(self, concept_names=None, **kwargs) -> None:
+    _cache_ignore = PipelineStep._cache_ignore + ("n_jobs", "executor")
+
+    def __init__(
+        self, concept_names=None, n_jobs: int = 1, executor: str = "thread", **kwargs
+    ) -> None:
         """Nuclei Concept Extractor constructor.
 
         Args:
@@ -20,14 +24,21 @@ class NucleiConceptExtractor(PipelineStep):
                                  If set to None, extract all the concepts.
                                  Otherwise, extract all the listed concepts
                                 separated with commas, eg. 'area,perimeter,eccentricity'.
+            n_jobs (int, optional): Number of workers that compute the concepts of the nuclei
+                of an image (see HandcraftedFeatureExtractor). Defaults to 1.
+            executor (str, optional): "thread" or "process". Defaults to "thread".
         """
         super().__init__(**kwargs)
+        self.n_jobs = n_jobs
+        self.executor = executor
 
         if concept_names is not None:
             self.concept_names = concept_names.split(",")
         else:
             self.concept_names = concept_names
-        self.hc_feature_extractor = HandcraftedFeatureExtractor()
+        # only the computations of the requested concepts are run
+        self.hc_feature_extractor = HandcraftedFeatureExtractor(
+            feature_names=self.concept_names, n_jobs=n_jobs, executor=executor)
 
     def _process(  # type: ignore[override]
         self, input_image: np.ndarray, instance_map: np.ndarray
@@ -45,14 +56,6 @@ class NucleiConceptExtractor(PipelineStep):
 
         nuclei_concepts = self.hc_feature_extractor.process(input_image, instance_map)
 
-        if self.concept_names is not None:
-            indices_to_keep = [
-                HANDCRAFTED_FEATURES_NAMES[c] for c in self.concept_names
-            ]
-            nuclei_concepts = nuclei_concepts.index_select(
-                1, torch.LongTensor(indices_to_keep)
-            )
-
         # convert to numpy array
         nuclei_concepts = nuclei_concepts.cpu().detach().numpy()
 
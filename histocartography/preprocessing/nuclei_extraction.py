@@ -1,13 +1,16 @@
 """Detect and Classify nuclei from an image with the HoverNet model."""
 
 import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
-from typing import Tuple, Union
+from typing import Any, Dict, List, Tuple, Union
 
 import cv2
+import h5py
 import numpy as np
 import torch
-from PIL import Image
 import os
 from typing import Optional
 
@@ -17,15 +20,23 @@ from skimage.measure import regionprops
 from skimage.morphology import remove_small_objects
 from skimage.segmentation import watershed
 
-from scipy.ndimage import measurements
+from scipy.ndimage import find_objects, measurements
 from scipy.ndimage.morphology import binary_fill_holes
 
-from torch.utils.data import DataLoader, Dataset
-from torchvision import transforms
-from tqdm import tqdm
-
+from torch.utils.data import Dataset
+
+from ..ml.inference import (
+    check_freezing,
+    check_inference_mode,
+    inference_forward,
+    load_optimized_model,
+    optimized_model_path,
+    prepare_model,
+)
+from ..ml.registry import get_model, load_checkpoint
 from ..pipeline import PipelineStep
-from ..utils.image import extract_patches_from_image
+from .batching import iter_patch_batches
+from ..utils.image import extract_patch_grid
 from ..utils import download_box_link
 
 DATASET_TO_BOX_URL = {
@@ -35,6 +46,13 @@ DATASET_TO_BOX_URL = {
 
 CHECKPOINT_PATH = "../../checkpoints"
 
+# Margin in pixels around the regions of the streaming nuclei extraction. It covers the
+# context of the HoverNet patches and a nucleus at the border of a region.
+STREAMING_HALO = 128
+
+# Size of the input patches of HoverNet
+HOVERNET_PATCH_SIZE = 256
+
 GPU_DEFAULT_BATCH_SIZE = 16
 CPU_DEFAULT_BATCH_SIZE = 2
 
@@ -42,11 +60,23 @@ CPU_DEFAULT_BATCH_SIZE = 2
 class NucleiExtractor(PipelineStep):
     """Nuclei extraction"""
 
+    _cache_ignore = PipelineStep._cache_ignore + (
+        "postprocess_workers",
+        "calibrated",
+        "optimize",
+    )
+
     def __init__(
         self,
         pretrained_data: str = "pannuke",
         model_path: str = None,
         batch_size: int = None,
+        postprocess_tile_size: Optional[int] = None,
+        postprocess_workers: Optional[int] = None,
+        min_tissue_fraction: float = 0.0,
+        inference_mode: str = "float32",
+        nr_calibration_batches: int = 8,
+        optimize: bool = False,
         **kwargs,
     ) -> None:
         """Create a nuclei extractor
@@ -55,12 +85,54 @@ class NucleiExtractor(PipelineStep):
             pretrained_data (str): Load checkpoint pretrained on some data. Options are 'pannuke' or 'monusac'. Default to 'pannuke'.
             model_path (str): Path to a pre-trained model. If none, the checkpoint specified in pretrained_data will be used. Default to None.
             batch_size (int, optional): Batch size. Defaults to None.
+            postprocess_tile_size (int, optional): If set, the predictions are post-processed in tiles of
+                this size on a process pool (see process_instance_tiled). Defaults to None.
+            postprocess_workers (int, optional): Number of processes of the tiled post-processing.
+                None uses all cores. Defaults to None.
+            min_tissue_fraction (float, optional): When a tissue mask is given, patches whose
+                predicted region has a smaller fraction of tissue are not passed through the
+                model and predicted as background, e.g. 0.05. Defaults to 0.0.
+            inference_mode (str, optional): Precision and memory format of the model on the CPU,
+                one of "float32", "bfloat16", "channels_last" or "int8". In int8, the conv
+                blocks are quantized after calibrating them on the patches of the first images
+                (see calibrate). bfloat16 and int8 need torch>=1.10, channels_last
+                torch>=1.5. Defaults to "float32".
+            nr_calibration_batches (int, optional): Number of batches of patches to calibrate
+                the int8 model with. Defaults to 8.
+            optimize (bool, optional): Fold the batch norms into the convolutions and freeze the
+                model into TorchScript (see load_optimized_model). The frozen model is cached
+                next to the checkpoint and loaded directly by the next extractors. Only for the
+                float32 inference mode, and needs torch>=1.8. The nuclei are the ones of the
+                unfrozen model up to float rounding, so it is not part of the output directory
+                name. Defaults to False.
         """
+        check_inference_mode(inference_mode)
+        assert (
+            not optimize or inference_mode == "float32"
+        ), "Only the float32 model can be optimized"
+        if optimize:
+            check_freezing()
         self.pretrained_data = pretrained_data
+        # part of the output directory name only when they differ from the defaults, and the
+        # number of calibration batches only when it is used
+        if min_tissue_fraction != 0.0:
+            self.min_tissue_fraction = min_tissue_fraction
+        if inference_mode != "float32":
+            self.inference_mode = inference_mode
+        if inference_mode == "int8":
+            self.nr_calibration_batches = nr_calibration_batches
         super().__init__(**kwargs)
+        self.optimize = optimize
+        # also set when they are the defaults, which are not part of the output directory name
+        self.min_tissue_fraction = min_tissue_fraction
+        self.inference_mode = inference_mode
+        self.nr_calibration_batches = nr_calibration_batches
+        self.postprocess_tile_size = postprocess_tile_size
+        self.postprocess_workers = postprocess_workers
 
         # set class attributes
-        cuda = torch.cuda.is_available()
+        # quantized models only run on the CPU
+        cuda = torch.cuda.is_available() and inference_mode != "int8"
         self.device = torch.device("cuda:0" if cuda else "cpu")
         if batch_size is None:
             # bs set to 16 if GPU, otherwise 2.
@@ -79,13 +151,97 @@ class NucleiExtractor(PipelineStep):
                 pretrained_data + ".pt")
             download_box_link(DATASET_TO_BOX_URL[pretrained_data], model_path)
 
+        self.model_path = model_path
+        # the models are shared by all the extractors of the process (see get_model)
+        if optimize:
+            example_input = torch.zeros(
+                1, 3, HOVERNET_PATCH_SIZE, HOVERNET_PATCH_SIZE, device=self.device
+            )
+            self.model = get_model(
+                model_path,
+                self.device,
+                "frozen",
+                lambda: load_optimized_model(
+                    lambda: self._load_model(model_path),
+                    example_input,
+                    artifact_path=optimized_model_path(model_path, example_input),
+                    source_path=model_path,
+                ),
+            )
+        else:
+            # the int8 model is quantized from the float32 one when the first images are processed
+            precision = "float32" if inference_mode == "int8" else inference_mode
+            self.model = get_model(
+                model_path,
+                self.device,
+                precision,
+                lambda: prepare_model(self._load_model(model_path), precision),
+            )
+        self.calibrated = inference_mode != "int8"
+
+    def _cache_parameters(self) -> Dict[str, Any]:
+        """Parameters that determine the output of the step. Like in the output directory
+           name, the tissue fraction and the inference mode are only part of them when they
+           differ from their defaults, and the number of calibration batches in int8.
+
+        Returns:
+            Dict[str, Any]: Parameters of the step
+        """
+        parameters = super()._cache_parameters()
+        if self.min_tissue_fraction == 0.0:
+            del parameters["min_tissue_fraction"]
+        if self.inference_mode == "float32":
+            del parameters["inference_mode"]
+        if self.inference_mode != "int8":
+            del parameters["nr_calibration_batches"]
+        return parameters
+
+    def _load_model_from_path(self, model_path):
+        """Load nuclei extraction model from provided model path."""
+        self.model = load_checkpoint(model_path)
+
+    def _load_model(self, model_path: str) -> torch.nn.Module:
+        """Load the model on the device in eval mode."""
         self._load_model_from_path(model_path)
         self.model = self.model.to(self.device)
         self.model.eval()
+        return self.model
 
-    def _load_model_from_path(self, model_path):
-        """Load nuclei extraction model from provided model path."""
-        self.model = torch.load(model_path)
+    def calibrate(
+        self,
+        input_images: List[np.ndarray],
+        tissue_masks: Optional[List[Optional[np.ndarray]]] = None,
+    ) -> None:
+        """Quantizes the model for int8 inference, calibrated on up to nr_calibration_batches
+           batches of patches of the given images. Without a call to calibrate, the model is
+           calibrated on the first images that are processed.
+
+        Args:
+            input_images (List[np.ndarray]): Representative RGB images
+            tissue_masks (Optional[List[Optional[np.ndarray]]], optional): Tissue mask of every
+                image. Defaults to None.
+        """
+        assert self.inference_mode == "int8", "Only the int8 model needs calibration"
+        if tissue_masks is None:
+            tissue_masks = [None] * len(input_images)
+        image_datasets = [
+            ImageToPatchDataset(input_image, tissue_mask, self.min_tissue_fraction)
+            for input_image, tissue_mask in zip(input_images, tissue_masks)
+        ]
+        if sum(len(image_dataset) for image_dataset in image_datasets) == 0:
+            # no patch goes through the model, calibrate on the next images
+            return
+        batches = (
+            image_batch
+            for _, (_, _, image_batch) in zip(
+                range(self.nr_calibration_batches),
+                iter_patch_batches(
+                    image_datasets, self.batch_size, batch_transform=patches_to_tensor
+                ),
+            )
+        )
+        self.model = prepare_model(self.model, "int8", batches)
+        self.calibrated = True
 
     def _process(  # type: ignore[override]
         self,
@@ -101,6 +257,23 @@ class NucleiExtractor(PipelineStep):
         """
         return self._extract_nuclei(input_image, tissue_mask)
 
+    def _process_batch(  # type: ignore[override]
+        self, batch_args: List[Tuple[Any, ...]]
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Extract nuclei from several images, filling the batches of HoverNet with
+           the patches of all of them
+
+        Args:
+            batch_args (List[Tuple[Any, ...]]): Input image and optional tissue mask of every datapoint
+
+        Returns:
+            List[Tuple[np.ndarray, np.ndarray]]: instance_map, instance_centroids of every datapoint
+        """
+        return self._extract_nuclei_batch(
+            [args[0] for args in batch_args],
+            [args[1] if len(args) > 1 else None for args in batch_args],
+        )
+
     def _extract_nuclei(
         self,
         input_image: np.ndarray,
@@ -115,46 +288,111 @@ class NucleiExtractor(PipelineStep):
         Returns:
             Tuple[np.ndarray, np.ndarray]: instance_map, instance_centroids
         """
-        if tissue_mask is not None:
-            input_image[tissue_mask == 0] = (255, 255, 255)
-
-        image_dataset = ImageToPatchDataset(input_image)
-
-        def collate(batch):
-            coords = [x[0] for x in batch]
-            patches = torch.stack([x[1] for x in batch])
-            return coords, patches
-
-        image_loader = DataLoader(
-            image_dataset,
-            shuffle=False,
-            batch_size=self.batch_size,
-            collate_fn=collate)
-        pred_map = torch.empty(
-            size=(image_dataset.max_x_coord, image_dataset.max_y_coord, 3),
-            dtype=torch.float32,
-            device=self.device,
-        )
+        return self._extract_nuclei_batch([input_image], [tissue_mask])[0]
+
+    def _extract_nuclei_batch(
+        self,
+        input_images: List[np.ndarray],
+        tissue_masks: List[Optional[np.ndarray]],
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Extract nuclei from several images. The patches of all the images go through
+           the model in full batches and the predictions are scattered back to the images.
+
+        Args:
+            input_images (List[np.ndarray]): Original RGB images
+            tissue_masks (List[Optional[np.ndarray]]): Tissue mask to extract nuclei on for every image
+
+        Returns:
+            List[Tuple[np.ndarray, np.ndarray]]: instance_map, instance_centroids of every image
+        """
+        pred_maps, image_datasets = self._predict_batch(input_images, tissue_masks)
+        return [
+            self._post_process(pred_map, image_dataset)
+            for pred_map, image_dataset in zip(pred_maps, image_datasets)
+        ]
+
+    def _predict_batch(
+        self,
+        input_images: List[np.ndarray],
+        tissue_masks: List[Optional[np.ndarray]],
+    ) -> Tuple[List[torch.Tensor], List["ImageToPatchDataset"]]:
+        """Runs HoverNet on the patches of several images in full batches and scatters the
+           predictions back to the images
+
+        Args:
+            input_images (List[np.ndarray]): Original RGB images
+            tissue_masks (List[Optional[np.ndarray]]): Tissue mask to extract nuclei on for every image
 
-        for coords, image_batch in tqdm(
-            image_loader, desc="Patch-level nuclei detection"
+        Returns:
+            Tuple[List[torch.Tensor], List[ImageToPatchDataset]]: Prediction map (padded to the
+                patch grid) and patches of every image
+        """
+        if not self.calibrated:
+            self.calibrate(input_images, tissue_masks)
+        image_datasets = list()
+        pred_maps = list()
+        for input_image, tissue_mask in zip(input_images, tissue_masks):
+            image_dataset = ImageToPatchDataset(
+                input_image, tissue_mask, self.min_tissue_fraction
+            )
+            image_datasets.append(image_dataset)
+            # skipped patches are predicted as background
+            pred_maps.append(
+                torch.zeros(
+                    size=(image_dataset.max_x_coord, image_dataset.max_y_coord, 3),
+                    dtype=torch.float32,
+                    device=self.device,
+                )
+            )
+        for image_dataset in image_datasets:
+            self._count(
+                "nr_patches", image_dataset.nr_patches + image_dataset.nr_skipped_patches
+            )
+            self._count("nr_skipped_patches", image_dataset.nr_skipped_patches)
+
+        for dataset_indices, coords, image_batch in iter_patch_batches(
+            image_datasets,
+            self.batch_size,
+            verbose=True,
+            desc="Patch-level nuclei detection",
+            batch_transform=patches_to_tensor,
         ):
             image_batch = image_batch.to(self.device)
             with torch.no_grad():
-                out = self.model(image_batch).cpu()
+                out = inference_forward(self.model, image_batch, self.inference_mode).cpu()
                 for i in range(out.shape[0]):
                     left = coords[i][0]  # left, bottom, right, top
                     bottom = coords[i][1]
                     right = coords[i][2]
                     top = coords[i][3]
-                    pred_map[bottom:top, left:right, :] = out[i, :, :, :]
+                    pred_maps[dataset_indices[i]][bottom:top, left:right, :] = out[i, :, :, :]
+        return pred_maps, image_datasets
+
+    def _post_process(
+        self, pred_map: torch.Tensor, image_dataset: "ImageToPatchDataset"
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Builds the instance map and the centroids of an image from the predictions of its patches
 
+        Args:
+            pred_map (torch.Tensor): Predictions of the patches of the image
+            image_dataset (ImageToPatchDataset): Patches of the image
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: instance_map, instance_centroids
+        """
         # crop to original image size
         pred_map = pred_map.cpu().detach().numpy()
         pred_map = pred_map[: image_dataset.im_h, : image_dataset.im_w, :]
 
         # post process instance map
-        instance_map = process_instance(pred_map)
+        if self.postprocess_tile_size is None:
+            instance_map = process_instance(pred_map)
+        else:
+            instance_map = process_instance_tiled(
+                pred_map,
+                tile_size=self.postprocess_tile_size,
+                num_workers=self.postprocess_workers,
+            )
 
         # extract the centroid location in the instance map
         regions = regionprops(instance_map)
@@ -168,6 +406,110 @@ class NucleiExtractor(PipelineStep):
 
         return instance_map, instance_centroids
 
+    def extract_to_file(
+        self,
+        input_image: Any,
+        output_path: Union[str, Path],
+        tissue_mask: Optional[Any] = None,
+        region_size: int = 2048,
+        halo: int = STREAMING_HALO,
+    ) -> int:
+        """Streaming nuclei extraction for images that do not fit into memory. The image is
+           read region by region (with a halo around every region), every region is passed
+           through HoverNet and post-processed on its own, and its nuclei are appended to an
+           h5 file. The memory use is bounded by the size of a region, not of the image.
+           The file contains the datasets
+           - instance_map: uint32 instance map of the whole image, written region by region
+           - instance_ids: uint32 ID of every nucleus
+           - instance_centroids: (x, y) centroid of every nucleus
+           - instance_bboxes: (min_row, min_col, max_row, max_col) bounding box of every nucleus
+           Like in process_instance_tiled, a region keeps the nuclei whose bounding box is
+           centered in the region. Unlike there, every region is post-processed with its own
+           normalization, since the predictions of the whole image are never in memory.
+
+        Args:
+            input_image (Any): RGB image as an array that is read lazily when sliced, e.g.
+                np.load(path, mmap_mode="r"), an h5py or a zarr dataset
+            output_path (Union[str, Path]): Path of the h5 file to write
+            tissue_mask (Optional[Any], optional): Tissue mask to extract nuclei on, read like
+                the image. Defaults to None.
+            region_size (int, optional): Size of the regions. Defaults to 2048.
+            halo (int, optional): Margin around the regions. Defaults to STREAMING_HALO.
+
+        Returns:
+            int: Number of nuclei. The patch counters are in self.step_metrics.
+        """
+        assert region_size > 0, "region_size must be positive"
+        self.step_metrics = dict()
+        height, width = input_image.shape[:2]
+        nr_nuclei = 0
+        with h5py.File(output_path, "w") as output_file:
+            instance_map = output_file.create_dataset(
+                "instance_map",
+                shape=(height, width),
+                dtype="uint32",
+                chunks=(min(height, 256), min(width, 256)),
+                compression="lzf",
+            )
+            instance_ids = output_file.create_dataset(
+                "instance_ids", shape=(0,), maxshape=(None,), dtype="uint32", chunks=(4096,)
+            )
+            instance_centroids = output_file.create_dataset(
+                "instance_centroids",
+                shape=(0, 2),
+                maxshape=(None, 2),
+                dtype="float64",
+                chunks=(4096, 2),
+            )
+            instance_bboxes = output_file.create_dataset(
+                "instance_bboxes",
+                shape=(0, 4),
+                maxshape=(None, 4),
+                dtype="int64",
+                chunks=(4096, 4),
+            )
+            for core, window in _get_tiles(height, width, region_size, halo):
+                region_image = np.asarray(input_image[window])
+                region_mask = (
+                    None if tissue_mask is None else np.asarray(tissue_mask[window])
+                )
+                pred_maps, _ = self._predict_batch([region_image], [region_mask])
+                pred_map = pred_maps[0].cpu().numpy()[
+                    : region_image.shape[0], : region_image.shape[1], :
+                ]
+                del pred_maps, region_image, region_mask
+                labels = process_instance(pred_map, output_dtype="uint32")
+                del pred_map
+                labels, next_id = _relabel_core_instances(labels, core, nr_nuclei + 1)
+                assert next_id - 1 <= np.iinfo(np.uint32).max, "Too many nuclei for uint32"
+                labels = labels.astype(np.uint32)
+
+                # nuclei that reach into the previous regions only fill the free pixels
+                target = instance_map[window]
+                free = (labels > 0) & (target == 0)
+                target[free] = labels[free]
+                instance_map[window] = target
+
+                regions = regionprops(labels)
+                offset = np.array([window[0].start, window[1].start])
+                ids = np.array([region.label for region in regions], dtype=np.uint32)
+                centroids = np.array(
+                    [np.round(region.centroid) + offset for region in regions]
+                ).reshape(-1, 2)[:, ::-1]
+                bboxes = np.array(
+                    [np.array(region.bbox) + np.tile(offset, 2) for region in regions],
+                    dtype=np.int64,
+                ).reshape(-1, 4)
+                for dataset, values in [
+                    (instance_ids, ids),
+                    (instance_centroids, centroids),
+                    (instance_bboxes, bboxes),
+                ]:
+                    dataset.resize(next_id - 1, axis=0)
+                    dataset[nr_nuclei:] = values
+                nr_nuclei = next_id - 1
+        return nr_nuclei
+
     def precompute(
         self,
         link_path: Union[None, str, Path] = None,
@@ -183,33 +525,70 @@ class NucleiExtractor(PipelineStep):
             self._link_to_path(Path(link_path) / "nuclei_maps")
 
 
+def patches_to_tensor(patches: torch.Tensor) -> torch.Tensor:
+    """Converts a batch of uint8 patches of shape (B, H, W, 3) to the float tensor of shape
+       (B, 3, H, W) in [0, 1] that HoverNet expects, like transforms.ToTensor does per patch
+
+    Args:
+        patches (torch.Tensor): Batch of uint8 RGB patches
+
+    Returns:
+        torch.Tensor: Normalized batch
+    """
+    return (
+        patches.permute(0, 3, 1, 2)
+        .to(torch.float32, memory_format=torch.contiguous_format)
+        .div_(255)
+    )
+
+
 class ImageToPatchDataset(Dataset):
     """Helper class to transform an image as a set of patched wrapped in a pytorch dataset"""
 
     def __init__(
         self,
         image: np.ndarray,
+        tissue_mask: Optional[np.ndarray] = None,
+        min_tissue_fraction: float = 0.0,
     ) -> None:
         """Create a dataset for a given image and extracted instance maps with desired patches.
-           Patches have shape of (3, 256, 256) as defined by HoverNet model.
+           Patches have shape of (256, 256, 3) as defined by HoverNet model. They are views of
+           the padded image and are converted to normalized tensors by batch with
+           patches_to_tensor.
 
         Args:
             image (np.ndarray): RGB input image
+            tissue_mask (Optional[np.ndarray]): Tissue mask, the background of the patches is
+                set to white. The input image is not modified. Defaults to None.
+            min_tissue_fraction (float, optional): Patches whose predicted region (see coords)
+                has a smaller fraction of tissue in the tissue mask are dropped. Defaults to 0.0.
         """
         self.image = image
-        self.dataset_transform = transforms.Compose(
-            [
-                transforms.ToTensor(),
-            ]
-        )
         self.im_h = image.shape[0]
         self.im_w = image.shape[1]
-        self.all_patches, self.coords = extract_patches_from_image(
-            image, self.im_h, self.im_w
+        patch_grid, self.coords = extract_patch_grid(
+            image, self.im_h, self.im_w, tissue_mask
         )
-        self.nr_patches = len(self.all_patches)
+        # the view is read-only, but the patches are only read and stacked into batches
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            self.patch_grid = torch.from_numpy(patch_grid)
         self.max_y_coord = max([coord[-2] for coord in self.coords])
         self.max_x_coord = max([coord[-1] for coord in self.coords])
+        # position of every patch in the grid, in row-major order
+        self.patch_indices = list(range(len(self.coords)))
+        self.nr_skipped_patches = 0
+        if tissue_mask is not None and min_tissue_fraction > 0:
+            self.patch_indices = [
+                i
+                for i, (left, bottom, right, top) in enumerate(self.coords)
+                # regions beyond the image are padding, i.e. background
+                if np.count_nonzero(tissue_mask[bottom:top, left:right])
+                >= min_tissue_fraction * (top - bottom) * (right - left)
+            ]
+            self.nr_skipped_patches = len(self.coords) - len(self.patch_indices)
+            self.coords = [self.coords[i] for i in self.patch_indices]
+        self.nr_patches = len(self.patch_indices)
 
     def __getitem__(self, index: int) -> Tuple[int, torch.Tensor]:
         """Loads an image for a given instance maps index
@@ -218,12 +597,12 @@ class ImageToPatchDataset(Dataset):
             index (int): patch index
 
         Returns:
-            Tuple[int, torch.Tensor]: index, image as tensor
+            Tuple[int, torch.Tensor]: index, uint8 patch of shape (256, 256, 3) sharing the
+                memory of the padded image
         """
-        patch = self.all_patches[index]
+        row, col = divmod(self.patch_indices[index], self.patch_grid.shape[1])
         coord = self.coords[index]
-        transformed_image = self.dataset_transform(Image.fromarray(patch))
-        return coord, transformed_image
+        return coord, self.patch_grid[row, col]
 
     def __len__(self) -> int:
         """Returns the length of the dataset
@@ -324,3 +703,246 @@ def process_instance(
     pred_inst = process_np_hv_channels(pred_inst)
     pred_inst = pred_inst.astype(output_dtype)
     return pred_inst
+
+
+# Size of the Sobel kernel of the post-processing
+SOBEL_KERNEL_SIZE = 21
+
+# Margin in pixels around the tiles of the tiled post-processing. It is larger than the
+# Sobel kernel and than a nucleus, such that the nuclei of a tile are segmented as a whole.
+POSTPROCESS_HALO = 64
+
+
+def _min_max_scale(
+        values: np.ndarray,
+        value_range: Tuple[float, float]) -> np.ndarray:
+    """Scales values to [0, 1] with a given range, like cv2.normalize with NORM_MINMAX
+
+    Args:
+        values (np.ndarray): Values to scale
+        value_range (Tuple[float, float]): Minimum and maximum of the values
+
+    Returns:
+        np.ndarray: Scaled values as float32
+    """
+    low, high = value_range
+    scale = 1.0 / (high - low) if high - low > np.finfo(np.float64).eps else 0.0
+    return ((values - np.float32(low)) * np.float32(scale)).astype(np.float32)
+
+
+def _sobel_hv(
+    pred: np.ndarray, hv_ranges: List[Tuple[float, float]]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Sobel filtering of the normalized X- and Y-maps in float32
+
+    Args:
+        pred (np.ndarray): HoverNet model output of a tile
+        hv_ranges (List[Tuple[float, float]]): Range of the X- and Y-maps of the whole image
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Horizontal and vertical gradients
+    """
+    h_dir = _min_max_scale(pred[:, :, 1], hv_ranges[0])
+    v_dir = _min_max_scale(pred[:, :, 2], hv_ranges[1])
+    sobelh = cv2.Sobel(h_dir, cv2.CV_32F, 1, 0, ksize=SOBEL_KERNEL_SIZE)
+    sobelv = cv2.Sobel(v_dir, cv2.CV_32F, 0, 1, ksize=SOBEL_KERNEL_SIZE)
+    return sobelh, sobelv
+
+
+def _sobel_ranges_of_tile(
+    pred: np.ndarray,
+    hv_ranges: List[Tuple[float, float]],
+    core: Tuple[slice, slice],
+) -> List[Tuple[float, float]]:
+    """Range of the gradients in the core of a tile
+
+    Args:
+        pred (np.ndarray): HoverNet model output of a tile with its halo
+        hv_ranges (List[Tuple[float, float]]): Range of the X- and Y-maps of the whole image
+        core (Tuple[slice, slice]): Core of the tile, relative to the tile with its halo
+
+    Returns:
+        List[Tuple[float, float]]: Range of the horizontal and vertical gradients
+    """
+    return [
+        (float(sobel[core].min()), float(sobel[core].max()))
+        for sobel in _sobel_hv(pred, hv_ranges)
+    ]
+
+
+def _process_np_hv_tile(
+    pred: np.ndarray,
+    hv_ranges: List[Tuple[float, float]],
+    sobel_ranges: List[Tuple[float, float]],
+) -> np.ndarray:
+    """Same as process_np_hv_channels for a tile, in float32 and with the ranges of the
+       whole image, such that the tiles are normalized consistently
+
+    Args:
+        pred (np.ndarray): HoverNet model output of a tile with its halo
+        hv_ranges (List[Tuple[float, float]]): Range of the X- and Y-maps of the whole image
+        sobel_ranges (List[Tuple[float, float]]): Range of the gradients of the whole image
+
+    Returns:
+        np.ndarray: Instance map of the tile
+    """
+    proba_map = (pred[:, :, 0] >= 0.5).astype(np.int32)
+    proba_map = measurements.label(proba_map)[0]
+    proba_map = remove_small_objects(proba_map, min_size=10)
+    proba_map = (proba_map > 0).astype(np.float32)
+
+    sobelh, sobelv = _sobel_hv(pred, hv_ranges)
+    sobelh = 1 - _min_max_scale(sobelh, sobel_ranges[0])
+    sobelv = 1 - _min_max_scale(sobelv, sobel_ranges[1])
+
+    overall = np.maximum(sobelh, sobelv)
+    del sobelh, sobelv
+    overall = overall - (1 - proba_map)
+    overall[overall < 0] = 0
+
+    dist = (1.0 - overall) * proba_map
+    dist = -cv2.GaussianBlur(dist, (3, 3), 0)
+
+    marker = proba_map - (overall >= 0.5)
+    marker[marker < 0] = 0
+    marker = binary_fill_holes(marker).astype("uint8")
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    marker = cv2.morphologyEx(marker, cv2.MORPH_OPEN, kernel)
+    marker = measurements.label(marker)[0]
+    marker = remove_small_objects(marker, min_size=10)
+
+    return watershed(dist, marker, mask=proba_map.astype(bool), watershed_line=False)
+
+
+def _get_tiles(
+    height: int, width: int, tile_size: int, halo: int
+) -> List[Tuple[Tuple[slice, slice], Tuple[slice, slice]]]:
+    """Splits an image into tiles with a halo
+
+    Args:
+        height (int): Height of the image
+        width (int): Width of the image
+        tile_size (int): Size of the core of the tiles
+        halo (int): Margin around the core, clipped at the border of the image
+
+    Returns:
+        List[Tuple[Tuple[slice, slice], Tuple[slice, slice]]]: Core of every tile in the
+            image and relative to the tile with its halo, tile with its halo in the image
+    """
+    tiles = list()
+    for top in range(0, height, tile_size):
+        for left in range(0, width, tile_size):
+            bottom = min(top + tile_size, height)
+            right = min(left + tile_size, width)
+            window = (
+                slice(max(top - halo, 0), min(bottom + halo, height)),
+                slice(max(left - halo, 0), min(right + halo, width)),
+            )
+            core = (
+                slice(top - window[0].start, bottom - window[0].start),
+                slice(left - window[1].start, right - window[1].start),
+            )
+            tiles.append((core, window))
+    return tiles
+
+
+def _relabel_core_instances(
+    labels: np.ndarray, core: Tuple[slice, slice], first_id: int
+) -> Tuple[np.ndarray, int]:
+    """Gives the instances of a tile whose bounding box is centered in the core of the tile
+       consecutive IDs and removes the others, which belong to the neighbouring tiles
+
+    Args:
+        labels (np.ndarray): Instance map of the tile with its halo
+        core (Tuple[slice, slice]): Core of the tile, relative to the tile with its halo
+        first_id (int): ID of the first instance of the tile
+
+    Returns:
+        Tuple[np.ndarray, int]: Relabelled instance map (int64), first ID of the next tile
+    """
+    new_ids = np.zeros(labels.max() + 1, dtype=np.int64)
+    next_id = first_id
+    for label, bounding_box in enumerate(find_objects(labels), start=1):
+        if bounding_box is None:
+            continue
+        center = [(s.start + s.stop - 1) // 2 for s in bounding_box]
+        if all(c.start <= x < c.stop for c, x in zip(core, center)):
+            new_ids[label] = next_id
+            next_id += 1
+    return new_ids[labels], next_id
+
+
+def process_instance_tiled(
+    pred_map: np.ndarray,
+    tile_size: int = 1024,
+    halo: int = POSTPROCESS_HALO,
+    num_workers: Optional[int] = None,
+    output_dtype: str = "uint16",
+) -> np.ndarray:
+    """Tiled version of process_instance for large images: the prediction map is split into
+       tiles with a halo, which are post-processed on a process pool in float32, and the
+       instances of the tiles are merged into a single map with globally unique IDs. The
+       normalizations use the ranges of the whole map (computed in a first pass over the
+       tiles), such that the result only differs from process_instance by the precision of
+       float32 and at nuclei that are cut by the tiles. Every tile keeps the instances whose
+       bounding box is centered in its core, and a pixel claimed by two tiles goes to the
+       first one.
+
+    Args:
+        pred_map (np.ndarray): commbined output of np and hv branches
+        tile_size (int, optional): Size of the core of the tiles. Defaults to 1024.
+        halo (int, optional): Margin around the tiles. Needs to be larger than a nucleus.
+            Defaults to POSTPROCESS_HALO.
+        num_workers (Optional[int], optional): Number of worker processes. 0 processes the
+            tiles in the current process, None uses all cores. Defaults to None.
+        output_dtype (str, optional): data type of output. Defaults to "uint16".
+
+    Returns:
+        np.ndarray: pixel-wise nuclear instance segmentation prediction
+    """
+    assert tile_size > 0, "tile_size must be positive"
+    assert halo > SOBEL_KERNEL_SIZE // 2, f"halo must be larger than {SOBEL_KERNEL_SIZE // 2}"
+    pred = np.squeeze(pred_map).astype(np.float32, copy=False)
+    height, width = pred.shape[:2]
+    tiles = _get_tiles(height, width, tile_size, halo)
+    tile_preds = [pred[window] for _, window in tiles]
+    cores = [core for core, _ in tiles]
+    hv_ranges = [
+        (float(pred[:, :, 1].min()), float(pred[:, :, 1].max())),
+        (float(pred[:, :, 2].min()), float(pred[:, :, 2].max())),
+    ]
+
+    executor = None
+    if num_workers != 0 and len(tiles) > 1:
+        executor = ProcessPoolExecutor(max_workers=num_workers)
+    map_tiles = map if executor is None else executor.map
+    try:
+        tile_sobel_ranges = list(
+            map_tiles(_sobel_ranges_of_tile, tile_preds, repeat(hv_ranges), cores)
+        )
+        sobel_ranges = [
+            (
+                min(ranges[i][0] for ranges in tile_sobel_ranges),
+                max(ranges[i][1] for ranges in tile_sobel_ranges),
+            )
+            for i in range(2)
+        ]
+        instance_map = np.zeros((height, width), dtype=output_dtype)
+        next_id = 1
+        for (core, window), labels in zip(
+            tiles,
+            map_tiles(
+                _process_np_hv_tile, tile_preds, repeat(hv_ranges), repeat(sobel_ranges)
+            ),
+        ):
+            labels, next_id = _relabel_core_instances(labels, core, next_id)
+            assert (
+                next_id - 1 <= np.iinfo(output_dtype).max
+            ), f"Too many nuclei for {output_dtype}"
+            target = instance_map[window]
+            free = (labels > 0) & (target == 0)
+            target[free] = labels[free]
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return instance_map
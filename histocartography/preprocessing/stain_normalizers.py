@@ -3,7 +3,7 @@
 import logging
 from abc import abstractmethod
 from pathlib import Path
-from typing import Optional, Union
+from typing import List, Optional, Tuple, Union
 
 import h5py
 import numpy as np
@@ -14,6 +14,9 @@ from sklearn.decomposition import DictionaryLearning
 from ..pipeline import PipelineStep
 from .utils import load_image
 
+# Optical density of every 8-bit intensity, values of 0 are treated as 1
+_OD_LOOKUP = -1 * np.log(np.maximum(np.arange(256), 1) / 255)
+
 
 class StainNormalizer(PipelineStep):
     """Base class for creating fancy stain normalizers"""
@@ -66,10 +69,9 @@ class StainNormalizer(PipelineStep):
         Returns:
             np.array: Input image in the OD space
         """
-        mask = input_image == 0
-        if mask.any():
-            input_image[mask] = 1
-        return -1 * np.log(input_image / 255)
+        if input_image.dtype == np.uint8:
+            return _OD_LOOKUP[input_image]
+        return -1 * np.log(np.maximum(input_image, 1) / 255)
 
     @staticmethod
     def _normalize_rows(input_array: np.ndarray) -> np.ndarray:
@@ -140,6 +142,29 @@ class StainNormalizer(PipelineStep):
                 self._save_values(output_file)
 
     @abstractmethod
+    def _get_normalized_concentrations(self, input_image: np.ndarray) -> np.ndarray:
+        """Extracts the stain concentrations of all pixels of an image and scales them to
+           the target
+
+        Args:
+            input_image (np.array): Image to normalize
+
+        Returns:
+            np.array: Normalized stains of all pixels (vectorized image)
+        """
+
+    def _reconstruct(self, concentrations: np.ndarray) -> np.ndarray:
+        """Converts stain concentrations to RGB with the stain matrix of the target
+
+        Args:
+            concentrations (np.array): Stains of all pixels (vectorized image)
+
+        Returns:
+            np.array: RGB values of all pixels
+        """
+        return (255 * np.exp(-1 * np.dot(concentrations,
+                                         self.stain_matrix_target))).astype(np.uint8)
+
     def _normalize_image(self, input_image: np.ndarray) -> np.ndarray:
         """Perform the normalization of an image with precomputed values
 
@@ -149,6 +174,9 @@ class StainNormalizer(PipelineStep):
         Returns:
             np.array: Normalized image
         """
+        return self._reconstruct(
+            self._get_normalized_concentrations(input_image)
+        ).reshape(input_image.shape)
 
     # type: ignore[override]
     def _process(self, input_image: np.ndarray) -> np.ndarray:
@@ -164,6 +192,32 @@ class StainNormalizer(PipelineStep):
         normalized_image = self._normalize_image(standardized_image)
         return normalized_image
 
+    def _process_batch(self, batch_args: List[Tuple[np.ndarray]]) -> List[np.ndarray]:
+        """Stain normalizes several images. The stains of every image are extracted on their
+           own, and the pixels of all the images are converted back to RGB with the stain matrix
+           of the target in a single product.
+
+        Args:
+            batch_args (List[Tuple[np.ndarray]]): Input image of every datapoint
+
+        Returns:
+            List[np.ndarray]: The stain normalized images
+        """
+        concentrations = list()
+        shapes = list()
+        for (input_image,) in batch_args:
+            standardized_image = self._standardize_brightness(input_image)
+            concentrations.append(
+                self._get_normalized_concentrations(standardized_image))
+            shapes.append(standardized_image.shape)
+        pixels = self._reconstruct(np.concatenate(concentrations))
+        del concentrations
+        offsets = np.cumsum([int(np.prod(shape[:-1])) for shape in shapes])[:-1]
+        return [
+            image_pixels.reshape(shape)
+            for image_pixels, shape in zip(np.split(pixels, offsets), shapes)
+        ]
+
     # type: ignore[override]
     def process_and_save(
             self,
@@ -343,14 +397,14 @@ class MacenkoStainNormalizer(StainNormalizer):
             stain_matrix = np.array([v2, v1])
         return self._normalize_rows(stain_matrix)
 
-    def _normalize_image(self, input_image: np.ndarray) -> np.ndarray:
-        """Compute the normalization according to the paper
+    def _get_normalized_concentrations(self, input_image: np.ndarray) -> np.ndarray:
+        """Compute the stain concentrations according to the paper
 
         Args:
             input_image (np.array): Image to normalize
 
         Returns:
-            np.array: Normalized image
+            np.array: Normalized stains of all pixels (vectorized image)
         """
         stain_matrix_source = self._get_stain_matrix(input_image)
         source_concentrations = self._get_concentrations(
@@ -361,8 +415,7 @@ class MacenkoStainNormalizer(StainNormalizer):
         ).reshape((1, 2))
         max_concentration_target = self.max_concentration_target
         source_concentrations *= max_concentration_target / max_concentration_source
-        return (255 * np.exp(-1 * np.dot(source_concentrations,
-                                         self.stain_matrix_target).reshape(input_image.shape))).astype(np.uint8)
+        return source_concentrations
 
     def fit(self, target_image: np.ndarray) -> None:
         """Fit the normalizer to a target value and save it for the future
@@ -484,21 +537,17 @@ class VahadaneStainNormalizer(StainNormalizer):
         dictionary = self._normalize_rows(dictionary)
         return dictionary
 
-    def _normalize_image(self, input_image: np.ndarray) -> np.ndarray:
-        """Compute the normalization according to the paper
+    def _get_normalized_concentrations(self, input_image: np.ndarray) -> np.ndarray:
+        """Compute the stain concentrations according to the paper
 
         Args:
             input_image (np.array): Image to normalize
 
         Returns:
-            np.array: Normalized image
+            np.array: Stains of all pixels (vectorized image)
         """
         stain_matrix_source = self._get_stain_matrix(input_image)
-        source_concentrations = self._get_concentrations(
-            input_image, stain_matrix_source
-        )
-        return (255 * np.exp(-1 * np.dot(source_concentrations,
-                                         self.stain_matrix_target).reshape(input_image.shape))).astype(np.uint8)
+        return self._get_concentrations(input_image, stain_matrix_source)
 
     def fit(self, target_image: np.ndarray) -> None:
         """Fit the normalizer to a target value and save it for the future
@@ -88,20 +88,17 @@ class StatsComputer(PipelineStep):
         else:
             self._file_path = None
 
-    def _process_and_save(
-        self, *args: Any, output_name: str, **kwargs: Any
-    ) -> Any:
-        """Compute the value and write it to the file and return it
+    def _has_output(self, output_name: str) -> bool:
+        return False
+
+    def _save_output(self, output_name: str, output: Any) -> None:
+        """Write the computed value to the file
 
         Args:
             output_name (str): Unique identifier of datapoint
-
-        Returns:
-            Any: Computed value
+            output (Any): Computed value
         """
-        value = self._process(*args, **kwargs)
-        self._write(output_name, value)
-        return value
+        self._write(output_name, output)
 
 
 class GraphDiameter(StatsComputer):
@@ -2,13 +2,11 @@
 
 import logging
 import math
-import sys
 from abc import abstractmethod
 from pathlib import Path
 from typing import Any, Dict, Optional, Union
 
 import cv2
-import h5py
 import numpy as np
 from skimage.color.colorconv import rgb2hed
 from skimage.future import graph
@@ -361,53 +359,6 @@ class MergedSuperpixelExtractor(SuperpixelExtractor):
             logging.debug("Upsampled to %s", merged_superpixels.shape)
         return merged_superpixels, initial_superpixels
 
-    def _process_and_save(
-            self,
-            *args: Any,
-            output_name: str,
-            **kwargs: Any) -> Any:
-        """Process and save in the provided path as as .h5 file
-        Args:
-            output_name (str): Name of output file
-        """
-        assert (
-            self.save_path is not None
-        ), "Can only save intermediate output if base_path was not None when constructing the object"
-        superpixel_output_path = self.output_dir / f"{output_name}.h5"
-        if superpixel_output_path.exists():
-            logging.info(
-                f"{self.__class__.__name__}: Output of {output_name} already exists, using it instead of recomputing"
-            )
-            try:
-                with h5py.File(superpixel_output_path, "r") as input_file:
-                    merged_superpixels, initial_superpixels = self._get_outputs(
-                        input_file=input_file)
-            except OSError as e:
-                print(
-                    f"\n\nCould not read from {superpixel_output_path}!\n\n",
-                    file=sys.stderr,
-                    flush=True,
-                )
-                print(
-                    f"\n\nCould not read from {superpixel_output_path}!\n\n",
-                    flush=True)
-                raise e
-        else:
-            merged_superpixels, initial_superpixels = self._process(
-                *args, **kwargs)
-            try:
-                with h5py.File(superpixel_output_path, "w") as output_file:
-                    self._set_outputs(
-                        output_file=output_file,
-                        outputs=(merged_superpixels, initial_superpixels),
-                    )
-            except OSError as e:
-                print(
-                    f"\n\nCould not write to {superpixel_output_path}!\n\n",
-                    flush=True)
-                raise e
-        return merged_superpixels, initial_superpixels
-
 
 class ColorMergedSuperpixelExtractor(MergedSuperpixelExtractor):
     def __init__(
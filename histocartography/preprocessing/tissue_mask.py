@@ -2,7 +2,7 @@ from ..pipeline import PipelineStep
 import logging
 import math
 from pathlib import Path
-from typing import Any, Tuple, Union
+from typing import Any, BinaryIO, Tuple, Union
 
 import cv2
 import numpy as np
@@ -86,38 +86,22 @@ def get_tissue_mask(
 
 
 class TissueMask(PipelineStep):
-    def _process_and_save(
-            self,
-            *args,
-            output_name: str,
-            **kwargs) -> np.ndarray:
-        """Process and save in the provided path as a png image
+    def _get_output_path(self, output_name: str) -> Path:
+        """Tissue masks are saved as png images
 
         Args:
             output_name (str): Name of output file
         """
-        assert (
-            self.save_path is not None
-        ), "Can only save intermediate output if base_path was not None during construction"
-        output_path = self.output_dir / f"{output_name}.png"
-        if output_path.exists():
-            logging.info(
-                "%s: Output of %s already exists, using it instead of recomputing",
-                self.__class__.__name__,
-                output_name,
-            )
-            try:
-                with Image.open(output_path) as input_file:
-                    output = np.array(input_file)
-            except OSError as error:
-                logging.critical("Could not open %s", output_path)
-                raise error
-        else:
-            output = self._process(*args, **kwargs)
-            # with Image.fromarray(np.uint8(output*255)) as output_image:
-            with Image.fromarray(output) as output_image:
-                output_image.save(output_path)
-        return output
+        return self.output_dir / f"{output_name}.png"
+
+    def _read_output(self, file: Union[Path, BinaryIO]) -> np.ndarray:
+        with Image.open(file) as input_file:
+            return np.array(input_file)
+
+    def _write_output(self, file: Union[Path, BinaryIO], output: np.ndarray) -> None:
+        # with Image.fromarray(np.uint8(output*255)) as output_image:
+        with Image.fromarray(output) as output_image:
+            output_image.save(file, format="PNG")
 
     def precompute(
         self,
@@ -214,6 +198,7 @@ class GaussianTissueMask(TissueMask):
         """
         # Downsample image
         original_height, original_width = image.shape[0], image.shape[1]
+        input_image = image
         if self.downsampling_factor != 1:
             image = self._downsample(image, self.downsampling_factor)
 
@@ -240,6 +225,9 @@ class GaussianTissueMask(TissueMask):
             if image_masked[image_masked > 0].mean(
             ) < self.background_gray_value:
                 tissue_mask[mask_ != 0] = 1
+                if image is input_image:
+                    # whiten the detected region in a copy, not in the input
+                    image = image.copy()
                 image[mask_ != 0] = (255, 255, 255)
             else:
                 break
@@ -251,6 +239,8 @@ class GaussianTissueMask(TissueMask):
 
 
 class AnnotationPostProcessor(PipelineStep):
+    _saves_output = False
+
     def __init__(self, background_index: int, **kwargs: Any) -> None:
         self.background_index = background_index
         super().__init__(**kwargs)
@@ -269,9 +259,8 @@ class AnnotationPostProcessor(PipelineStep):
         annotation[~tissue_mask.astype(bool)] = self.background_index
         return annotation
 
-    def _process_and_save(
-            self,
-            *args: Any,
-            output_name: str,
-            **kwargs: Any) -> Any:
-        return self._process(*args, **kwargs)
+    def _has_output(self, output_name: str) -> bool:
+        return False
+
+    def _save_output(self, output_name: str, output: Any) -> None:
+        pass
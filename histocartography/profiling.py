@@ -0,0 +1,137 @@
+"""Per-stage instrumentation of pipeline runs"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def get_peak_rss() -> Optional[int]:
+    """Peak resident set size of the current process
+
+    Returns:
+        Optional[int]: Peak RSS in bytes, None if it cannot be measured on this platform
+    """
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def get_file_size(path: Union[None, str, Path]) -> int:
+    """Size of a file, 0 if it does not exist
+
+    Args:
+        path (Union[None, str, Path]): Path to the file
+
+    Returns:
+        int: Size in bytes
+    """
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
+
+
+@contextmanager
+def measure(metrics: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Measures the wall time, the CPU time and the memory of a block of code and stores them
+       in the given dictionary. The CPU time and the memory are process-wide, so they also
+       account for other threads running at the same time. The peak of the allocations traced
+       by tracemalloc is only measured when tracemalloc is tracing.
+
+    Args:
+        metrics (Dict[str, Any]): Dictionary to store the measurements in
+
+    Yields:
+        Dict[str, Any]: The given dictionary
+    """
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        traced_start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+    peak_rss_start = get_peak_rss()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield metrics
+    finally:
+        metrics["wall_time"] = time.perf_counter() - wall_start
+        metrics["cpu_time"] = time.process_time() - cpu_start
+        peak_rss = get_peak_rss()
+        metrics["peak_rss"] = peak_rss
+        metrics["peak_rss_increase"] = (
+            None if peak_rss is None else peak_rss - peak_rss_start
+        )
+        metrics["traced_peak"] = (
+            tracemalloc.get_traced_memory()[1] - traced_start if tracing else None
+        )
+
+
+def summarize_metrics(records: Iterable[Dict[str, Any]]) -> pd.DataFrame:
+    """Aggregates the per-stage and per-datapoint measurements by stage
+
+    Args:
+        records (Iterable[Dict[str, Any]]): Measurements as recorded by the pipeline runners
+
+    Returns:
+        pd.DataFrame: One row per stage (in order of appearance) with the number of calls,
+            the total, mean and maximum wall time, the share of the total wall time, the total
+            CPU time, the maximum memory measurements, the cache hits and misses, the
+            number of bytes read and written and the totals of the counters of the steps
+            (measurements whose name starts with "nr_")
+    """
+    records = pd.DataFrame(list(records))
+    if len(records) == 0:
+        return pd.DataFrame()
+    stages = records.groupby("stage", sort=False)
+    cache_hits = (records["cache"] == "hit").groupby(records["stage"], sort=False)
+    cache_misses = (records["cache"] == "miss").groupby(records["stage"], sort=False)
+    summary = pd.DataFrame(
+        {
+            "calls": stages.size(),
+            "wall_time_total": stages["wall_time"].sum(),
+            "wall_time_mean": stages["wall_time"].mean(),
+            "wall_time_max": stages["wall_time"].max(),
+            "cpu_time_total": stages["cpu_time"].sum(),
+            "peak_rss_max": stages["peak_rss"].max(),
+            "peak_rss_increase_max": stages["peak_rss_increase"].max(),
+            "traced_peak_max": stages["traced_peak"].max(),
+            "cache_hits": cache_hits.sum(),
+            "cache_misses": cache_misses.sum(),
+            "bytes_read": stages["bytes_read"].sum(),
+            "bytes_written": stages["bytes_written"].sum(),
+        }
+    )
+    for column in records.columns:
+        if column.startswith("nr_"):
+            summary[column] = stages[column].sum()
+    summary.insert(
+        4,
+        "wall_time_share",
+        summary["wall_time_total"] / summary["wall_time_total"].sum(),
+    )
+    return summary
+
+
+def write_trace(records: List[Dict[str, Any]], path: Union[str, Path]) -> None:
+    """Writes the measurements as JSON lines, one line per stage and datapoint
+
+    Args:
+        records (List[Dict[str, Any]]): Measurements as recorded by the pipeline runners
+        path (Union[str, Path]): Path of the output file
+    """
+    with open(path, "w") as trace_file:
+        for record in records:
+            trace_file.write(json.dumps(record, default=str) + "\n")
@@ -0,0 +1,112 @@
+"""Storage codecs of the h5 outputs of pipeline steps"""
+from typing import Any, Dict, Optional, Tuple, Union
+
+import numpy as np
+
+# Codecs built into h5py, such that the outputs can be read without plugins:
+#   none:    uncompressed
+#   lzf:     fast compression with a moderate ratio
+#   gzip:    slow compression with a good ratio, level 0 to 9
+#   shuffle: byte-shuffle filter followed by lzf, which groups the bytes of
+#            the same significance and compresses integer and float arrays well
+STORAGE_CODECS = ["none", "lzf", "gzip", "shuffle"]
+
+# Target size in bytes of a chunk
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+
+def get_chunk_shape(
+    shape: Tuple[int, ...], itemsize: int, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Tuple[int, ...]:
+    """Chunk shape of at most chunk_size bytes that follows the shape of the data,
+       i.e. the largest dimension is halved until the chunk fits
+
+    Args:
+        shape (Tuple[int, ...]): Shape of the data
+        itemsize (int): Size of an element in bytes
+        chunk_size (int, optional): Target size of a chunk in bytes. Defaults to 1 MiB.
+
+    Returns:
+        Tuple[int, ...]: Shape of a chunk
+    """
+    chunk_shape = [max(1, dim) for dim in shape]
+    while np.prod(chunk_shape) * itemsize > chunk_size and max(chunk_shape) > 1:
+        largest = int(np.argmax(chunk_shape))
+        chunk_shape[largest] = (chunk_shape[largest] + 1) // 2
+    return tuple(chunk_shape)
+
+
+class StorageCodec:
+    """How a pipeline step stores its outputs in h5 files"""
+
+    def __init__(
+        self,
+        codec: str = "gzip",
+        level: Optional[int] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> None:
+        """Create a storage codec
+
+        Args:
+            codec (str, optional): One of "none", "lzf", "gzip" and "shuffle". Defaults to "gzip".
+            level (Optional[int], optional): Compression level of gzip, from 0 to 9. Defaults to 9.
+            chunk_size (int, optional): Target size in bytes of the chunks of compressed
+                datasets. Defaults to 1 MiB.
+        """
+        assert (
+            codec in STORAGE_CODECS
+        ), f"Unsupported codec {codec}. Options are {STORAGE_CODECS}."
+        assert level is None or codec == "gzip", "Only gzip supports a compression level"
+        assert level is None or 0 <= level <= 9, "gzip level must be between 0 and 9"
+        assert chunk_size > 0, "chunk_size must be positive"
+        self.codec = codec
+        self.level = 9 if level is None and codec == "gzip" else level
+        self.chunk_size = chunk_size
+
+    def __repr__(self) -> str:
+        level = f",level={self.level}" if self.level is not None else ""
+        return f"{self.__class__.__name__}(codec={self.codec}{level})"
+
+    def dataset_kwargs(self, data: Any) -> Dict[str, Any]:
+        """Keyword arguments of h5py.Group.create_dataset to store some data
+
+        Args:
+            data (Any): Data to store
+
+        Returns:
+            Dict[str, Any]: Compression, filter and chunk arguments
+        """
+        data = np.asarray(data)
+        if self.codec == "none" or data.ndim == 0 or data.size == 0:
+            return dict()
+        kwargs: Dict[str, Any] = {
+            "chunks": get_chunk_shape(data.shape, data.itemsize, self.chunk_size)
+        }
+        if self.codec == "gzip":
+            kwargs.update(compression="gzip", compression_opts=self.level)
+        elif self.codec == "lzf":
+            kwargs.update(compression="lzf")
+        elif self.codec == "shuffle":
+            kwargs.update(compression="lzf", shuffle=True)
+        return kwargs
+
+
+def get_storage_codec(
+    storage: Union[None, str, Dict[str, Any], StorageCodec]
+) -> StorageCodec:
+    """Builds a storage codec from a configuration
+
+    Args:
+        storage (Union[None, str, Dict[str, Any], StorageCodec]): Name of the codec, keyword
+            arguments of StorageCodec or a codec. None is gzip at level 9.
+
+    Returns:
+        StorageCodec: The storage codec
+    """
+    if storage is None:
+        return StorageCodec()
+    if isinstance(storage, StorageCodec):
+        return storage
+    if isinstance(storage, str):
+        return StorageCodec(codec=storage)
+    return StorageCodec(**storage)
@@ -0,0 +1,235 @@
+"""Sharded store that packs the outputs of many datapoints into a few files"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional, Union
+
+# Default maximum size in bytes of a shard before a new one is started
+DEFAULT_MAX_SHARD_SIZE = 1 << 30
+
+
+class ShardedStore:
+    """Append-only store of named binary blobs in a directory. Every writing process appends
+       to its own shard files and to its own index of JSON lines (name -> shard, offset,
+       length), so concurrent writers never need a lock. Readers merge the indices into a
+       dictionary, which gives O(1) lookups, and read a blob with a single seek. When a name
+       is written several times, the latest write wins. The threads of a process (e.g. the
+       stages of a pipelined run) share its files under a lock.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        max_shard_size: int = DEFAULT_MAX_SHARD_SIZE,
+    ) -> None:
+        """Open (or create) a store in a directory
+
+        Args:
+            path (Union[str, Path]): Directory of the store
+            max_shard_size (int, optional): Size in bytes after which a writer starts a new
+                shard. Defaults to 1 GiB.
+        """
+        assert max_shard_size > 0, "max_shard_size must be positive"
+        self.path = Path(path)
+        self.max_shard_size = max_shard_size
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._reset()
+
+    def _reset(self) -> None:
+        self._index: Dict[str, Dict[str, Any]] = dict()
+        self._index_offsets: Dict[str, int] = dict()
+        self._readers: Dict[str, BinaryIO] = dict()
+        self._reader_pid = os.getpid()
+        self._writer_pid: Optional[int] = None
+        self._writer_id: Optional[str] = None
+        self._shard_number = 0
+        self._shard_file: Optional[BinaryIO] = None
+        self._index_file = None
+        self._lock = threading.RLock()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(path={self.path})"
+
+    def __getstate__(self) -> dict:
+        return {"path": self.path, "max_shard_size": self.max_shard_size}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._reset()
+
+    @staticmethod
+    def exists(path: Union[str, Path]) -> bool:
+        """Whether a directory contains a store
+
+        Args:
+            path (Union[str, Path]): Directory
+
+        Returns:
+            bool: Whether an index file exists in the directory
+        """
+        return any(Path(path).glob("index-*.jsonl"))
+
+    def refresh(self) -> None:
+        """Reads the index entries appended by the writers since the last refresh"""
+        for index_path in self.path.glob("index-*.jsonl"):
+            offset = self._index_offsets.get(index_path.name, 0)
+            with open(index_path, "rb") as index_file:
+                index_file.seek(offset)
+                for line in index_file:
+                    # a line without newline is still being written
+                    if not line.endswith(b"\n"):
+                        break
+                    offset += len(line)
+                    entry = json.loads(line)
+                    current = self._index.get(entry["name"])
+                    if current is None or current["time"] <= entry["time"]:
+                        self._index[entry["name"]] = entry
+            self._index_offsets[index_path.name] = offset
+
+    def _lookup(self, name: str) -> Optional[Dict[str, Any]]:
+        entry = self._index.get(name)
+        if entry is None:
+            self.refresh()
+            entry = self._index.get(name)
+        return entry
+
+    def __contains__(self, name: str) -> bool:
+        return self._lookup(name) is not None
+
+    def names(self) -> List[str]:
+        """Names of all the blobs in the store
+
+        Returns:
+            List[str]: Names
+        """
+        self.refresh()
+        return list(self._index.keys())
+
+    def size(self, name: str) -> int:
+        """Size of a blob, 0 if it is not in the store
+
+        Args:
+            name (str): Name of the blob
+
+        Returns:
+            int: Size in bytes
+        """
+        entry = self._lookup(name)
+        return 0 if entry is None else entry["length"]
+
+    def get(self, name: str) -> bytes:
+        """Reads a blob
+
+        Args:
+            name (str): Name of the blob
+
+        Raises:
+            KeyError: If the name is not in the store
+
+        Returns:
+            bytes: Content of the blob
+        """
+        with self._lock:
+            return self._read(name)
+
+    def _read(self, name: str) -> bytes:
+        entry = self._lookup(name)
+        if entry is None:
+            raise KeyError(f"{name} not found in {self.path}")
+        if self._reader_pid != os.getpid():
+            # a forked process must not share the file offsets of its parent
+            self._readers = dict()
+            self._reader_pid = os.getpid()
+        reader = self._readers.get(entry["shard"])
+        if reader is None:
+            reader = open(self.path / entry["shard"], "rb")
+            self._readers[entry["shard"]] = reader
+        reader.seek(entry["offset"])
+        return reader.read(entry["length"])
+
+    def _open_writer(self) -> None:
+        """Opens the shard and the index of the current process. A forked process
+           gets its own files, because it has another pid."""
+        if self._writer_pid != os.getpid():
+            self._writer_pid = os.getpid()
+            self._writer_id = (
+                f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            )
+            self._shard_number = 0
+            self._shard_file = None
+            self._index_file = open(
+                self.path / f"index-{self._writer_id}.jsonl", "a")
+        if self._shard_file is None or self._shard_file.tell() >= self.max_shard_size:
+            if self._shard_file is not None:
+                self._shard_file.close()
+                self._shard_number += 1
+            self._shard_file = open(
+                self.path / f"shard-{self._writer_id}-{self._shard_number}.data", "ab"
+            )
+
+    def put(self, name: str, data: bytes) -> None:
+        """Appends a blob. The index entry is written after the data, such that
+           readers never see an entry of incomplete data.
+
+        Args:
+            name (str): Name of the blob
+            data (bytes): Content of the blob
+        """
+        with self._lock:
+            self._write(name, data)
+
+    def _write(self, name: str, data: bytes) -> None:
+        self._open_writer()
+        offset = self._shard_file.tell()
+        self._shard_file.write(data)
+        self._shard_file.flush()
+        entry = {
+            "name": name,
+            "shard": Path(self._shard_file.name).name,
+            "offset": offset,
+            "length": len(data),
+            "time": time.time(),
+        }
+        self._index_file.write(json.dumps(entry) + "\n")
+        self._index_file.flush()
+        self._index[name] = entry
+
+    def close(self) -> None:
+        """Closes all open files"""
+        for reader in self._readers.values():
+            reader.close()
+        for file in [self._shard_file, self._index_file]:
+            if file is not None:
+                file.close()
+        self._reset()
+
+
+# Stores opened for reading, by directory
+_OPEN_STORES: Dict[Path, ShardedStore] = dict()
+
+
+def get_store(path: Union[str, Path]) -> Optional[ShardedStore]:
+    """Store that a file was saved to instead of to the file system
+
+    Args:
+        path (Union[str, Path]): Path of the file
+
+    Returns:
+        Optional[ShardedStore]: Store of the directory of the file, None if there is
+            no store or the file is not in it
+    """
+    path = Path(path)
+    directory = path.parent.resolve()
+    store = _OPEN_STORES.get(directory)
+    if store is None:
+        if not ShardedStore.exists(directory):
+            return None
+        store = ShardedStore(directory)
+        _OPEN_STORES[directory] = store
+    if path.name not in store:
+        return None
+    return store
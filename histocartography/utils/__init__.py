@@ -1,9 +1,18 @@
 import importlib
 from typing import Any, Iterable, Tuple
 
-from .io import download_example_data, download_test_data
-from .io import download_box_link, is_box_url
-from .graph import set_graph_on_cuda, set_graph_on_cpu
+from .lazy import lazy_attributes
+
+_LAZY_ATTRIBUTES = {
+    'download_example_data': '.io',
+    'download_test_data': '.io',
+    'download_box_link': '.io',
+    'is_box_url': '.io',
+    'set_graph_on_cuda': '.graph',
+    'set_graph_on_cpu': '.graph',
+}
+
+__getattr__, __dir__ = lazy_attributes(__name__, _LAZY_ATTRIBUTES)
 
 __all__ = [
     'download_example_data',
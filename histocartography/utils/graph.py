@@ -1,6 +1,10 @@
+import os
+import tempfile
+
 import networkx as nx
 import numpy as np
 import dgl
+from dgl.data.utils import load_graphs, save_graphs
 
 
 def adj_to_networkx(
@@ -157,3 +161,35 @@ def copy_graph(x):
     for k, v in x.edata.items():
         graph_copy.edata[k] = v.clone()
     return graph_copy
+
+
+def load_graphs_from_file(file):
+    """
+    Load DGL graphs from a path or a binary file object, e.g. the
+    content of a file in a sharded store.
+    """
+    if not hasattr(file, 'read'):
+        graphs, _ = load_graphs(str(file))  # DGL cannot handle pathlib.Path
+        return graphs
+    # DGL can only read from paths
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        graph_path = os.path.join(tmp_dir, 'graphs.bin')
+        with open(graph_path, 'wb') as graph_file:
+            graph_file.write(file.read())
+        graphs, _ = load_graphs(graph_path)
+    return graphs
+
+
+def save_graphs_to_file(file, graphs):
+    """
+    Save DGL graphs to a path or a binary file object.
+    """
+    if not hasattr(file, 'write'):
+        save_graphs(str(file), graphs)
+        return
+    # DGL can only write to paths
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        graph_path = os.path.join(tmp_dir, 'graphs.bin')
+        save_graphs(graph_path, graphs)
+        with open(graph_path, 'rb') as graph_file:
+            file.write(graph_file.read())
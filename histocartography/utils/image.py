@@ -29,16 +29,53 @@ def pad_image(image, im_h, im_w):
     return image, last_h, last_w
 
 
-def extract_patches_from_image(image, im_h, im_w):
+def extract_patch_grid(image, im_h, im_w, mask=None):
+    """Pads the image and returns its HoverNet windows as a strided view of the padded image,
+       i.e. without copying the patches.
+
+    Args:
+        image (np.ndarray): RGB image of shape (im_h, im_w, 3)
+        im_h (int): Height of the image
+        im_w (int): Width of the image
+        mask (np.ndarray, optional): Tissue mask, the background of the padded image is set
+            to white. Defaults to None.
+
+    Returns:
+        Tuple[np.ndarray, List[List[int]]]: Read-only view of shape
+            (nr_rows, nr_cols, WIN_SIZE[0], WIN_SIZE[1], 3) and the (left, bottom, right, top)
+            coordinates of the predicted region of every window in row-major order
+    """
     x, last_h, last_w = pad_image(image, im_h, im_w)
-    sub_patches = []
-    coords = []
-    # generating subpatches from original
-    for row in range(0, last_h, STEP_SIZE[0]):
-        for col in range(0, last_w, STEP_SIZE[1]):
-            win = x[row:row + WIN_SIZE[0],
-                    col:col + WIN_SIZE[1]]
-            sub_patches.append(win)
-            # left, bottom, right, top
-            coords.append([col, row, col + STEP_SIZE[0], row + STEP_SIZE[1]])
+    if mask is not None:
+        # mask the padded copy instead of the input image
+        padded_mask, _, _ = pad_image(mask[:, :, None], im_h, im_w)
+        x[padded_mask[:, :, 0] == 0] = 255
+    rows = range(0, last_h, STEP_SIZE[0])
+    cols = range(0, last_w, STEP_SIZE[1])
+    row_stride, col_stride, channel_stride = x.strides
+    grid = np.lib.stride_tricks.as_strided(
+        x,
+        shape=(len(rows), len(cols), WIN_SIZE[0], WIN_SIZE[1], x.shape[2]),
+        strides=(
+            STEP_SIZE[0] * row_stride,
+            STEP_SIZE[1] * col_stride,
+            row_stride,
+            col_stride,
+            channel_stride,
+        ),
+        writeable=False,
+    )
+    # left, bottom, right, top
+    coords = [
+        [col, row, col + STEP_SIZE[0], row + STEP_SIZE[1]]
+        for row in rows
+        for col in cols
+    ]
+    return grid, coords
+
+
+def extract_patches_from_image(image, im_h, im_w, mask=None):
+    grid, coords = extract_patch_grid(image, im_h, im_w, mask)
+    # generating subpatches from original, as views of the padded image
+    sub_patches = [window for windows in grid for window in windows]
     return sub_patches, coords
@@ -1,6 +1,5 @@
 import json
 import os
-import torch
 import numpy as np
 import PIL
 from PIL import Image
@@ -43,6 +42,8 @@ def h5_to_tensor(h5_object, device):
     """
     Convert h5 object into torch tensor
     """
+    import torch
+
     tensor = torch.from_numpy(np.array(h5_object[()])).to(device)
     return tensor
 
@@ -0,0 +1,36 @@
+"""Lazy attributes of packages, such that importing a package does not import all of its modules"""
+import importlib
+from typing import Any, Callable, Dict, List, Tuple
+
+
+def lazy_attributes(
+    package_name: str, attributes: Dict[str, str]
+) -> Tuple[Callable[[str], Any], Callable[[], List[str]]]:
+    """Builds the module-level __getattr__ and __dir__ functions (PEP 562) of a package whose
+       exported attributes are imported from their module on first access. Heavy dependencies
+       (torch, dgl, cv2, skimage, ...) are then only imported by the code that uses them.
+
+    Args:
+        package_name (str): Name of the package, i.e. __name__ in its __init__
+        attributes (Dict[str, str]): Exported attribute -> module that defines it, relative to
+            the package (e.g. ".io")
+
+    Returns:
+        Tuple[Callable[[str], Any], Callable[[], List[str]]]: __getattr__ and __dir__ of the package
+    """
+
+    def __getattr__(name: str) -> Any:
+        if name not in attributes:
+            raise AttributeError(
+                f"module {package_name!r} has no attribute {name!r}")
+        module = importlib.import_module(attributes[name], package_name)
+        value = getattr(module, name)
+        # cache the attribute in the package, such that __getattr__ is only called once
+        setattr(importlib.import_module(package_name), name, value)
+        return value
+
+    def __dir__() -> List[str]:
+        package = importlib.import_module(package_name)
+        return sorted(set(vars(package)) | set(attributes))
+
+    return __getattr__, __dir__
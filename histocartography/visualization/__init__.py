@@ -1,11 +1,15 @@
-from .visualization import (
-    OverlayGraphVisualization,
-    InstanceImageVisualization,
-    HACTVisualization,
-)
+from ..utils.lazy import lazy_attributes
+
+_LAZY_ATTRIBUTES = {
+    "OverlayGraphVisualization": ".visualization",
+    "InstanceImageVisualization": ".visualization",
+    "HACTVisualization": ".visualization",
+}
+
+__getattr__, __dir__ = lazy_attributes(__name__, _LAZY_ATTRIBUTES)
 
 __all__ = [
     "OverlayGraphVisualization",
     "InstanceImageVisualization",
     "HACTVisualization",
-]
\ No newline at end of file
+]
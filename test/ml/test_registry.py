@@ -0,0 +1,66 @@
+"""Unit test for ml.registry"""
+import unittest
+import os
+import shutil
+import torch
+
+from histocartography.ml.registry import clear_models, get_model, load_checkpoint
+
+
+class RegistryTestCase(unittest.TestCase):
+    """RegistryTestCase class."""
+
+    @classmethod
+    def setUpClass(self):
+        self.current_path = os.path.dirname(__file__)
+        self.out_path = os.path.join(
+            self.current_path, '..', 'data', 'registry_test')
+        if os.path.exists(self.out_path) and os.path.isdir(self.out_path):
+            shutil.rmtree(self.out_path)
+        os.makedirs(self.out_path)
+
+    def test_get_model(self):
+        """
+        Test that a model is loaded once per key and shared read-only.
+        """
+        clear_models()
+        nr_loads = []
+
+        def load():
+            nr_loads.append(1)
+            return torch.nn.Linear(4, 2)
+
+        model = get_model('linear', 'cpu', 'float32', load)
+        self.assertIs(get_model('linear', torch.device('cpu'), 'float32', load), model)
+        self.assertEqual(len(nr_loads), 1)
+        self.assertFalse(model.training)
+        self.assertFalse(any(p.requires_grad for p in model.parameters()))
+
+        # another precision is another model
+        self.assertIsNot(get_model('linear', 'cpu', 'bfloat16', load), model)
+        self.assertEqual(len(nr_loads), 2)
+
+        clear_models()
+        self.assertIsNot(get_model('linear', 'cpu', 'float32', load), model)
+        self.assertEqual(len(nr_loads), 3)
+        clear_models()
+
+    def test_load_checkpoint(self):
+        """
+        Test loading checkpoints with and without memory mapping.
+        """
+        state_dict = torch.nn.Linear(4, 2).state_dict()
+        for name, zipfile in [('zip.pt', True), ('legacy.pt', False)]:
+            path = os.path.join(self.out_path, name)
+            torch.save(state_dict, path, _use_new_zipfile_serialization=zipfile)
+            loaded = load_checkpoint(path, map_location='cpu')
+            self.assertEqual(set(loaded.keys()), set(state_dict.keys()))
+            for key, value in state_dict.items():
+                self.assertTrue(torch.equal(loaded[key], value))
+
+    def tearDown(self):
+        """Tear down the tests."""
+
+
+if __name__ == "__main__":
+    unittest.main()
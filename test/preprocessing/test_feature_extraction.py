@@ -1,13 +1,25 @@
 """Unit test for preprocessing.feature_extraction"""
 import unittest
+import cv2
 import numpy as np
 import pandas as pd
 import yaml
 import os
 import torch
 import shutil
+from copy import deepcopy
+from PIL import Image
+from skimage.feature import greycomatrix, greycoprops
+from skimage.measure import regionprops
+from skimage.segmentation import slic
 
 from histocartography import PipelineRunner
+from histocartography.preprocessing import (
+    DeepFeatureExtractor,
+    GridDeepFeatureExtractor,
+    HandcraftedFeatureExtractor,
+)
+from histocartography.preprocessing.feature_extraction import HANDCRAFTED_FEATURES_NAMES
 from histocartography.utils import download_test_data
 
 
@@ -62,6 +74,93 @@ class FeatureExtractionTestCase(unittest.TestCase):
 
         self.assertTrue(np.array_equal(features, reload_features))
 
+    def test_handcrafted_features_match_regionprops(self):
+        """
+        Test that the handcrafted features of all the instances, computed at once, match
+        the per-region regionprops and GLCM features.
+        """
+        image = np.array(Image.open(os.path.join(self.image_path, self.image_name)).convert('RGB'))
+        instance_map = slic(image, n_segments=500, compactness=20, start_label=1)
+        # instance with a hole
+        holed = instance_map.max() + 1
+        instance_map[100:120, 100:120] = holed
+        instance_map[108:112, 108:112] = holed + 1
+        # instance with a hole and a second component, of Euler number 1
+        ring = instance_map.max() + 1
+        instance_map[130:137, 130:137] = ring
+        instance_map[132:135, 132:135] = ring + 1
+        instance_map[140, 140] = ring
+        features = HandcraftedFeatureExtractor()._extract_features(image, instance_map).numpy()
+
+        regions = regionprops(instance_map)
+        self.assertEqual(features.shape, (len(regions), 24))
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        for row, region in enumerate(regions):
+            min_row, min_col, max_row, max_col = region.bbox
+            glcm = greycomatrix(
+                gray[min_row:max_row, min_col:max_col] * region.image, [1], [0]
+            )[1:, 1:]
+            expected = {
+                name: region[name] for name in [
+                    'area', 'convex_area', 'eccentricity', 'equivalent_diameter',
+                    'euler_number', 'extent', 'filled_area', 'major_axis_length',
+                    'minor_axis_length', 'perimeter', 'solidity'
+                ]
+            }
+            expected['roundness'] = 4 * np.pi * region.area / region.perimeter ** 2
+            for prop in ['contrast', 'dissimilarity', 'homogeneity', 'energy', 'ASM']:
+                expected['glcm_' + prop] = greycoprops(glcm, prop)[0, 0]
+            expected['glcm_dispersion'] = np.std(glcm)
+            for name, value in expected.items():
+                self.assertAlmostEqual(
+                    features[row, HANDCRAFTED_FEATURES_NAMES[name]], value,
+                    delta=1e-4 * max(1, abs(value)), msg=name
+                )
+            # orientations of -pi/2 and pi/2 are the same
+            orientation = features[row, HANDCRAFTED_FEATURES_NAMES['orientation']]
+            self.assertAlmostEqual(
+                np.cos(2 * orientation), np.cos(2 * region.orientation), places=4)
+        labels = [region.label for region in regions]
+        self.assertEqual(
+            features[labels.index(holed), HANDCRAFTED_FEATURES_NAMES['euler_number']], 0)
+        self.assertEqual(
+            features[labels.index(ring), HANDCRAFTED_FEATURES_NAMES['euler_number']], 1)
+        self.assertEqual(
+            features[labels.index(ring), HANDCRAFTED_FEATURES_NAMES['filled_area']], 50)
+
+    def test_handcrafted_feature_extractor_parallel(self):
+        """
+        Test that the handcrafted features computed in spatial chunks on a thread or process
+        pool are the ones of the serial extractor, in label order.
+        """
+        image = np.array(Image.open(os.path.join(self.image_path, self.image_name)).convert('RGB'))
+        instance_map = slic(image, n_segments=500, compactness=20, start_label=1)
+        # labels in another order than the rows
+        instance_map = np.random.default_rng(0).permutation(instance_map.max() + 1)[instance_map] + 1
+        features = HandcraftedFeatureExtractor()._extract_features(image, instance_map)
+        for executor in ['thread', 'process']:
+            extractor = HandcraftedFeatureExtractor(n_jobs=2, executor=executor)
+            parallel_features = extractor._extract_features(image, instance_map)
+            self.assertEqual(parallel_features.shape, features.shape)
+            self.assertTrue(torch.allclose(parallel_features, features, equal_nan=True))
+
+    def test_handcrafted_feature_extractor_output_dir(self):
+        """
+        Test that the output directory of the handcrafted feature extractor depends on the
+        extracted features, but not on the workers that compute them.
+        """
+        extractor = HandcraftedFeatureExtractor(save_path=self.out_path)
+        self.assertEqual(extractor.output_dir.name, 'HandcraftedFeatureExtractor()')
+        self.assertNotEqual(
+            HandcraftedFeatureExtractor(save_path=self.out_path, feature_names=['area']).output_dir,
+            extractor.output_dir
+        )
+        for kwargs in [dict(n_jobs=4), dict(n_jobs=2, executor='process')]:
+            self.assertEqual(
+                HandcraftedFeatureExtractor(save_path=self.out_path, **kwargs).output_dir,
+                extractor.output_dir
+            )
+
     def test_deep_tissue_feature_extractor_noaug(self):
         """
         Test deep tissue feature extractor with pipeline runner and without augmentation.
@@ -185,6 +284,65 @@ class FeatureExtractionTestCase(unittest.TestCase):
         # check number features
         self.assertEqual(features.shape[1], 1280)
 
+    def test_deep_nuclei_feature_extractor_batch(self):
+        """Test that deep features of several images batched together match the per-image features."""
+
+        config_fname = os.path.join(self.current_path,
+                                    'config',
+                                    'feature_extraction',
+                                    'deep_nuclei_feature_extractor_noaug.yml')
+        with open(config_fname, 'r') as file:
+            config = yaml.safe_load(file)
+        config['stages'][2]['preprocessing']['params']['batch_size'] = 7
+
+        pipeline = PipelineRunner(**config)
+        inputs = {
+            'image_path': os.path.join(self.image_path, self.image_name),
+            'nuclei_map_path': os.path.join(self.nuclei_map_path, self.nuclei_map_name)
+        }
+        features = pipeline.run(**inputs)['features']
+        outputs = pipeline.run_batch([inputs] * 3)
+
+        self.assertEqual(len(outputs), 3)
+        for output in outputs:
+            self.assertEqual(output['features'].shape, features.shape)
+            self.assertTrue(torch.allclose(output['features'], features, atol=1e-5))
+
+    def test_deep_nuclei_feature_extractor_optimized(self):
+        """Test that the frozen network with folded batch norms gives the same deep features."""
+
+        config_fname = os.path.join(self.current_path,
+                                    'config',
+                                    'feature_extraction',
+                                    'deep_nuclei_feature_extractor_noaug.yml')
+        with open(config_fname, 'r') as file:
+            config = yaml.safe_load(file)
+
+        inputs = {
+            'image_path': os.path.join(self.image_path, self.image_name),
+            'nuclei_map_path': os.path.join(self.nuclei_map_path, self.nuclei_map_name)
+        }
+        features = PipelineRunner(**deepcopy(config)).run(**inputs)['features']
+        config['stages'][2]['preprocessing']['params']['optimize'] = True
+        for _ in range(2):  # the second pipeline loads the cached frozen network
+            pipeline = PipelineRunner(**deepcopy(config))
+            optimized_features = pipeline.run(**inputs)['features']
+            self.assertIsInstance(
+                pipeline.stages[2].patch_feature_extractor.model, torch.jit.ScriptModule)
+            self.assertEqual(optimized_features.shape, features.shape)
+            self.assertTrue(torch.allclose(optimized_features, features, atol=1e-4))
+
+    def test_deep_feature_extractors_share_model(self):
+        """Test that the deep feature extractors of the same architecture share the network."""
+
+        extractor = DeepFeatureExtractor(
+            architecture='mobilenet_v2', patch_size=72, resize_size=224)
+        grid_extractor = GridDeepFeatureExtractor(
+            architecture='mobilenet_v2', patch_size=224)
+        self.assertIs(
+            extractor.patch_feature_extractor.model,
+            grid_extractor.patch_feature_extractor.model)
+
     def test_deep_nuclei_feature_extractor_aug(self):
         """Test deep nuclei feature extractor with pipeline runner and with augmentation."""
 
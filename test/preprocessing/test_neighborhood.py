@@ -0,0 +1,93 @@
+"""Unit test for preprocessing.neighborhood"""
+import unittest
+import numpy as np
+import os
+from PIL import Image
+from scipy.spatial.distance import cdist
+from skimage.measure import regionprops
+from skimage.segmentation import slic
+
+from histocartography.preprocessing.neighborhood import (
+    SpatialNeighborhood,
+    clear_spatial_neighborhoods,
+    get_spatial_neighborhood,
+    instance_centroids,
+)
+from histocartography.utils import download_test_data
+
+
+class NeighborhoodTestCase(unittest.TestCase):
+    """NeighborhoodTestCase class."""
+
+    @classmethod
+    def setUpClass(self):
+        self.current_path = os.path.dirname(__file__)
+        self.data_path = os.path.join(self.current_path, '..', 'data')
+        download_test_data(self.data_path)
+        self.image_path = os.path.join(self.data_path, 'images')
+        self.image_name = '283_dcis_4.png'
+        image = np.array(Image.open(os.path.join(self.image_path, self.image_name)).convert('RGB'))
+        self.instance_map = slic(image, n_segments=500, compactness=20, start_label=1)
+
+    def test_instance_centroids(self):
+        """
+        Test that the centroids are the regionprops centroids, in label order.
+        """
+        instance_map = self.instance_map.copy()
+        instance_map[instance_map == 3] = 0  # missing label
+        centroids = instance_centroids(instance_map)
+        expected = np.array([region.centroid for region in regionprops(instance_map)])
+        self.assertEqual(centroids.shape, expected.shape)
+        self.assertTrue(np.allclose(centroids, expected))
+
+    def test_query(self):
+        """
+        Test the k nearest neighbors against all pairwise distances.
+        """
+        neighborhood = SpatialNeighborhood.from_instance_map(self.instance_map)
+        distances = cdist(neighborhood.centroids, neighborhood.centroids)
+        expected = np.sort(distances, axis=1)
+
+        nearest, indices = neighborhood.query(6)
+        self.assertEqual(nearest.shape, (len(neighborhood), 6))
+        self.assertTrue(np.allclose(nearest, expected[:, :6]))
+        self.assertTrue(np.allclose(
+            np.take_along_axis(distances, indices, axis=1), nearest))
+        # smaller queries reuse the larger one
+        nearest, _ = neighborhood.query(3)
+        self.assertTrue(np.allclose(nearest, expected[:, :3]))
+
+        others, indices = neighborhood.query_others(5)
+        self.assertTrue(np.allclose(others, expected[:, 1:6]))
+        self.assertFalse(np.any(indices == np.arange(len(neighborhood))[:, np.newaxis]))
+
+    def test_query_others_with_same_centroids(self):
+        """
+        Test that an instance is never its own neighbor, even among instances with the same centroid.
+        """
+        centroids = np.array([[0, 0], [0, 0], [0, 0], [0, 0], [5, 5]])
+        distances, indices = SpatialNeighborhood(centroids).query_others(2)
+        self.assertEqual(indices.shape, (5, 2))
+        self.assertFalse(np.any(indices == np.arange(5)[:, np.newaxis]))
+        self.assertTrue(np.allclose(distances[:4], 0))
+
+    def test_get_spatial_neighborhood(self):
+        """
+        Test that the neighborhood of an instance map is computed once.
+        """
+        clear_spatial_neighborhoods()
+        neighborhood = get_spatial_neighborhood(self.instance_map)
+        self.assertIs(get_spatial_neighborhood(self.instance_map.copy()), neighborhood)
+        other_map = self.instance_map.copy()
+        other_map[0, 0] = 0
+        self.assertIsNot(get_spatial_neighborhood(other_map), neighborhood)
+        clear_spatial_neighborhoods()
+        self.assertIsNot(get_spatial_neighborhood(self.instance_map), neighborhood)
+        clear_spatial_neighborhoods()
+
+    def tearDown(self):
+        """Tear down the tests."""
+
+
+if __name__ == "__main__":
+    unittest.main()
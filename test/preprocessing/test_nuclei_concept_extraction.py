@@ -10,6 +10,7 @@ from PIL import Image
 from histocartography import PipelineRunner
 from histocartography.preprocessing import NucleiExtractor, H5Loader
 from histocartography.preprocessing import NucleiConceptExtractor
+from histocartography.preprocessing.feature_extraction import HANDCRAFTED_FEATURES_NAMES
 from histocartography.utils import download_test_data
 
 import time 
@@ -88,6 +89,34 @@ class NucleiConceptExtractionTestCase(unittest.TestCase):
         # check number of node features
         self.assertEqual(concepts.shape[1], 2)
 
+    def test_concept_extractor_computes_requested_concepts(self):
+        """Test that a list of concepts gives the columns of all the concepts, in the order of the list."""
+
+        image = np.array(
+            Image.open(
+                os.path.join(
+                    self.image_path,
+                    self.image_name)))
+        h5_loader = H5Loader()
+        instance_map, _ = h5_loader._process(
+            path=os.path.join(
+                self.nuclei_map_path,
+                self.nuclei_map_name
+            )
+        )
+
+        all_concepts = NucleiConceptExtractor().process(image, instance_map)
+        for concept_names in [
+            ['eccentricity', 'area'],
+            ['roundness', 'solidity'],
+            ['glcm_ASM', 'glcm_contrast'],
+            ['std_crowdedness', 'euler_number'],
+        ]:
+            concepts = NucleiConceptExtractor(
+                concept_names=','.join(concept_names)).process(image, instance_map)
+            indices = [HANDCRAFTED_FEATURES_NAMES[c] for c in concept_names]
+            self.assertTrue(np.array_equal(concepts, all_concepts[:, indices]))
+
     def tearDown(self):
         """Tear down the tests."""
 
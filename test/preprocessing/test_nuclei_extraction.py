@@ -7,9 +7,16 @@ import shutil
 from PIL import Image
 import matplotlib
 import yaml
+import h5py
+import torch
 
 from histocartography import PipelineRunner
+from histocartography.ml.inference import optimized_model_path
 from histocartography.preprocessing import NucleiExtractor
+from histocartography.preprocessing.batching import iter_patch_batches
+from histocartography.preprocessing.nuclei_extraction import (
+    ImageToPatchDataset, patches_to_tensor, process_instance, process_instance_tiled)
+from histocartography.utils.image import pad_image
 from histocartography.utils import download_test_data
 
 
@@ -115,6 +122,157 @@ class NucleiExtractionTestCase(unittest.TestCase):
         self.assertEqual(instance_map.shape[1], image.shape[1])
         self.assertEqual(len(instance_centroids), 331)
 
+    def test_tiled_post_processing(self):
+        """Test that the tiled post-processing finds the same nuclei as the serial one."""
+
+        # HoverNet-like predictions of a grid of round nuclei, some cut by the tiles
+        pred_map = np.zeros((300, 400, 3), dtype=np.float32)
+        rows, cols = np.mgrid[0:300, 0:400]
+        for center_y in range(20, 300, 40):
+            for center_x in range(15, 400, 37):
+                dy = (rows - center_y) / 12
+                dx = (cols - center_x) / 12
+                inside = dx ** 2 + dy ** 2 <= 1
+                pred_map[inside] = np.stack(
+                    [np.ones_like(dx), dx, dy], axis=-1)[inside]
+
+        serial = process_instance(pred_map)
+        tiled = process_instance_tiled(pred_map, tile_size=128, num_workers=0)
+        self.assertEqual(tiled.dtype, serial.dtype)
+        self.assertEqual(len(np.unique(tiled)), len(np.unique(serial)))
+        self.assertTrue(np.array_equal(tiled > 0, serial > 0))
+        for label in np.unique(serial)[1:]:
+            self.assertEqual(len(np.unique(tiled[serial == label])), 1)
+
+        # the worker processes give the same result
+        self.assertTrue(np.array_equal(
+            process_instance_tiled(pred_map, tile_size=128, num_workers=2), tiled))
+
+    def test_streaming_nuclei_extraction(self):
+        """Test nuclei extraction region by region into an h5 file."""
+
+        image = np.array(Image.open(os.path.join(self.image_path, self.image_name)))
+        extractor = NucleiExtractor()
+        instance_map, instance_centroids = extractor.process(image)
+
+        output_path = os.path.join(self.out_path, 'streaming.h5')
+        nr_nuclei = extractor.extract_to_file(
+            image, output_path, region_size=image.shape[0] // 2)
+        with h5py.File(output_path, 'r') as input_file:
+            streamed_map = input_file['instance_map'][()]
+            instance_ids = input_file['instance_ids'][()]
+            streamed_centroids = input_file['instance_centroids'][()]
+            instance_bboxes = input_file['instance_bboxes'][()]
+
+        self.assertEqual(streamed_map.dtype, np.uint32)
+        self.assertEqual(streamed_map.shape, instance_map.shape)
+        self.assertEqual(list(instance_ids), list(range(1, nr_nuclei + 1)))
+        self.assertEqual(streamed_centroids.shape, (nr_nuclei, 2))
+        self.assertEqual(instance_bboxes.shape, (nr_nuclei, 4))
+        self.assertTrue(set(np.unique(streamed_map)[1:]) <= set(instance_ids))
+        # the regions only change the nuclei at their borders
+        self.assertAlmostEqual(
+            nr_nuclei / len(instance_centroids), 1.0, delta=0.05)
+        self.assertGreater(np.mean((streamed_map > 0) == (instance_map > 0)), 0.95)
+
+    def test_image_to_patch_dataset(self):
+        """Test that the patch views converted by batch match the padded image windows."""
+
+        image = np.array(Image.open(os.path.join(self.image_path, self.image_name)))
+        padded_image, _, _ = pad_image(image, image.shape[0], image.shape[1])
+        dataset = ImageToPatchDataset(image)
+        nr_patches = 0
+        for _, coords, patches in iter_patch_batches(
+                [dataset], 3, batch_transform=patches_to_tensor):
+            self.assertEqual(patches.dtype, torch.float32)
+            self.assertTrue(patches.is_contiguous())
+            for (left, bottom, _, _), patch in zip(coords, patches):
+                window = padded_image[bottom:bottom + 256, left:left + 256]
+                self.assertTrue(torch.equal(
+                    patch, torch.from_numpy(window).permute(2, 0, 1).float() / 255))
+                nr_patches += 1
+        self.assertEqual(nr_patches, len(dataset))
+        # the patches share the memory of the padded image
+        self.assertEqual(
+            dataset[0][1].data_ptr(), dataset.patch_grid.data_ptr())
+
+    def test_skip_background_patches(self):
+        """Test that the patches without tissue are skipped and counted."""
+
+        image = np.array(Image.open(os.path.join(self.image_path, self.image_name)))
+        tissue_mask = np.zeros(image.shape[:2], dtype=np.uint8)
+        tissue_mask[:200, :200] = 1
+
+        all_patches = ImageToPatchDataset(image, tissue_mask)
+        tissue_patches = ImageToPatchDataset(
+            image, tissue_mask, min_tissue_fraction=0.05)
+        self.assertEqual(all_patches.nr_skipped_patches, 0)
+        self.assertGreater(tissue_patches.nr_skipped_patches, 0)
+        self.assertEqual(
+            tissue_patches.nr_patches + tissue_patches.nr_skipped_patches,
+            all_patches.nr_patches)
+        self.assertEqual(tissue_patches.max_x_coord, all_patches.max_x_coord)
+        for left, bottom, right, top in tissue_patches.coords:
+            self.assertTrue(tissue_mask[bottom:top, left:right].any())
+
+        extractor = NucleiExtractor(min_tissue_fraction=0.05)
+        (instance_map, _), metrics = extractor.profiled_process(image, tissue_mask)
+        self.assertEqual(metrics['nr_patches'], all_patches.nr_patches)
+        self.assertEqual(
+            metrics['nr_skipped_patches'], tissue_patches.nr_skipped_patches)
+        self.assertEqual(instance_map.shape, image.shape[:2])
+
+    def test_output_dir(self):
+        """Test that the parameters that change the nuclei name the output directory, but
+           only when they differ from their defaults."""
+
+        extractor = NucleiExtractor(save_path=self.out_path)
+        self.assertEqual(
+            extractor.output_dir.name, 'NucleiExtractor(pretrained_data=pannuke)')
+        output_dirs = [
+            NucleiExtractor(save_path=self.out_path, **kwargs).output_dir
+            for kwargs in [
+                dict(min_tissue_fraction=0.05),
+                dict(inference_mode='bfloat16'),
+                dict(inference_mode='int8'),
+                dict(inference_mode='int8', nr_calibration_batches=2),
+            ]
+        ]
+        self.assertEqual(len(set(output_dirs + [extractor.output_dir])), 5)
+        self.assertEqual(
+            NucleiExtractor(save_path=self.out_path, nr_calibration_batches=2).output_dir,
+            extractor.output_dir)
+
+    def test_optimized_nuclei_extractor(self):
+        """Test nuclei extraction with the frozen model with folded batch norms."""
+
+        image = np.array(Image.open(os.path.join(self.image_path, self.image_name)))
+        instance_map, _ = NucleiExtractor().process(image)
+        for _ in range(2):  # the second extractor loads the cached frozen model
+            extractor = NucleiExtractor(optimize=True)
+            self.assertTrue(os.path.isfile(optimized_model_path(
+                extractor.model_path, torch.zeros(1, 3, 256, 256))))
+            optimized_map, optimized_centroids = extractor.process(image)
+            self.assertEqual(len(optimized_centroids), 331)
+            self.assertTrue(np.array_equal(optimized_map > 0, instance_map > 0))
+
+    def test_inference_modes(self):
+        """Test that the reduced-precision and int8 models find the same nuclei as float32."""
+
+        image = np.array(Image.open(os.path.join(self.image_path, self.image_name)))
+        instance_map, instance_centroids = NucleiExtractor().process(image)
+        for inference_mode in ['bfloat16', 'channels_last', 'int8']:
+            extractor = NucleiExtractor(inference_mode=inference_mode)
+            mode_map, mode_centroids = extractor.process(image)
+            self.assertTrue(extractor.calibrated)
+            self.assertEqual(mode_map.shape, instance_map.shape)
+            dice = 2 * np.sum((mode_map > 0) & (instance_map > 0)) / \
+                (np.sum(mode_map > 0) + np.sum(instance_map > 0))
+            self.assertGreater(dice, 0.9, inference_mode)
+            self.assertAlmostEqual(
+                len(mode_centroids) / len(instance_centroids), 1.0,
+                delta=0.1, msg=inference_mode)
+
     def tearDown(self):
         """Tear down the tests."""
 
@@ -285,6 +285,24 @@ class StainNormalizationTestCase(unittest.TestCase):
                 precomputed_normalizer_path='some_other_dummy_path'
             )
 
+    def test_macenko_normalizer_process_batch(self):
+        """
+        Test that normalizing several images at once gives the same images as one at a time.
+        """
+        normalizer = MacenkoStainNormalizer()
+        image = np.array(
+            Image.open(
+                os.path.join(
+                    self.image_path,
+                    self.image_name)))
+        images = [image, image[:100, :150], image[50:, 20:]]
+        image_norms = normalizer.process_batch([(im,) for im in images])
+        self.assertEqual(len(image_norms), len(images))
+        self.assertEqual(
+            [m['batch_size'] for m in normalizer.last_batch_metrics], [3, 3, 3])
+        for im, image_norm in zip(images, image_norms):
+            self.assertTrue(np.array_equal(image_norm, normalizer.process(im)))
+
     def tearDown(self):
         """Tear down the tests."""
 
@@ -0,0 +1,120 @@
+"""Unit test for the content-addressed stage cache"""
+import unittest
+import numpy as np
+import yaml
+import os
+import shutil
+
+from histocartography import PipelineRunner
+from histocartography.cache import StageCache, compute_cache_key
+from histocartography.preprocessing import GaussianTissueMask
+from histocartography.utils import download_test_data
+
+
+class CacheTestCase(unittest.TestCase):
+    """CacheTestCase class."""
+
+    @classmethod
+    def setUpClass(self):
+        self.current_path = os.path.dirname(__file__)
+        self.data_path = os.path.join(self.current_path, 'data')
+        download_test_data(self.data_path)
+        self.image_path = os.path.join(self.data_path, 'images')
+        self.image_name = '283_dcis_4.png'
+        self.config_path = os.path.join(self.current_path, 'config', 'pipeline')
+        self.out_path = os.path.join(self.data_path, 'cache_test')
+        if os.path.exists(self.out_path) and os.path.isdir(self.out_path):
+            shutil.rmtree(self.out_path)
+        os.makedirs(self.out_path)
+
+    def test_cache_key(self):
+        """
+        Test that the cache key only depends on the semantic parameters and the inputs.
+        """
+        image = np.random.RandomState(0).randint(
+            0, 255, size=(64, 64, 3), dtype=np.uint8)
+        step = GaussianTissueMask(kernel_size=5)
+        key = compute_cache_key(step, image)
+
+        # 1. same parameters and same input content
+        self.assertEqual(key, compute_cache_key(
+            GaussianTissueMask(kernel_size=5), image.copy()))
+
+        # 2. saving location does not change the output
+        os.makedirs(os.path.join(self.out_path, 'key'))
+        saving_step = GaussianTissueMask(
+            kernel_size=5, save_path=os.path.join(self.out_path, 'key'))
+        self.assertEqual(key, compute_cache_key(saving_step, image))
+
+        # 3. different parameters or inputs
+        self.assertNotEqual(key, compute_cache_key(
+            GaussianTissueMask(kernel_size=7), image))
+        modified_image = image.copy()
+        modified_image[0, 0, 0] += 1
+        self.assertNotEqual(key, compute_cache_key(step, modified_image))
+        self.assertNotEqual(key, compute_cache_key(step, image[:32]))
+
+    def test_lru_eviction(self):
+        """
+        Test that the least recently used entries are evicted first.
+        """
+        cache = StageCache(os.path.join(self.out_path, 'lru'))
+        entry = np.zeros(1000, dtype=np.uint8)
+        for key in ['aa0', 'bb0', 'cc0']:
+            cache.put(key, entry)
+        entry_size = cache.size() // 3
+
+        # make 'aa0' the oldest entry, then use it
+        for i, key in enumerate(['aa0', 'bb0', 'cc0']):
+            os.utime(cache._entry_path(key), ns=(i * 10**9, i * 10**9))
+        hit, output = cache.get('aa0')
+        self.assertTrue(hit)
+        self.assertTrue(np.array_equal(output, entry))
+
+        cache.evict(max_size=2 * entry_size)
+        self.assertIn('aa0', cache)
+        self.assertNotIn('bb0', cache)
+        self.assertIn('cc0', cache)
+
+        hit, output = cache.get('bb0')
+        self.assertFalse(hit)
+        self.assertIsNone(output)
+
+        # bounded cache evicts on insertion
+        bounded_cache = StageCache(
+            os.path.join(self.out_path, 'bounded'), max_size=2 * entry_size)
+        for key in ['aa0', 'bb0', 'cc0']:
+            bounded_cache.put(key, entry)
+        self.assertLessEqual(bounded_cache.size(), 2 * entry_size)
+        self.assertIn('cc0', bounded_cache)
+
+    def test_pipeline_runner_with_cache(self):
+        """
+        Test that a pipeline with a cache reuses the outputs of a previous run.
+        """
+        with open(os.path.join(self.config_path, 'two_branches.yml'), 'r') as file:
+            config = yaml.safe_load(file)
+        cache_path = os.path.join(self.out_path, 'pipeline')
+        image_path = os.path.join(self.image_path, self.image_name)
+
+        expected = PipelineRunner(**config).run(image_path=image_path)
+
+        with open(os.path.join(self.config_path, 'two_branches.yml'), 'r') as file:
+            config = yaml.safe_load(file)
+        pipeline = PipelineRunner(cache_path=cache_path, **config)
+        pipeline.run(image_path=image_path)
+        # the image loader is not cached, the two other stages are
+        nr_entries = len(list(pipeline.cache._entries()))
+        self.assertEqual(nr_entries, 2)
+
+        output = pipeline.run(image_path=image_path)
+        self.assertEqual(len(list(pipeline.cache._entries())), nr_entries)
+        for key, value in expected.items():
+            self.assertTrue(np.array_equal(output[key], value))
+
+    def tearDown(self):
+        """Tear down the tests."""
+
+
+if __name__ == "__main__":
+    unittest.main()
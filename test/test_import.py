@@ -0,0 +1,68 @@
+"""Unit test for the import time of the package"""
+import unittest
+import json
+import subprocess
+import sys
+
+# Maximum time in seconds that importing histocartography may take
+IMPORT_TIME_BUDGET = 1.5
+
+# Dependencies that only the steps, models and explainers that use them may import
+HEAVY_MODULES = ['torch', 'torchvision', 'dgl', 'cv2', 'sklearn']
+
+
+def _import_in_subprocess(statement):
+    script = (
+        'import json, sys, time\n'
+        'start = time.perf_counter()\n'
+        f'{statement}\n'
+        'duration = time.perf_counter() - start\n'
+        f'print(json.dumps({{"time": duration, "heavy": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))\n'
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', script],
+        check=True,
+        capture_output=True,
+        text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+class ImportTestCase(unittest.TestCase):
+    """ImportTestCase class."""
+
+    def test_import_budget(self):
+        """
+        Test that importing the package is fast and does not import the heavy dependencies.
+        """
+        # warm up the file system cache
+        _import_in_subprocess('import histocartography')
+        result = _import_in_subprocess('import histocartography')
+        self.assertEqual(result['heavy'], [])
+        self.assertLess(result['time'], IMPORT_TIME_BUDGET)
+
+        for package in ['preprocessing', 'ml', 'interpretability', 'visualization', 'utils']:
+            result = _import_in_subprocess(f'import histocartography.{package}')
+            self.assertEqual(result['heavy'], [], package)
+
+    def test_lazy_attributes(self):
+        """
+        Test that the exported classes are imported on first access.
+        """
+        result = _import_in_subprocess(
+            'from histocartography.preprocessing import ImageLoader, H5Loader')
+        self.assertEqual(result['heavy'], [])
+
+        import histocartography.preprocessing as preprocessing
+        from histocartography.preprocessing.io import ImageLoader
+        self.assertIn('ImageLoader', dir(preprocessing))
+        self.assertIs(preprocessing.ImageLoader, ImageLoader)
+        with self.assertRaises(AttributeError):
+            preprocessing.UnknownStep
+
+    def tearDown(self):
+        """Tear down the tests."""
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,395 @@
+"""Unit test for pipeline"""
+import unittest
+import json
+import weakref
+from copy import deepcopy
+import numpy as np
+import yaml
+import os
+import shutil
+import h5py
+import pandas as pd
+
+from histocartography import PipelineRunner, BatchPipelineRunner, SweepPipelineRunner
+from histocartography.preprocessing import GaussianTissueMask
+from histocartography.utils import download_test_data
+
+
+class PipelineTestCase(unittest.TestCase):
+    """PipelineTestCase class."""
+
+    @classmethod
+    def setUpClass(self):
+        self.current_path = os.path.dirname(__file__)
+        self.data_path = os.path.join(self.current_path, 'data')
+        download_test_data(self.data_path)
+        self.image_path = os.path.join(self.data_path, 'images')
+        self.image_name = '283_dcis_4.png'
+        self.config_path = os.path.join(self.current_path, 'config', 'pipeline')
+        self.preprocessing_config_path = os.path.join(
+            self.current_path, 'preprocessing', 'config')
+        self.out_path = os.path.join(self.data_path, 'pipeline_test')
+        if os.path.exists(self.out_path) and os.path.isdir(self.out_path):
+            shutil.rmtree(self.out_path)
+        os.makedirs(self.out_path)
+
+    def _load_config(self, config_fname):
+        with open(config_fname, 'r') as file:
+            return yaml.safe_load(file)
+
+    def _build_metadata(self, nr_rows):
+        return pd.DataFrame(
+            {'image_path': [os.path.join(self.image_path, self.image_name)] * nr_rows},
+            index=[f'image_{i}' for i in range(nr_rows)]
+        )
+
+    def test_batch_pipeline_runner_with_worker_pool(self):
+        """
+        Test that the multi-core batch pipeline runner processes all the chunks.
+        """
+        config = self._load_config(os.path.join(
+            self.preprocessing_config_path, 'superpixels', 'slic_extractor.yml'))
+        metadata = self._build_metadata(5)
+        out_path = os.path.join(self.out_path, 'worker_pool')
+        os.makedirs(out_path)
+
+        pipeline = BatchPipelineRunner(
+            save_path=out_path,
+            pipeline_config=config)
+        pipeline.run(metadata=metadata, cores=2, chunksize=2)
+
+        expected = PipelineRunner(**self._load_config(os.path.join(
+            self.preprocessing_config_path, 'superpixels', 'slic_extractor.yml'))).run(
+            image_path=os.path.join(self.image_path, self.image_name))
+        final_path = pipeline._build_pipeline_runner().final_path
+        for name in metadata.index:
+            output_file = os.path.join(final_path, f'{name}.h5')
+            self.assertTrue(os.path.exists(output_file))
+            with h5py.File(output_file, 'r') as f:
+                superpixels = f['default_key_0'][()]
+            self.assertTrue(np.array_equal(superpixels, expected['superpixels']))
+
+    def test_pipeline_runner_with_thread_executor(self):
+        """
+        Test that running independent stages concurrently gives the same outputs.
+        """
+        config = self._load_config(
+            os.path.join(self.config_path, 'two_branches.yml'))
+        image_path = os.path.join(self.image_path, self.image_name)
+
+        pipeline = PipelineRunner(**config)
+        expected = pipeline.run(image_path=image_path)
+
+        config = self._load_config(
+            os.path.join(self.config_path, 'two_branches.yml'))
+        pipeline = PipelineRunner(executor='thread', **config)
+        output = pipeline.run(image_path=image_path)
+
+        self.assertEqual(pipeline.stage_parents, [[], [0], [0]])
+        self.assertTrue(np.array_equal(expected['tissue_mask'], output['tissue_mask']))
+        self.assertTrue(np.array_equal(expected['superpixels'], output['superpixels']))
+
+        # the critical path starts with loading and contains a single branch
+        stage_names, path_time = pipeline.critical_path()
+        self.assertEqual(len(stage_names), 2)
+        self.assertEqual(stage_names[0], 'ImageLoader[0]')
+        self.assertLessEqual(path_time, sum(pipeline.stage_times))
+
+    def test_batch_pipeline_runner_trace(self):
+        """
+        Test that the measurements of all the workers are merged and written.
+        """
+        config = self._load_config(
+            os.path.join(self.config_path, 'two_branches.yml'))
+        metadata = self._build_metadata(4)
+        out_path = os.path.join(self.out_path, 'trace')
+        os.makedirs(out_path)
+        trace_path = os.path.join(out_path, 'trace.jsonl')
+
+        pipeline = BatchPipelineRunner(
+            save_path=out_path,
+            save_intermediate=True,
+            pipeline_config=config)
+        pipeline.run(metadata=metadata, cores=2, chunksize=1, trace_path=trace_path)
+
+        with open(trace_path, 'r') as file:
+            records = [json.loads(line) for line in file]
+        self.assertEqual(len(records), 4 * 3)
+        self.assertEqual(
+            sorted(set(record['name'] for record in records)), list(metadata.index))
+        for record in records:
+            self.assertGreaterEqual(record['wall_time'], 0)
+            self.assertGreaterEqual(record['bytes_written'], 0)
+
+        summary = pd.read_csv(
+            os.path.join(out_path, 'trace_summary.csv'), index_col=0)
+        self.assertEqual(
+            sorted(summary.index),
+            ['GaussianTissueMask[1]', 'ImageLoader[0]', 'SLICSuperpixelExtractor[2]'])
+        self.assertTrue((summary['calls'] == 4).all())
+        self.assertGreater(summary.loc['ImageLoader[0]', 'bytes_read'], 0)
+        self.assertGreater(
+            summary.loc['SLICSuperpixelExtractor[2]', 'bytes_written'], 0)
+
+        # a second run reuses the saved outputs
+        pipeline.run(metadata=metadata, cores=1, trace_memory=True)
+        self.assertEqual(
+            pipeline.summary.loc['SLICSuperpixelExtractor[2]', 'cache_hits'], 4)
+        self.assertTrue(
+            all(record['traced_peak'] is not None for record in pipeline.metrics))
+
+    def test_batch_pipeline_runner_iter_run(self):
+        """
+        Test that the outputs of the workers are streamed back in order.
+        """
+        config = self._load_config(
+            os.path.join(self.config_path, 'two_branches.yml'))
+        metadata = self._build_metadata(5)
+        image_path = os.path.join(self.image_path, self.image_name)
+        expected = PipelineRunner(**self._load_config(
+            os.path.join(self.config_path, 'two_branches.yml'))).run(
+            image_path=image_path)
+
+        pipeline = BatchPipelineRunner(save_path=None, pipeline_config=config)
+        names = list()
+        for name, output in pipeline.iter_run(
+                metadata,
+                cores=2,
+                preserve_order=True,
+                max_in_flight=2,
+                shared_memory_threshold=1):
+            names.append(name)
+            self.assertEqual(set(output.keys()), set(expected.keys()))
+            for key, value in expected.items():
+                self.assertTrue(np.array_equal(output[key], value))
+        self.assertEqual(names, list(metadata.index))
+        self.assertEqual(len(pipeline.metrics), 5 * 3)
+
+        # outputs can also be collected by run
+        outputs = pipeline.run(metadata, cores=2, return_out=True)
+        self.assertEqual(list(outputs.keys()), list(metadata.index))
+        for output in outputs.values():
+            self.assertTrue(np.array_equal(output['superpixels'], expected['superpixels']))
+
+    def test_pipeline_runner_loads_only_needed_outputs(self):
+        """
+        Test that saved intermediate outputs are only loaded if a recomputed stage needs them.
+        """
+        image_path = os.path.join(self.image_path, self.image_name)
+        out_path = os.path.join(self.out_path, 'demand_driven')
+        os.makedirs(out_path)
+
+        config = self._load_config(
+            os.path.join(self.config_path, 'two_branches.yml'))
+        pipeline = PipelineRunner(
+            output_path=out_path, save_intermediate=True, **config)
+        self.assertEqual(
+            pipeline._plan('image'), ['compute', 'compute', 'compute'])
+        expected = pipeline.run(output_name='image', image_path=image_path)
+
+        # everything is saved: the outputs are loaded and the image is not even read
+        self.assertEqual(pipeline._plan('image'), ['skip', 'load', 'load'])
+        output = pipeline.run(output_name='image', image_path=image_path)
+        self.assertIsNone(pipeline.stage_metrics[0])
+        for key, value in expected.items():
+            self.assertTrue(np.array_equal(output[key], value))
+
+        # a new stage only needs the image
+        config = self._load_config(
+            os.path.join(self.config_path, 'two_branches.yml'))
+        config['stages'].append({'preprocessing': {
+            'class': 'GaussianTissueMask',
+            'inputs': ['image'],
+            'outputs': ['large_tissue_mask'],
+            'params': {'kernel_size': 7}}})
+        config['outputs'].append('large_tissue_mask')
+        pipeline = PipelineRunner(
+            output_path=out_path, save_intermediate=True, **config)
+        self.assertEqual(
+            pipeline._plan('image'), ['compute', 'load', 'load', 'compute'])
+        output = pipeline.run(output_name='image', image_path=image_path)
+        self.assertEqual(
+            output['large_tissue_mask'].shape, expected['tissue_mask'].shape)
+
+    def test_pipeline_runner_run_batch(self):
+        """
+        Test that running several datapoints through the stages together gives the same outputs.
+        """
+        image_path = os.path.join(self.image_path, self.image_name)
+        out_path = os.path.join(self.out_path, 'run_batch')
+        os.makedirs(out_path)
+        config = self._load_config(
+            os.path.join(self.config_path, 'two_branches.yml'))
+        expected = PipelineRunner(**self._load_config(
+            os.path.join(self.config_path, 'two_branches.yml'))).run(
+            image_path=image_path)
+
+        pipeline = PipelineRunner(
+            output_path=out_path, save_intermediate=True, **config)
+        pipeline.run(output_name='image_0', image_path=image_path)
+        outputs = pipeline.run_batch(
+            [{'image_path': image_path}] * 3,
+            output_names=['image_0', 'image_1', 'image_2'])
+        self.assertEqual(len(outputs), 3)
+        for output in outputs:
+            for key, value in expected.items():
+                self.assertTrue(np.array_equal(output[key], value))
+        # the saved outputs of the first image are loaded, the others computed together
+        self.assertIsNone(pipeline.batch_stage_metrics[0][0])
+        self.assertEqual(pipeline.batch_stage_metrics[0][2]['cache'], 'hit')
+        self.assertEqual(
+            [m['batch_size'] for m in pipeline.batch_stage_metrics[1]], [2, 2, 2])
+
+        # the batch runner runs groups of rows together
+        metadata = self._build_metadata(5)
+        pipeline = BatchPipelineRunner(
+            save_path=None,
+            pipeline_config=self._load_config(
+                os.path.join(self.config_path, 'two_branches.yml')))
+        names = list()
+        for name, output in pipeline.iter_run(metadata, batch_rows=2):
+            names.append(name)
+            self.assertTrue(np.array_equal(output['superpixels'], expected['superpixels']))
+        self.assertEqual(names, list(metadata.index))
+        self.assertEqual(len(pipeline.metrics), 5 * 3)
+        outputs = pipeline.run(
+            metadata, cores=2, return_out=True, chunksize=2, batch_rows=2)
+        self.assertEqual(list(outputs.keys()), list(metadata.index))
+        for output in outputs.values():
+            self.assertTrue(np.array_equal(output['tissue_mask'], expected['tissue_mask']))
+
+    def test_pipeline_runner_does_not_copy_inputs(self):
+        """
+        Test that the stages get read-only views and that variables are freed after their last consumer.
+        """
+        image_path = os.path.join(self.image_path, self.image_name)
+        config = self._load_config(
+            os.path.join(self.config_path, 'two_branches.yml'))
+        config['stages'].append({'preprocessing': {
+            'class': 'SuperpixelCounter',
+            'inputs': ['superpixels'],
+            'outputs': ['nr_superpixels']}})
+        config['outputs'].append('nr_superpixels')
+        pipeline = PipelineRunner(**config)
+
+        seen = dict()
+        tissue_mask_stage, superpixel_stage, counter_stage = pipeline.stages[1:]
+
+        def process_tissue_mask(image):
+            seen['writeable'] = image.flags.writeable
+            seen['image'] = weakref.ref(image if image.base is None else image.base)
+            return type(tissue_mask_stage)._process(tissue_mask_stage, image)
+
+        def process_counter(superpixels):
+            # the image was freed after its last consumer
+            seen['image_freed'] = seen['image']() is None
+            return type(counter_stage)._process(counter_stage, superpixels)
+
+        tissue_mask_stage._process = process_tissue_mask
+        counter_stage._process = process_counter
+        output = pipeline.run(image_path=image_path)
+        self.assertFalse(seen['writeable'])
+        self.assertTrue(seen['image_freed'])
+        self.assertEqual(
+            set(output.keys()), {'tissue_mask', 'superpixels', 'nr_superpixels'})
+
+        # steps that mutate their inputs get copies
+        tissue_mask_stage._mutates_inputs = True
+        pipeline.run(image_path=image_path)
+        self.assertTrue(seen['writeable'])
+
+        # input arrays of the caller are never modified
+        image = np.full((64, 64, 3), 200, dtype=np.uint8)
+        GaussianTissueMask(kernel_size=5)._process(image)
+        self.assertTrue((image == 200).all())
+
+    def test_pipeline_runner_run_pipelined(self):
+        """
+        Test that pipelining the stages across datapoints gives the same outputs and propagates errors.
+        """
+        image_path = os.path.join(self.image_path, self.image_name)
+        expected = PipelineRunner(**self._load_config(
+            os.path.join(self.config_path, 'two_branches.yml'))).run(
+            image_path=image_path)
+
+        config = self._load_config(
+            os.path.join(self.config_path, 'two_branches.yml'))
+        list(config['stages'][-1].values())[0]['workers'] = 2
+        pipeline = PipelineRunner(**config)
+        self.assertEqual(pipeline.stage_workers, [1, 1, 2])
+        datapoints = [(f'image_{i}', {'image_path': image_path}) for i in range(5)]
+        names = list()
+        for name, output, metrics in pipeline.run_pipelined(
+                datapoints, queue_size=1, preserve_order=True):
+            names.append(name)
+            self.assertEqual(len(metrics), 3)
+            for key, value in expected.items():
+                self.assertTrue(np.array_equal(output[key], value))
+        self.assertEqual(names, [name for name, _ in datapoints])
+
+        # an error in a stage stops all the stages
+        datapoints[2] = ('image_2', {'image_path': 'missing.png'})
+        with self.assertRaises(Exception):
+            list(pipeline.run_pipelined(datapoints))
+
+        # the batch runner pipelines the rows
+        metadata = self._build_metadata(4)
+        pipeline = BatchPipelineRunner(
+            save_path=None,
+            pipeline_config=self._load_config(
+                os.path.join(self.config_path, 'two_branches.yml')))
+        outputs = pipeline.run(metadata, return_out=True, pipelined=True)
+        self.assertEqual(list(outputs.keys()), list(metadata.index))
+        self.assertEqual(len(pipeline.metrics), 4 * 3)
+        for output in outputs.values():
+            self.assertTrue(np.array_equal(output['tissue_mask'], expected['tissue_mask']))
+
+    def test_sweep_pipeline_runner(self):
+        """
+        Test that the variants of a sweep share their common stages and give the same outputs.
+        """
+        image_path = os.path.join(self.image_path, self.image_name)
+        out_path = os.path.join(self.out_path, 'sweep')
+        variants = dict()
+        for superpixel_size in [50, 100, 200]:
+            config = self._load_config(
+                os.path.join(self.config_path, 'two_branches.yml'))
+            list(config['stages'][-1].values())[0]['params']['superpixel_size'] = superpixel_size
+            variants[f'size_{superpixel_size}'] = config
+        expected = {
+            name: PipelineRunner(**deepcopy(config)).run(image_path=image_path)
+            for name, config in variants.items()
+        }
+
+        sweep = SweepPipelineRunner(variants, output_path=out_path)
+        # loader and tissue mask are shared by all the variants
+        self.assertEqual(sweep.nr_stages, 2 + 3)
+        self.assertIs(
+            sweep.runners['size_50'].stages[0], sweep.runners['size_200'].stages[0])
+        outputs = sweep.run(output_name='image_0', image_path=image_path)
+        self.assertEqual(list(outputs.keys()), list(variants.keys()))
+        for name, output in outputs.items():
+            for key, value in expected[name].items():
+                self.assertTrue(np.array_equal(output[key], value))
+        self.assertEqual(len(sweep.stage_metrics), 5)
+        self.assertEqual(
+            sweep.stage_metrics[0]['variants'], list(variants.keys()))
+        # every variant saves its outputs in its own directory
+        for name, runner in sweep.runners.items():
+            self.assertTrue(runner.final_path.startswith(os.path.join(out_path, name)))
+            self.assertTrue(os.path.isfile(os.path.join(runner.final_path, 'image_0.h5')))
+
+        names = [name for name, _ in sweep.iter_run(
+            [('image_0', {'image_path': image_path}), ('image_1', {'image_path': image_path})])]
+        self.assertEqual(names, ['image_0', 'image_1'])
+        # the saved outputs are loaded
+        sweep.run(output_name='image_0', image_path=image_path)
+        self.assertEqual(
+            [m['cache'] for m in sweep.stage_metrics[2:]], ['hit'] * 3)
+
+    def tearDown(self):
+        """Tear down the tests."""
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+"""Unit test for the storage codecs"""
+import unittest
+import numpy as np
+import yaml
+import os
+import shutil
+import h5py
+
+from histocartography import PipelineRunner
+from histocartography.preprocessing import GaussianTissueMask
+from histocartography.storage import STORAGE_CODECS, get_chunk_shape
+from histocartography.utils import download_test_data
+
+
+class StorageTestCase(unittest.TestCase):
+    """StorageTestCase class."""
+
+    @classmethod
+    def setUpClass(self):
+        self.current_path = os.path.dirname(__file__)
+        self.data_path = os.path.join(self.current_path, 'data')
+        download_test_data(self.data_path)
+        self.image_path = os.path.join(self.data_path, 'images')
+        self.image_name = '283_dcis_4.png'
+        self.config_path = os.path.join(self.current_path, 'config', 'pipeline')
+        self.out_path = os.path.join(self.data_path, 'storage_test')
+        if os.path.exists(self.out_path) and os.path.isdir(self.out_path):
+            shutil.rmtree(self.out_path)
+        os.makedirs(self.out_path)
+
+    def test_chunk_shape(self):
+        """
+        Test that the chunks fit the target size and follow the shape of the data.
+        """
+        chunk_shape = get_chunk_shape((4000, 3000), 4, chunk_size=1 << 20)
+        self.assertLessEqual(np.prod(chunk_shape) * 4, 1 << 20)
+        self.assertEqual(chunk_shape, (500, 375))
+        self.assertEqual(get_chunk_shape((100, 514), 4), (100, 514))
+        self.assertEqual(get_chunk_shape((0, 3), 4), (1, 3))
+
+    def test_codecs(self):
+        """
+        Test that all codecs store and load the same outputs.
+        """
+        instance_map = np.random.RandomState(0).randint(
+            0, 2000, size=(1000, 1200)).astype(np.uint16)
+        features = np.random.RandomState(0).rand(2000, 514).astype(np.float32)
+        for codec in STORAGE_CODECS:
+            out_path = os.path.join(self.out_path, codec)
+            os.makedirs(out_path)
+            step = GaussianTissueMask(save_path=out_path, storage=codec)
+            output_file_path = os.path.join(out_path, 'outputs.h5')
+            with h5py.File(output_file_path, 'w') as output_file:
+                step._set_outputs(output_file, (instance_map, features, 3))
+            with h5py.File(output_file_path, 'r') as input_file:
+                dataset = input_file['default_key_0']
+                self.assertEqual(
+                    dataset.compression,
+                    {'none': None, 'gzip': 'gzip', 'lzf': 'lzf', 'shuffle': 'lzf'}[codec])
+                self.assertEqual(dataset.shuffle, codec == 'shuffle')
+                loaded_instance_map, loaded_features, scalar = step._get_outputs(
+                    input_file)
+            self.assertTrue(np.array_equal(loaded_instance_map, instance_map))
+            self.assertTrue(np.array_equal(loaded_features, features))
+            self.assertEqual(scalar, 3)
+
+        step = GaussianTissueMask(storage={'codec': 'gzip', 'level': 1})
+        self.assertEqual(
+            step.storage.dataset_kwargs(features)['compression_opts'], 1)
+
+    def test_pipeline_storage(self):
+        """
+        Test that the storage of the pipeline is the default of the stages.
+        """
+        with open(os.path.join(self.config_path, 'two_branches.yml'), 'r') as file:
+            config = yaml.safe_load(file)
+        config['stages'][1]['preprocessing']['params']['storage'] = 'none'
+        pipeline = PipelineRunner(storage='lzf', **config)
+        self.assertEqual(
+            [stage.storage.codec for stage in pipeline.stages],
+            ['lzf', 'none', 'lzf'])
+
+    def tearDown(self):
+        """Tear down the tests."""
+
+
+if __name__ == "__main__":
+    unittest.main()
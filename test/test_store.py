@@ -0,0 +1,118 @@
+"""Unit test for the sharded store"""
+import unittest
+import multiprocessing
+import numpy as np
+import yaml
+import os
+import shutil
+import pandas as pd
+
+from histocartography import BatchPipelineRunner, PipelineRunner
+from histocartography.preprocessing import H5Loader
+from histocartography.store import ShardedStore
+from histocartography.utils import download_test_data
+
+
+def _append(args):
+    path, worker = args
+    store = ShardedStore(path)
+    for i in range(20):
+        store.put(f'{worker}_{i}', bytes([worker]) * (i + 1))
+
+
+class StoreTestCase(unittest.TestCase):
+    """StoreTestCase class."""
+
+    @classmethod
+    def setUpClass(self):
+        self.current_path = os.path.dirname(__file__)
+        self.data_path = os.path.join(self.current_path, 'data')
+        download_test_data(self.data_path)
+        self.image_path = os.path.join(self.data_path, 'images')
+        self.image_name = '283_dcis_4.png'
+        self.config_path = os.path.join(self.current_path, 'config', 'pipeline')
+        self.out_path = os.path.join(self.data_path, 'store_test')
+        if os.path.exists(self.out_path) and os.path.isdir(self.out_path):
+            shutil.rmtree(self.out_path)
+        os.makedirs(self.out_path)
+
+    def test_store(self):
+        """
+        Test reading, overwriting and shard rollover.
+        """
+        path = os.path.join(self.out_path, 'store')
+        store = ShardedStore(path, max_shard_size=10)
+        store.put('a', b'0123456789')
+        store.put('b', b'abc')
+        store.put('a', b'new')
+        self.assertEqual(len(list(store.path.glob('shard-*'))), 2)
+
+        reader = ShardedStore(path)
+        self.assertIn('b', reader)
+        self.assertNotIn('c', reader)
+        self.assertEqual(reader.get('a'), b'new')
+        self.assertEqual(reader.get('b'), b'abc')
+        self.assertEqual(reader.size('b'), 3)
+        self.assertEqual(sorted(reader.names()), ['a', 'b'])
+        with self.assertRaises(KeyError):
+            reader.get('c')
+
+        # entries appended after opening are found
+        store.put('c', b'c')
+        self.assertEqual(reader.get('c'), b'c')
+
+    def test_concurrent_appends(self):
+        """
+        Test that several processes can append to the same store.
+        """
+        path = os.path.join(self.out_path, 'concurrent')
+        with multiprocessing.Pool(4) as pool:
+            pool.map(_append, [(path, worker) for worker in range(4)])
+        store = ShardedStore(path)
+        self.assertEqual(len(store.names()), 4 * 20)
+        for worker in range(4):
+            for i in range(20):
+                self.assertEqual(
+                    store.get(f'{worker}_{i}'), bytes([worker]) * (i + 1))
+
+    def test_sharded_pipeline(self):
+        """
+        Test that a sharded pipeline writes a few files that the loaders read transparently.
+        """
+        with open(os.path.join(self.config_path, 'two_branches.yml'), 'r') as file:
+            config = yaml.safe_load(file)
+        out_path = os.path.join(self.out_path, 'pipeline')
+        os.makedirs(out_path)
+        metadata = pd.DataFrame(
+            {'image_path': [os.path.join(self.image_path, self.image_name)] * 6},
+            index=[f'image_{i}' for i in range(6)])
+
+        pipeline = BatchPipelineRunner(
+            pipeline_config=dict(config, sharded=True),
+            save_path=out_path,
+            save_intermediate=True)
+        pipeline.run(metadata, cores=2, chunksize=1)
+
+        runner = pipeline._build_pipeline_runner()
+        expected = PipelineRunner(**config).run(
+            image_path=os.path.join(self.image_path, self.image_name))
+        superpixel_dir = runner.stages[2].output_dir
+        self.assertEqual(list(superpixel_dir.glob('*.h5')), [])
+        self.assertLessEqual(len(list(superpixel_dir.glob('shard-*'))), 2)
+
+        loader = H5Loader()
+        for name in metadata.index:
+            superpixels = loader.process(superpixel_dir / f'{name}.h5')
+            self.assertTrue(np.array_equal(superpixels, expected['superpixels']))
+            output = runner.run(
+                output_name=name,
+                image_path=os.path.join(self.image_path, self.image_name))
+            self.assertEqual(runner._plan(name), ['skip', 'load', 'load'])
+            self.assertTrue(np.array_equal(output['tissue_mask'], expected['tissue_mask']))
+
+    def tearDown(self):
+        """Tear down the tests."""
+
+
+if __name__ == "__main__":
+    unittest.main()